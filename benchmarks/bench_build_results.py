@@ -0,0 +1,143 @@
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench_favorites_matrix import synthetic_post
+from interest_index import load_interests
+from post_scorer import PostScorer
+from tag_filters import EXCLUDE_WORDS
+from tag_vocabulary import FavoritesMatrix
+import wrapped_core
+
+
+# (favorites, tags in interests.json)
+SIZES = [(2000, 10000), (8000, 40000), (32000, 160000)]
+CATEGORIES = ["general", "species", "character", "artist", "copyright", "meta", "lore"]
+
+
+def legacy_user_profile(fav_matrix, global_interests):
+    """
+        build_user_profile before interests.json was compiled: a dict lookup and a walk of EXCLUDE_WORDS per tag
+    """
+    vocabulary = fav_matrix.vocabulary
+    min_percent = min(global_interests.values())
+    presence = fav_matrix.presence()
+    global_presence = np.array([global_interests.get(tag, min_percent) for tag in vocabulary.names])
+    relative_presence = presence / global_presence
+    cap = wrapped_core.RELATIVE_PRESENCE_CAP
+    enjoyment = 2 / (1 / (np.minimum(cap, relative_presence) / cap) + 1 / presence)
+
+    included = presence >= wrapped_core.MIN_PERCENT
+    for tag_id, tag in enumerate(vocabulary.names):
+        if any(word in tag for word in EXCLUDE_WORDS):
+            included[tag_id] = False
+
+    user_profile = {}
+    for tag_id in np.flatnonzero(included).tolist():
+        user_profile[vocabulary.names[tag_id]] = {
+            "presence": float(presence[tag_id]),
+            "relative_presence": float(relative_presence[tag_id]),
+            "enjoyment": float(enjoyment[tag_id])
+        }
+    return user_profile
+
+
+def legacy_build_results(fav_matrix, global_interests, tag_to_parent):
+    """
+        build_results before the selection stage: every list fully sorted, one scan of the sorted tags per category
+    """
+    user_profile = legacy_user_profile(fav_matrix, global_interests)
+    tags_by_enjoyment = sorted(user_profile.keys(), key=lambda tag: user_profile[tag]["enjoyment"], reverse=True)
+    sorted(user_profile.keys(), key=lambda tag: user_profile[tag]["presence"], reverse=True)
+
+    def scan(categories, use_parents, skip=[]):
+        kept = []
+        included_categories = {}
+        for tag in tags_by_enjoyment:
+            category, name = tag.split(":")[0], tag.split(":")[1]
+            if not category in categories or name in skip:
+                continue
+            if use_parents and name in tag_to_parent:
+                if tag_to_parent[name] in included_categories:
+                    continue
+                included_categories[tag_to_parent[name]] = True
+            kept.append(tag)
+        return kept
+
+    favorite_tag_categories = [
+        scan(["general", "lore"], True),
+        scan(["species"], True),
+        scan(["character"], False),
+        scan(["artist"], False, ["sound_warning", "conditional_dnp"])
+    ]
+
+    least_favorite_tags_dict = {}
+    for tag in global_interests:
+        if any(word in tag for word in EXCLUDE_WORDS):
+            continue
+        least_favorite_tags_dict[tag] = global_interests[tag] - (user_profile[tag]["presence"] if tag in user_profile else 0)
+    tags_by_least_favorite = sorted(least_favorite_tags_dict.keys(), key=lambda x: least_favorite_tags_dict[x], reverse=True)
+    least_favorite_tags = [tag for tag in tags_by_least_favorite if tag.split(":")[0] in ["general", "lore", "species"]]
+
+    weights = [1.0 / user_profile[favorites[0]]["enjoyment"] for favorites in favorite_tag_categories]
+    scorer = PostScorer(user_profile, weights, favorite_tag_categories, fav_matrix.vocabulary)
+    post_scores = {}
+    for row, score in enumerate(scorer.score_matrix(fav_matrix).tolist()):
+        if fav_matrix.file_exts[row] in wrapped_core.ALLOWED_FILE_TYPES:
+            post_scores[fav_matrix.post_ids[row]] = score
+    post_by_scores = sorted(post_scores.keys(), key=lambda post: post_scores[post], reverse=True)
+    return favorite_tag_categories, least_favorite_tags, post_by_scores
+
+
+def make_inputs(favorites, global_tags, rng):
+    fav_matrix = FavoritesMatrix()
+    fav_matrix.add_posts(synthetic_post(post_id, rng) for post_id in range(favorites))
+    # Every tag the favorites have, plus made up ones until interests.json is the right size
+    global_interests = {tag: rng.uniform(0.001, 0.2) for tag in fav_matrix.vocabulary.names}
+    while len(global_interests) < global_tags:
+        global_interests[f"{rng.choice(CATEGORIES)}:other_tag_{len(global_interests)}"] = rng.uniform(0.0001, 0.2)
+    tag_to_parent = {tag.split(":")[1]: f"parent_{i % 300}" for i, tag in enumerate(fav_matrix.vocabulary.names) if i % 3 == 0}
+    return fav_matrix, global_interests, tag_to_parent
+
+
+def best_of(fn, runs=3):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return result, min(times) * 1000
+
+
+if __name__ == "__main__":
+    rng = random.Random(621)
+    print(f"{'favorites':>9} | {'interests':>9} | {'load json (ms)':>14} | {'load index (ms)':>15} | {'legacy (ms)':>11} | {'build_results (ms)':>18} | same top {wrapped_core.TOP_LIST_SIZE}")
+    for favorites, global_tags in SIZES:
+        fav_matrix, interests, tag_to_parent = make_inputs(favorites, global_tags, rng)
+        with tempfile.TemporaryDirectory() as tmp:
+            interests_file = os.path.join(tmp, "interests.json")
+            with open(interests_file, "w") as f:
+                json.dump(interests, f)
+            load_interests(interests_file)
+
+            def load_json():
+                with open(interests_file, "r") as f:
+                    return json.load(f)
+            _, json_ms = best_of(load_json)
+            global_interests, index_ms = best_of(lambda: load_interests(interests_file))
+
+        (legacy_favorites, legacy_least, legacy_posts), legacy_ms = best_of(lambda: legacy_build_results(fav_matrix, interests, tag_to_parent))
+        results, ms = best_of(lambda: wrapped_core.build_results(fav_matrix, global_interests, tag_to_parent))
+
+        same = (
+            legacy_favorites == [results["favorite_tags"], results["favorite_species"], results["favorite_characters"], results["favorite_artists"]]
+            and legacy_least[:wrapped_core.TOP_LIST_SIZE] == results["least_favorite_tags"]
+            and legacy_posts[:wrapped_core.TOP_LIST_SIZE] == results["post_by_scores"]
+        )
+        print(f"{favorites:>9} | {global_tags:>9} | {json_ms:>14.1f} | {index_ms:>15.1f} | {legacy_ms:>11.1f} | {ms:>18.1f} | {same}")
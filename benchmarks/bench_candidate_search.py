@@ -0,0 +1,148 @@
+import asyncio
+from argparse import Namespace
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+UNIVERSE = 60000
+THEMES = 300
+FAVORITES = 1500
+PAGE_SIZE = 320
+PAGES = 25
+RUNS = 3
+USERS = [1, 2, 3, 4, 5]
+# Share of the universe a recommendation has to beat, so random pages find about 1% of their posts
+SCORE_PERCENTILE = 99
+
+
+def themed_posts(rng):
+    """
+        Posts grouped in themes, each with its own artists, characters and species (shared with a few other
+        themes) and some general tags, on top of general tags common to all of them. Close enough to how
+        e621 clusters for searches of a tag to be better than random pages
+    """
+    themes = []
+    for theme in range(THEMES):
+        themes.append({
+            "general": [f"theme_{theme}_tag_{i}" for i in range(12)],
+            "species": [f"species_{rng.randrange(THEMES // 2)}" for _ in range(3)],
+            "character": [f"character_{theme}_{i}" for i in range(4)],
+            "artist": [f"artist_{theme}_{i}" for i in range(3)]
+        })
+
+    posts = []
+    for post_id in range(1, UNIVERSE + 1):
+        theme = themes[int(rng.paretovariate(0.7)) % THEMES]
+        tags = {
+            "general": sorted({f"general_{int(rng.paretovariate(1.0)) % 2000}" for _ in range(20)} | set(rng.sample(theme["general"], 4))),
+            "species": sorted(set(rng.sample(theme["species"], rng.randint(1, 2)))),
+            "character": [rng.choice(theme["character"])] if rng.random() < 0.6 else [],
+            "artist": [rng.choice(theme["artist"])],
+            "copyright": [], "meta": [], "lore": [], "invalid": []
+        }
+        posts.append({"id": post_id, "tags": tags, "score": {"up": 10, "down": 0, "total": rng.randint(0, 500)}, "file": {"url": None, "ext": "png"}})
+    return posts
+
+
+class StandIn():
+    """
+        get_random_posts over a fixed universe of synthetic posts: every tag in the search has to be on the
+        post, and a page is PAGE_SIZE of the matching posts, picked at random. Counts requests
+    """
+    def __init__(self, posts, seed):
+        self.posts = posts
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.by_tag = {}
+        for i, post in enumerate(posts):
+            for tags in post["tags"].values():
+                for tag in tags:
+                    self.by_tag.setdefault(tag, set()).add(i)
+
+    def get_random_posts(self, min_upvotes, extra_tags):
+        self.requests += 1
+        matching = None
+        for tag in extra_tags.split():
+            matching = self.by_tag.get(tag, set()) if matching is None else matching & self.by_tag.get(tag, set())
+        pool = range(len(self.posts)) if matching is None else sorted(matching)
+        return [self.posts[i] for i in self.rng.sample(pool, min(PAGE_SIZE, len(pool)))]
+
+
+def make_user(posts, user, global_interests):
+    """
+        A user that mostly favorites posts of a few themes, and the profile e621_wrapped would make
+    """
+    from wrapped_core import build_results, make_profile
+    from tag_vocabulary import FavoritesMatrix
+
+    rng = random.Random(user)
+    liked = rng.sample(range(2, 40), 3)
+    matching = [post for post in posts if int(post["tags"]["artist"][0].split("_")[1]) in liked]
+    favs = rng.sample(matching, min(len(matching), FAVORITES * 4 // 5)) + rng.sample(posts, FAVORITES // 5)
+
+    fav_matrix = FavoritesMatrix()
+    fav_matrix.add_posts(favs)
+    results = build_results(fav_matrix, global_interests, {})
+    return liked, make_profile(results, fav_matrix.post_ids)
+
+
+def run(posts, profile, score, strategy, remember, seed):
+    """
+        RUNS runs of PAGES pages each, like running the recommender a few times in a row. Returns the
+        requests made and the different posts recommended over all of them
+    """
+    from e621_client import AsyncE621Client
+    from e621_recommendation_engine import recommend_posts
+
+    e621 = StandIn(posts, seed)
+    args = Namespace(pages=PAGES, score=score, min_upvotes=0, extra_tags=[], add_to_set="n", strategy=strategy)
+    recommended = set()
+    profile.seen_posts = []
+    for _ in range(RUNS):
+        if not remember:
+            profile.seen_posts = []
+        found = []
+        asyncio.run(recommend_posts(AsyncE621Client(e621), profile, args, set(), found, quiet=True))
+        recommended.update(post_id for post_id, _, _ in found)
+    return e621.requests, len(recommended)
+
+
+if __name__ == "__main__":
+    from interest_index import GlobalInterests
+    from post_scorer import PostScorer
+
+    posts = themed_posts(random.Random(621))
+    interests = {}
+    for post in posts:
+        for category, tags in post["tags"].items():
+            for tag in set(tags):
+                interests[f"{category}:{tag}"] = interests.get(f"{category}:{tag}", 0) + 1 / len(posts)
+    global_interests = GlobalInterests.from_dict(interests)
+
+    # random is what the recommender did before it had strategies: random pages, nothing remembered between runs
+    modes = [("random", "random", False), ("adaptive", "adaptive", True)]
+    print(f"{UNIVERSE} posts, {RUNS} runs of {PAGES} pages per user, a recommendation beats {SCORE_PERCENTILE}% of posts")
+    print(f"{'user':>4} | {'liked themes':>12} | " + " | ".join(f"{name:>9}" for name, _, _ in modes))
+    totals = {name: [0, 0] for name, _, _ in modes}
+    start = time.perf_counter()
+    for user in USERS:
+        liked, profile = make_user(posts, user, global_interests)
+        scores = PostScorer(profile.user_profile, profile.weights, profile.favorites).score_posts(posts)
+        score = float(np.percentile(scores, SCORE_PERCENTILE))
+
+        row = []
+        for name, strategy, remember in modes:
+            requests, recommended = run(posts, profile, score, strategy, remember, user)
+            totals[name][0] += requests
+            totals[name][1] += recommended
+            row.append(f"{recommended / requests:>9.2f}")
+        print(f"{user:>4} | {' '.join(map(str, liked)):>12} | " + " | ".join(row))
+
+    print(f"{'all':>4} | {'':>12} | " + " | ".join(f"{found / requests:>9.2f}" for requests, found in totals.values()))
+    print(f"(new posts recommended per request, {time.perf_counter() - start:.1f} s)")
@@ -0,0 +1,118 @@
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_helpers import synthetic_results
+from PIL import Image
+
+
+WORKERS = [1, 2, 4]
+
+
+def legacy_plot_tags(ax, tags, user_profile, override_enjoyment=None):
+    """
+        How each chart was plotted before: a new bar chart and new annotations every time
+    """
+    presence = []
+    relative_presence = []
+    enjoyment = []
+    new_tags = []
+    for tag in tags:
+        new_tags.append(str(tag).split(":")[-1])
+        if not override_enjoyment is None:
+            enjoyment.append(override_enjoyment[tag])
+            continue
+        presence.append(user_profile[tag]["presence"] if tag in user_profile else 0)
+        relative_presence.append(user_profile[tag]["relative_presence"] if tag in user_profile else -1)
+        enjoyment.append(user_profile[tag]["enjoyment"] if tag in user_profile else 0)
+
+    bars = ax.bar(new_tags, enjoyment, color='skyblue')
+    if override_enjoyment is None:
+        for idx, bar in enumerate(bars):
+            ax.text(bar.get_x() + bar.get_width() / 2, bar.get_height(), f"{presence[idx] * 100:.1f}%", ha='center', va='bottom', fontsize=8, rotation=45)
+            ax.text(bar.get_x() + bar.get_width() / 2, 0, f"{relative_presence[idx]:.1f}x", ha='center', va='bottom', fontsize=8, rotation=45)
+    ax.tick_params(axis='x', labelrotation=90)
+
+
+def legacy_plot_detailed(results, user_name, file):
+    """
+        plot_detailed before the figure was kept: a new pyplot figure, tight_layout and savefig for every report
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    user_profile = results["user_profile"]
+    favorites = [results["favorite_tags"], results["favorite_species"], results["favorite_characters"], results["favorite_artists"]]
+    titles = ["Favorite tags", "Favorite species", "Favorite characters", "Favorite artists"]
+    fig, axes = plt.subplots(2, 3, figsize=(20, 12))
+    for i in range(4):
+        ax = axes[int(i / 3)][i % 3]
+        legacy_plot_tags(ax, favorites[i][:25], user_profile)
+        ax.set_title(titles[i])
+        ax.set_ylabel("Enjoyment")
+
+    extras = [results["least_favorite_tags"], results["post_by_scores"]]
+    titles = ["Least favorite tags", "Your likes in one post"]
+    override_user_profile = [results["least_favorite_tags_dict"], results["post_scores"]]
+    ylabels = ["How much less present than the average", "Post score"]
+    for i in range(2):
+        ax = axes[int((i + 4) / 3)][(i + 4) % 3]
+        legacy_plot_tags(ax, extras[i][:25], user_profile, override_user_profile[i])
+        ax.set_title(titles[i])
+        ax.set_ylabel(ylabels[i])
+
+    fig.suptitle(f"{user_name}'s e621 Wrapped (detailed)")
+    fig.tight_layout()
+    fig.savefig(file)
+    plt.close(fig)
+
+
+def plot_reports(seeds, legacy):
+    """
+        Plots a report for each seed, back to back in this process. Returns the size of the last one
+    """
+    import e621_wrapped
+
+    body = None
+    for seed in seeds:
+        body = BytesIO()
+        results = synthetic_results(random.Random(seed))
+        if legacy:
+            legacy_plot_detailed(results, f"user_{seed}", body)
+        else:
+            e621_wrapped.get_detailed_renderer().render(results, f"user_{seed}", body)
+    return Image.open(BytesIO(body.getvalue())).size
+
+
+def per_report_ms(total, legacy):
+    # The first report also pays for importing matplotlib and loading its fonts, which only happens once
+    plot_reports([-1], legacy)
+    start = time.perf_counter()
+    size = plot_reports(range(total), legacy)
+    return (time.perf_counter() - start) / total * 1000, size
+
+
+if __name__ == "__main__":
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+    print(f"{total} detailed reports back to back")
+    print(f"{'plotter':>14} | {'per report (ms)':>15} | image size")
+    for legacy in [True, False]:
+        ms, size = per_report_ms(total, legacy)
+        print(f"{'new figure' if legacy else 'kept figure':>14} | {ms:>15.1f} | {size[0]}x{size[1]}")
+
+    # Like wrapped_batch.py: every worker process keeps its own figure
+    print(f"\n{total * 4} reports with the kept figure, spread over worker processes")
+    print(f"{'workers':>7} | {'reports per second':>18}")
+    for workers in WORKERS:
+        seeds = list(range(total * 4))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(plot_reports, [[-1]] * workers, [False] * workers))
+            start = time.perf_counter()
+            list(pool.map(plot_reports, [seeds[i::workers] for i in range(workers)], [False] * workers))
+        print(f"{workers:>7} | {len(seeds) / (time.perf_counter() - start):>18.2f}")
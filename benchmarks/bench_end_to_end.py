@@ -0,0 +1,279 @@
+from argparse import ArgumentParser
+import asyncio
+import csv
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_helpers import ROOT, peak_rss_mib
+from stand_in import StandIn, start_stand_in
+
+
+SIZES = [1000, 10000, 32000]
+PAGE_SIZE = 320
+# Written into the fixtures instead of the stand-in's address, which changes every run
+FIXTURE_URL = "http://fixtures.invalid"
+# Stages slower than the baseline by more than this fraction count as regressions
+TOLERANCE = 0.25
+# Stages this fast are too noisy to compare
+MIN_COMPARED_MS = 5.0
+
+
+def implication_tags(csv_path):
+    """
+        Every tag in the implications, so the synthetic favorites have tags that get pooled like real ones do
+    """
+    tags = {}
+    with open(csv_path, "r", encoding="utf-8", newline="") as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            if row["status"] == "active":
+                tags[row["antecedent_name"]] = True
+                tags[row["consequent_name"]] = True
+    return list(tags)
+
+
+def synthetic_post(post_id, rng, general_tags):
+    url = f"{FIXTURE_URL}/data/{post_id % 4}.jpg"
+    tags = {
+        "general": sorted({general_tags[int(rng.paretovariate(0.8)) % len(general_tags)] for _ in range(25)}),
+        "species": [f"species_{int(rng.paretovariate(1.0)) % 500}" for _ in range(2)],
+        "character": [f"character_{int(rng.paretovariate(0.6)) % 3000}"],
+        "artist": [f"artist_{int(rng.paretovariate(0.6)) % 3000}"],
+        "copyright": [f"copyright_{int(rng.paretovariate(1.0)) % 300}"],
+        "meta": ["hi_res"] if rng.random() < 0.7 else [],
+        "lore": [], "invalid": []
+    }
+    return {
+        "id": post_id,
+        "tags": tags,
+        "score": {"up": 10, "down": 0, "total": rng.randint(0, 500)},
+        "file": {"url": url, "ext": "jpg", "width": 1000, "height": 800},
+        "sample": {"has": True, "url": url, "width": 850, "height": 680},
+        "preview": {"url": url, "width": 150, "height": 120}
+    }
+
+
+def write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(data, f)
+
+
+def write_fixtures(fixtures_dir, sizes, csv_path):
+    """
+        Responses for every endpoint a Wrapped needs, as files: users/<id>.json, favorites/<user_id>/<page>.json,
+        posts/<id>.json, data/<image> and the interests.json they're compared to. Recorded responses can be
+        dropped in with the same layout
+    """
+    from PIL import Image
+
+    rng = random.Random(621)
+    general_tags = implication_tags(csv_path)
+    rng.shuffle(general_tags)
+
+    users = {}
+    for size in sizes:
+        user_id = size
+        users[str(size)] = user_id
+        write_json(os.path.join(fixtures_dir, "users", f"{user_id}.json"), {"id": user_id, "name": f"user_{user_id}", "avatar_id": 1, "favorite_count": size})
+        for page in range(size // PAGE_SIZE + 1):
+            amount = max(0, min(PAGE_SIZE, size - page * PAGE_SIZE))
+            posts = [synthetic_post(user_id * 100000 + page * PAGE_SIZE + i, rng, general_tags) for i in range(amount)]
+            write_json(os.path.join(fixtures_dir, "favorites", str(user_id), f"{page}.json"), {"posts": posts})
+    write_json(os.path.join(fixtures_dir, "posts", "1.json"), {"post": synthetic_post(1, rng, general_tags)})
+
+    # What the average user has, from posts like the ones favorited
+    counts = {}
+    sample = [synthetic_post(i, rng, general_tags) for i in range(3000)]
+    for post in sample:
+        for category, tags in post["tags"].items():
+            for tag in set(tags):
+                counts[f"{category}:{tag}"] = counts.get(f"{category}:{tag}", 0) + 1
+    write_json(os.path.join(fixtures_dir, "interests.json"), {tag: count / len(sample) for tag, count in counts.items()})
+
+    os.makedirs(os.path.join(fixtures_dir, "data"), exist_ok=True)
+    for i in range(4):
+        img = Image.radial_gradient("L").resize((1000, 800)).convert("RGB").rotate(90 * i)
+        img.save(os.path.join(fixtures_dir, "data", f"{i}.jpg"), format="JPEG", quality=90)
+    write_json(os.path.join(fixtures_dir, "fixtures.json"), {"users": users})
+
+
+def start_server(fixtures_dir, user_id):
+    """
+        Starts the stand-in for e621 with the fixtures of user_id: their user data and favorites (in the
+        order of the favorites pages), the posts in posts/ and the images in data/
+    """
+    start_stand_in()
+
+    def read(path):
+        with open(os.path.join(fixtures_dir, path), "rb") as f:
+            body = f.read()
+        return body.replace(FIXTURE_URL.encode("utf-8"), StandIn.base_url.encode("utf-8")) if path.endswith(".json") else body
+
+    StandIn.users[user_id] = json.loads(read(os.path.join("users", f"{user_id}.json")))
+    favorites_dir = os.path.join("favorites", str(user_id))
+    favorite_ids = []
+    for page in sorted(os.listdir(os.path.join(fixtures_dir, favorites_dir)), key=lambda name: int(name.split(".")[0])):
+        for post in json.loads(read(os.path.join(favorites_dir, page)))["posts"]:
+            StandIn.posts[post["id"]] = post
+            favorite_ids.append(post["id"])
+    StandIn.favorite_ids[user_id] = favorite_ids
+    for name in os.listdir(os.path.join(fixtures_dir, "posts")):
+        post = json.loads(read(os.path.join("posts", name)))["post"]
+        StandIn.posts[post["id"]] = post
+    for name in os.listdir(os.path.join(fixtures_dir, "data")):
+        StandIn.files[f"/data/{name}"] = read(os.path.join("data", name))
+    return StandIn.base_url
+
+
+def run_size(fixtures_dir, user_id, output_dir):
+    """
+        Runs in its own process, so the peak memory is only this size's. Every stage is timed on its own,
+        in the order e621_wrapped.py runs them
+    """
+    from e621_client import e621Client
+    from post_scorer import PostScorer
+    from rate_limiter import TokenBucketRateLimiter
+    from tag_implications import load_tag_implications
+    import e621_wrapped
+    import wrapped_core
+
+    stages = {}
+
+    def stage(name, fn):
+        start = time.perf_counter()
+        result = fn()
+        stages[name] = {"ms": (time.perf_counter() - start) * 1000, "peak_rss_mib": peak_rss_mib()}
+        return result
+
+    base_url = start_server(fixtures_dir, user_id)
+    e621 = e621Client("credentials.json", base_url=base_url, rate_limiter=TokenBucketRateLimiter(0.0))
+    user_data = e621.get_user(user_id)
+    user_name = user_data["name"]
+
+    global_interests = stage("load_interests", lambda: wrapped_core.load_global_interests(os.path.join(fixtures_dir, "interests.json")))
+    tag_to_parent = stage("load_implications", lambda: load_tag_implications(wrapped_core.TAG_IMPLICATIONS_FILE))
+    fav_matrix, _ = stage("fetch", lambda: asyncio.run(e621_wrapped.update_favorites(e621, user_id, user_name, 200, full=True, output_dir=output_dir, quiet=True, favorite_count=user_data.get("favorite_count"))))
+    stage("interests", fav_matrix.presence)
+    user_profile = stage("profile", lambda: wrapped_core.build_user_profile(fav_matrix, global_interests))
+    results = stage("results", lambda: wrapped_core.build_results(fav_matrix, global_interests, tag_to_parent))
+
+    def pooling():
+        general = [(tag, tag.split(":")[1]) for tag in user_profile if tag.split(":")[0] in ["general", "lore"]]
+        general.sort(key=lambda tag: user_profile[tag[0]]["enjoyment"], reverse=True)
+        return wrapped_core.first_of_each_parent(general, tag_to_parent)
+    stage("pooling", pooling)
+
+    def ranking():
+        favorites = [results["favorite_tags"], results["favorite_species"], results["favorite_characters"], results["favorite_artists"]]
+        scores = PostScorer(results["user_profile"], results["weights"], favorites, fav_matrix.vocabulary).score_matrix(fav_matrix)
+        return wrapped_core.top_indices(scores, wrapped_core.TOP_LIST_SIZE)
+    stage("ranking", ranking)
+
+    stage("save_profile", lambda: wrapped_core.save_profile(results, fav_matrix.post_ids, user_name, output_dir=output_dir))
+    fav_post, user_pfp, fav_post_id = stage("thumbnails", lambda: e621_wrapped.get_thumbnails(e621, results, user_data["avatar_id"]))
+    stage("render", lambda: e621_wrapped.render_wrapped(results, user_name, fav_post, user_pfp, output_dir, fav_post_id=fav_post_id))
+    stage("plot", lambda: e621_wrapped.plot_detailed(results, user_name, output_dir))
+
+    return {"favorites": len(fav_matrix), "requests": e621.latency_summary()["requests"], "stages": stages, "peak_rss_mib": peak_rss_mib()}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline, tolerance):
+    """
+        Returns every (size, stage, baseline ms, ms) that got slower than tolerance allows
+    """
+    regressions = []
+    for size, result in report["sizes"].items():
+        if not size in baseline["sizes"]:
+            continue
+        for name, timing in result["stages"].items():
+            before = baseline["sizes"][size]["stages"].get(name)
+            if before is None or before["ms"] < MIN_COMPARED_MS:
+                continue
+            if timing["ms"] > before["ms"] * (1 + tolerance):
+                regressions.append((size, name, before["ms"], timing["ms"]))
+    return regressions
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 5 and sys.argv[1] == "size":
+        # Child process: a single size
+        os.chdir(ROOT)
+        print(json.dumps(run_size(sys.argv[2], int(sys.argv[3]), sys.argv[4])))
+        sys.exit(0)
+
+    parser = ArgumentParser(description="Times every stage of making a Wrapped against a local stand-in for e621")
+    parser.add_argument("-s", "--sizes", default=SIZES, type=int, nargs="+", help="How many favorites each user has")
+    parser.add_argument("-f", "--fixtures", default=None, help="A folder to keep the fixtures in (and reuse them from), instead of a temporary one")
+    parser.add_argument("-o", "--output", default=None, help="Write the results as JSON to this file")
+    parser.add_argument("-c", "--compare", default=None, help="A previous JSON output. Exits with 1 if a stage got slower")
+    parser.add_argument("-t", "--tolerance", default=TOLERANCE, type=float, help="How much slower a stage may get before it counts as a regression")
+    args = parser.parse_args()
+
+    from tag_implications import TAG_IMPLICATIONS_FILE, build_index, load_tag_implications
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fixtures_dir = args.fixtures or os.path.join(tmp, "fixtures")
+        manifest = os.path.join(fixtures_dir, "fixtures.json")
+        users = {}
+        if os.path.exists(manifest):
+            with open(manifest, "r") as f:
+                users = json.load(f)["users"]
+        if any(not str(size) in users for size in args.sizes):
+            write_fixtures(fixtures_dir, args.sizes, os.path.join(ROOT, TAG_IMPLICATIONS_FILE))
+            with open(manifest, "r") as f:
+                users = json.load(f)["users"]
+
+        # Built once here (and timed), so every size only has to open them
+        os.chdir(ROOT)
+        start = time.perf_counter()
+        build_index()
+        index_ms = (time.perf_counter() - start) * 1000
+        load_tag_implications()
+        import wrapped_core
+        wrapped_core.load_global_interests(os.path.join(fixtures_dir, "interests.json"))
+
+        report = {
+            "commit": git_commit(),
+            "python": sys.version.split()[0],
+            "platform": sys.platform,
+            "implication_index_build_ms": index_ms,
+            "sizes": {}
+        }
+        for size in args.sizes:
+            output_dir = os.path.join(tmp, f"output_{size}")
+            os.makedirs(output_dir, exist_ok=True)
+            output = subprocess.run([sys.executable, __file__, "size", fixtures_dir, str(users[str(size)]), output_dir], capture_output=True, text=True, check=True).stdout
+            report["sizes"][str(size)] = json.loads(output.splitlines()[-1])
+
+    stage_names = list(next(iter(report["sizes"].values()))["stages"])
+    print(f"{'stage':>17} | " + " | ".join(f"{size + ' favs (ms)':>16}" for size in report["sizes"]))
+    for name in stage_names:
+        print(f"{name:>17} | " + " | ".join(f"{result['stages'][name]['ms']:>16.1f}" for result in report["sizes"].values()))
+    if os.name != "nt":
+        print(f"{'peak RSS (MiB)':>17} | " + " | ".join(f"{result['peak_rss_mib']:>16.1f}" for result in report["sizes"].values()))
+    print(f"(building the implication index from {TAG_IMPLICATIONS_FILE}: {index_ms:.0f} ms, only when it changes)")
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+
+    if args.compare is not None:
+        with open(args.compare, "r") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for size, name, before, after in regressions:
+            print(f"REGRESSION: {name} with {size} favorites took {after:.1f} ms, it took {before:.1f} ms before")
+        sys.exit(1 if len(regressions) > 0 else 0)
@@ -0,0 +1,81 @@
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tag_vocabulary import FavoritesMatrix
+
+
+CATEGORY_SIZES = {"general": 30, "species": 3, "character": 1, "artist": 1, "copyright": 1, "meta": 2, "lore": 0, "invalid": 0}
+
+
+def synthetic_post(post_id, rng):
+    tags = {}
+    for category, amount in CATEGORY_SIZES.items():
+        tags[category] = [f"{category}_tag_{int(rng.paretovariate(1.0)) % 5000}" for _ in range(amount)]
+    return {
+        "id": post_id,
+        "tags": tags,
+        "score": {"up": 10, "down": 0, "total": rng.randint(0, 500)},
+        "file": {"url": f"https://static1.e621.net/data/{post_id}.png", "ext": "png"},
+        "description": "x" * rng.randint(0, 400)
+    }
+
+
+def legacy_user_interests(favs):
+    user_interests = {}
+    for fav in favs:
+        for topic in fav["tags"]:
+            for tag in fav["tags"][topic]:
+                tag_name = f"{topic}:{tag}"
+                if not tag_name in user_interests:
+                    user_interests[tag_name] = 0
+                user_interests[tag_name] += 1
+
+    for tag in user_interests:
+        user_interests[tag] /= len(favs)
+
+    return user_interests
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+if __name__ == "__main__":
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 32000
+    rng = random.Random(621)
+    # Round trip through JSON so every post owns its strings, like API responses do
+    pages = [json.dumps([synthetic_post(page * 320 + i, rng) for i in range(320)]) for page in range(total // 320)]
+
+    def keep_dicts():
+        favs = []
+        for page in pages:
+            favs.extend(json.loads(page))
+        return favs
+
+    def keep_matrix():
+        fav_matrix = FavoritesMatrix()
+        for page in pages:
+            fav_matrix.add_posts(json.loads(page))
+        return fav_matrix
+
+    favs, dict_fetch_time, dict_memory = measure(keep_dicts)
+    _, dict_profile_time, _ = measure(lambda: legacy_user_interests(favs))
+    del favs
+
+    fav_matrix, matrix_fetch_time, matrix_memory = measure(keep_matrix)
+    _, matrix_profile_time, _ = measure(fav_matrix.presence)
+
+    print(f"{total} favorites")
+    print(f"post dicts:  {dict_memory / 2**20:8.1f} MiB peak, ingest {dict_fetch_time * 1000:8.1f} ms, presence {dict_profile_time * 1000:8.1f} ms")
+    print(f"CSR matrix:  {matrix_memory / 2**20:8.1f} MiB peak, ingest {matrix_fetch_time * 1000:8.1f} ms, presence {matrix_profile_time * 1000:8.1f} ms")
@@ -0,0 +1,42 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The stand-in for e621 lives with the tests, which use it too
+sys.path.insert(0, os.path.join(ROOT, "tests"))
+sys.path.insert(0, ROOT)
+
+if os.name != "nt":
+    import resource
+
+
+WORDS = ["big", "fluffy", "red", "tail", "smiling", "outside", "warhammer", "fantasy", "battle", "clothing"]
+
+
+def peak_rss_mib():
+    """
+        The most memory this process has used so far, or None on Windows, which doesn't tell
+    """
+    if os.name == "nt":
+        return None
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def synthetic_results(rng, size=25):
+    """
+        The parts of build_results that the Wrapped and the detailed report use, with size made up tags
+        in each list
+    """
+    results = {"user_profile": {}}
+    for category, key in [("general", "favorite_tags"), ("species", "favorite_species"), ("character", "favorite_characters"), ("artist", "favorite_artists"), ("lore", "least_favorite_tags")]:
+        results[key] = []
+        for i in range(size):
+            tag = f"{category}:{'_'.join(rng.choice(WORDS) for _ in range(rng.randint(1, 3)))}_{i}"
+            results["user_profile"][tag] = {"presence": rng.random(), "relative_presence": rng.random() * 200, "enjoyment": rng.random() / 20}
+            results[key].append(tag)
+    results["least_favorite_tags_dict"] = {tag: rng.random() / 20 for tag in results["least_favorite_tags"]}
+    results["post_by_scores"] = [rng.randrange(5_000_000) for _ in range(size)]
+    results["post_scores"] = {post_id: rng.random() * 15 for post_id in results["post_by_scores"]}
+    return results
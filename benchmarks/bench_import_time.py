@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Milliseconds each entry point may take to import (best of RUNS), and modules it must not import at all
+BUDGETS_MS = {
+    "e621_wrapped": 450,
+    "e621_recommendation_engine": 400,
+    "interest_generator": 400,
+    "wrapped_core": 200,
+}
+FORBIDDEN_MODULES = ["matplotlib", "PIL"]
+RUNS = 5
+
+
+def import_time(module):
+    """
+        Runs python -X importtime in a fresh process. Returns the cumulative import time of the module in
+        ms and every module it imported
+    """
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    ).stderr
+    imported = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        imported[name.strip()] = int(cumulative) / 1000
+    return imported[module], imported
+
+
+if __name__ == "__main__":
+    over_budget = False
+    print(f"{'entry point':>28} | {'import (ms)':>11} | {'budget (ms)':>11} | heavy modules imported")
+    for module, budget in BUDGETS_MS.items():
+        runs = [import_time(module) for _ in range(RUNS)]
+        best = min(ms for ms, _ in runs)
+        heavy = sorted({name for name in runs[0][1] if name.split(".")[0] in FORBIDDEN_MODULES and not "." in name})
+        ok = best <= budget and len(heavy) == 0
+        over_budget = over_budget or not ok
+        print(f"{module:>28} | {best:>11.1f} | {budget:>11} | {', '.join(heavy) if len(heavy) > 0 else '-'}{'' if ok else '  <- over budget'}")
+    sys.exit(1 if over_budget else 0)
@@ -0,0 +1,72 @@
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench_favorites_matrix import synthetic_post
+from profile_store import Profile, load_profile
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def synthetic_profile(total_tags, total_favorites, rng):
+    categories = ["general", "species", "character", "artist", "copyright", "meta"]
+    user_profile = {}
+    for i in range(total_tags):
+        presence = rng.random() * 0.5
+        relative_presence = rng.random() * 200
+        user_profile[f"{categories[i % len(categories)]}:tag_{i}"] = {
+            "presence": presence,
+            "relative_presence": relative_presence,
+            "enjoyment": 2 / (1 / (min(100, relative_presence) / 100) + 1 / presence)
+        }
+    tags = list(user_profile)
+    favorites = [[tag for tag in tags if tag.startswith(category)] for category in categories[:4]]
+    return Profile(user_profile, [1.0, 1.0, 1.0, 1.0], favorites, rng.sample(range(5_000_000), total_favorites))
+
+
+def best_of(fn, repeat=5):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+if __name__ == "__main__":
+    rng = random.Random(621)
+    profile = synthetic_profile(20000, 32000, rng)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, "profile.json")
+        npz_path = os.path.join(tmp, "profile.npz")
+
+        def save_json():
+            with open(json_path, "w") as f:
+                json.dump(profile.to_json(), f, indent=4)
+
+        def load_json():
+            with open(json_path, "r") as f:
+                json.load(f)
+
+        print("profile (20k tags, 32k favorites)")
+        print(f"  json save:                {best_of(save_json):8.1f} ms  {os.path.getsize(json_path) / 2**20:6.2f} MiB")
+        print(f"  npz save:                 {best_of(lambda: profile.save(npz_path)):8.1f} ms  {os.path.getsize(npz_path) / 2**20:6.2f} MiB")
+        print(f"  json load:                {best_of(load_json):8.1f} ms")
+        print(f"  npz load (favorite ids):  {best_of(lambda: load_profile(npz_path).fav_ids):8.1f} ms")
+        print(f"  npz load (scoring parts): {best_of(lambda: (lambda p: (p.user_profile, p.weights, p.favorites))(load_profile(npz_path))):8.1f} ms")
+
+    page = json.dumps([synthetic_post(i, rng) for i in range(320)]).encode("utf-8")
+    print(f"favorites page ({len(page) / 2**10:.0f} KiB)")
+    print(f"  json.loads:               {best_of(lambda: json.loads(page), 20):8.2f} ms")
+    if orjson is not None:
+        print(f"  orjson.loads:             {best_of(lambda: orjson.loads(page), 20):8.2f} ms")
+    else:
+        print("  orjson.loads:             not installed")
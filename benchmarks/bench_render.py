@@ -0,0 +1,42 @@
+from io import BytesIO
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from bench_helpers import synthetic_results
+from PIL import Image
+from wrapped_renderer import WrappedRenderer
+
+
+def run(total, shared, rng):
+    renderer = WrappedRenderer() if shared else None
+    fav_post = Image.new("RGB", (400, 400), (200, 0, 0))
+    user_pfp = Image.new("RGB", (300, 300), (0, 0, 200))
+    render_time = 0
+    encode_time = 0
+    for i in range(total):
+        results = synthetic_results(rng, 5)
+        start = time.perf_counter()
+        # Without a shared renderer the template and fonts are loaded again for every Wrapped, like before
+        wrapped = (renderer if shared else WrappedRenderer()).render(results, f"user_{i}", fav_post, user_pfp)
+        render_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        wrapped.save(BytesIO(), format="PNG")
+        encode_time += time.perf_counter() - start
+    return render_time / total * 1000, encode_time / total * 1000
+
+
+if __name__ == "__main__":
+    # The template and fonts are relative to the repository
+    os.chdir(ROOT)
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+
+    print(f"{total} Wrappeds back to back")
+    print(f"{'renderer':>10} | {'render (ms)':>12} | {'png encode (ms)':>16}")
+    for shared in [False, True]:
+        render_ms, encode_ms = run(total, shared, random.Random(621))
+        print(f"{'shared' if shared else 'per image':>10} | {render_ms:>12.1f} | {encode_ms:>16.1f}")
@@ -0,0 +1,96 @@
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_favorites_matrix import synthetic_post
+from bench_helpers import ROOT
+from stand_in import StandIn, average_interests, start_stand_in
+
+
+FAVORITES = 3000
+PAGE_SIZE = 320
+CONCURRENT_REQUESTS = 10
+
+
+def synthetic_tags(post_id):
+    return synthetic_post(post_id, random.Random(post_id))["tags"]
+
+
+async def call(app, path):
+    """
+        Sends a GET to the ASGI app, the way a server would. Returns the status and the body
+    """
+    path, _, query = path.partition("?")
+    scope = {"type": "http", "method": "GET", "path": path, "query_string": query.encode("utf-8"), "headers": []}
+    response = {}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        else:
+            response["body"] = message["body"]
+
+    await app(scope, receive, send)
+    return response["status"], response["body"]
+
+
+async def timed(app, path):
+    start = time.perf_counter()
+    status, body = await call(app, path)
+    if status != 200:
+        raise RuntimeError(f"{path} returned {status}: {body[:200]}")
+    return (time.perf_counter() - start) * 1000
+
+
+async def main(base_url, tmp):
+    from e621_client import e621Client
+    from rate_limiter import TokenBucketRateLimiter
+    import wrapped_service
+
+    # Every user has FAVORITES favorites, with tags like the other benchmarks' posts
+    StandIn.reset()
+    StandIn.make_tags = staticmethod(synthetic_tags)
+    StandIn.default_favorites = FAVORITES
+    interests_file = os.path.join(tmp, "interests.json")
+    with open(interests_file, "w") as f:
+        json.dump(average_interests(), f)
+
+    start = time.perf_counter()
+    e621 = e621Client("credentials.json", base_url=base_url, rate_limiter=TokenBucketRateLimiter(0.0))
+    service = wrapped_service.WrappedService(e621, data_dir=os.path.join(tmp, "service"), interests_file=interests_file)
+    app = wrapped_service.create_app(service)
+    print(f"  service startup:              {(time.perf_counter() - start) * 1000:8.1f} ms (once per deploy)")
+
+    print(f"  wrapped, new user:            {await timed(app, '/users/1/wrapped.png'):8.1f} ms")
+    print(f"  wrapped, same user again:     {await timed(app, '/users/1/wrapped.png'):8.1f} ms")
+    print(f"  detailed, same user:          {await timed(app, '/users/1/detailed.png'):8.1f} ms")
+    print(f"  recommendations (1 page):     {await timed(app, '/users/1/recommendations?pages=1&score=0'):8.1f} ms")
+
+    StandIn.hits.clear()
+    start = time.perf_counter()
+    await asyncio.gather(*(call(app, "/users/2/wrapped.png") for _ in range(CONCURRENT_REQUESTS)))
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"  {CONCURRENT_REQUESTS} concurrent, new user:     {elapsed:8.1f} ms, {StandIn.hits.get('/favorites.json', 0) + StandIn.hits.get('/posts.json fav', 0)} favorites requests (one user needs {FAVORITES // PAGE_SIZE + 1})")
+
+
+if __name__ == "__main__":
+    # The template and fonts are relative to the repository
+    os.chdir(ROOT)
+
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import e621_wrapped"], check=True)
+    print(f"cold process, imports only:     {(time.perf_counter() - start) * 1000:8.1f} ms (once per request without the service)")
+
+    print(f"service ({FAVORITES} favorites per user, local stand-in for e621)")
+    with tempfile.TemporaryDirectory() as tmp:
+        start_stand_in()
+        asyncio.run(main(StandIn.base_url, tmp))
@@ -0,0 +1,93 @@
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench_favorites_matrix import legacy_user_interests, synthetic_post
+from bench_helpers import peak_rss_mib
+
+
+PAGE_SIZE = 320
+
+
+def fetch_pages(total, seed=621):
+    """
+        Stands in for the favorites endpoint: every page is decoded from JSON, like a response would be
+    """
+    rng = random.Random(seed)
+    for page in range(math.ceil(total / PAGE_SIZE)):
+        amount = min(PAGE_SIZE, total - page * PAGE_SIZE)
+        yield json.loads(json.dumps([synthetic_post(page * PAGE_SIZE + i, rng) for i in range(amount)]))
+
+
+def synthetic_profile(presence_by_tag):
+    """
+        A profile shaped like the real one (top tags per category), enough to exercise scoring
+    """
+    user_profile = {tag: {"presence": presence, "relative_presence": 1.0, "enjoyment": presence} for tag, presence in presence_by_tag.items()}
+    by_enjoyment = sorted(user_profile, key=lambda tag: user_profile[tag]["enjoyment"], reverse=True)
+    favorite_tag_categories = [
+        [tag for tag in by_enjoyment if tag.split(":")[0] == category][:100]
+        for category in ["general", "species", "character", "artist"]
+    ]
+    weights = [1.0 / user_profile[favorites[0]]["enjoyment"] for favorites in favorite_tag_categories]
+    return user_profile, weights, favorite_tag_categories
+
+
+def legacy_post_score(post, user_profile, weights, favorite_tag_categories):
+    score = 0
+    post["clean_tags"] = []
+    for topic in post["tags"]:
+        for tag in post["tags"][topic]:
+            post["clean_tags"].append(f"{topic}:{tag}")
+    for i, favorites in enumerate(favorite_tag_categories):
+        for tag in favorites:
+            if tag in post["clean_tags"]:
+                score += weights[i] * user_profile[tag]["enjoyment"]
+    return score / math.pow(len(post["clean_tags"]), 0.2) * (math.pow(post["score"]["total"], 0.1) if post["score"]["total"] > 0 else 0)
+
+
+def run_dicts(total):
+    favs = []
+    for page in fetch_pages(total):
+        favs.extend(page)
+    profile = synthetic_profile(legacy_user_interests(favs))
+    return [legacy_post_score(fav, *profile) for fav in favs]
+
+
+def run_streaming(total):
+    from post_scorer import PostScorer
+    from tag_vocabulary import FavoritesMatrix
+
+    fav_matrix = FavoritesMatrix()
+    for page in fetch_pages(total):
+        fav_matrix.add_posts(page)
+    presence = dict(zip(fav_matrix.vocabulary.names, fav_matrix.presence().tolist()))
+    scorer = PostScorer(*synthetic_profile(presence), fav_matrix.vocabulary)
+    return scorer.score_matrix(fav_matrix)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3:
+        # Child process: measure a single mode so each one gets its own peak RSS
+        import numpy
+        baseline = peak_rss_mib()
+        start = time.perf_counter()
+        {"dicts": run_dicts, "streaming": run_streaming}[sys.argv[1]](int(sys.argv[2]))
+        print(json.dumps({"seconds": time.perf_counter() - start, "peak_rss_mib": peak_rss_mib() - baseline}))
+        sys.exit(0)
+
+    if os.name == "nt":
+        print("This benchmark needs the resource module, which isn't available on Windows")
+        sys.exit(1)
+
+    print(f"{'favorites':>10} | {'mode':>10} | {'peak RSS (MiB)':>15} | {'time (s)':>9}")
+    for total in [1000, 10000, 32000]:
+        for mode in ["dicts", "streaming"]:
+            output = subprocess.run([sys.executable, __file__, mode, str(total)], capture_output=True, text=True, check=True).stdout
+            result = json.loads(output)
+            print(f"{total:>10} | {mode:>10} | {result['peak_rss_mib']:>15.1f} | {result['seconds']:>9.2f}")
@@ -0,0 +1,55 @@
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tag_filters import EXCLUDE_WORDS, TagFilter
+
+
+TAGS = 160000
+WORD_COUNTS = [3, 30, 300]
+CATEGORIES = ["general", "species", "character", "artist", "copyright", "meta", "lore"]
+
+
+def random_word(rng, length):
+    return "".join(rng.choice(string.ascii_lowercase + "_") for _ in range(length))
+
+
+def legacy_mask(tags, exclude_words):
+    """
+        How the exclusion words were checked before: every word against every tag
+    """
+    mask = []
+    for tag in tags:
+        excluded = False
+        for word in exclude_words:
+            if word in tag:
+                excluded = True
+                break
+        mask.append(excluded)
+    return mask
+
+
+def best_of(fn, runs=3):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return result, min(times) * 1000
+
+
+if __name__ == "__main__":
+    rng = random.Random(621)
+    tags = [f"{rng.choice(CATEGORIES)}:{random_word(rng, rng.randint(4, 20))}" for _ in range(TAGS)]
+
+    print(f"{TAGS} tags, like a full interests.json")
+    print(f"{'words':>5} | {'word loop (ms)':>14} | {'TagFilter (ms)':>14} | {'excluded':>8} | same")
+    for count in WORD_COUNTS:
+        words = EXCLUDE_WORDS + [random_word(rng, rng.randint(4, 8)) for _ in range(count - len(EXCLUDE_WORDS))]
+        legacy, legacy_ms = best_of(lambda: legacy_mask(tags, words))
+        tag_filter, compile_ms = best_of(lambda: TagFilter(words))
+        mask, ms = best_of(lambda: tag_filter.mask(tags))
+        print(f"{count:>5} | {legacy_ms:>14.1f} | {ms + compile_ms:>14.1f} | {int(mask.sum()):>8} | {mask.tolist() == legacy}")
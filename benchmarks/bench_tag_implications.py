@@ -0,0 +1,85 @@
+import csv
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tag_implications import TAG_IMPLICATIONS_FILE, build_index, load_tag_implications
+
+
+def legacy_tag_to_parent(csv_path):
+    """
+        The fixpoint loop e621_wrapped.py used to run on every start, kept as the reference
+    """
+    with open(csv_path, 'r', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+
+        implication_dict = {}
+        for row in reader:
+            if row["status"] == "active":
+                if not row["consequent_name"] in implication_dict:
+                    implication_dict[row["consequent_name"]] = []
+                implication_dict[row["consequent_name"]].append(row["antecedent_name"])
+
+    changed = True
+    while changed:
+        changed = False
+
+        to_change = {}
+        for tag in implication_dict:
+            for implicator_tag in implication_dict[tag]:
+                if implicator_tag in implication_dict:
+                    to_change[implicator_tag] = tag
+
+        if len(to_change) > 0:
+            changed = True
+
+        for tag in to_change:
+            for implicator_tag in implication_dict[tag]:
+                if not implicator_tag in implication_dict[to_change[tag]]:
+                    implication_dict[to_change[tag]].append(implicator_tag)
+            implication_dict[tag] = []
+
+        to_delete = []
+        for tag in implication_dict:
+            if len(implication_dict[tag]) == 0:
+                to_delete.append(tag)
+        for tag in to_delete:
+            del implication_dict[tag]
+
+    tag_to_parent = {}
+    for tag in implication_dict:
+        tag_to_parent[tag] = tag
+        for implicator_tag in implication_dict[tag]:
+            tag_to_parent[implicator_tag] = tag
+    return tag_to_parent
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else TAG_IMPLICATIONS_FILE
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index_path = os.path.join(tmp, "tag_implications.idx")
+
+        legacy, legacy_time = timed(legacy_tag_to_parent, csv_path)
+        _, build_time = timed(build_index, csv_path, index_path)
+        index, load_time = timed(load_tag_implications, csv_path, index_path)
+
+        tags = list(legacy)
+        start = time.perf_counter()
+        matches = sum(1 for tag in tags if index.get(tag) == legacy[tag])
+        lookup_time = time.perf_counter() - start
+
+        print(f"legacy fixpoint:     {legacy_time * 1000:9.1f} ms")
+        print(f"index build (once):  {build_time * 1000:9.1f} ms")
+        print(f"index load:          {load_time * 1000:9.1f} ms")
+        print(f"lookups:             {lookup_time / len(tags) * 1e6:9.2f} us/tag")
+        print(f"tags:                {len(index)} indexed, {len(legacy)} legacy")
+        print(f"agreement:           {matches / len(tags) * 100:9.2f} %")
@@ -0,0 +1,108 @@
+from io import BytesIO
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_helpers import peak_rss_mib
+from PIL import Image
+from stand_in import StandIn, start_stand_in
+
+
+# A big original, like most recent uploads, and the renditions e621 makes of it
+RENDITIONS = {"file": (4000, 3000), "sample": (850, 638), "preview": (150, 113)}
+SIDE = 400
+TIMES = 5
+
+
+def make_image(size):
+    # A gradient with some noise, so it compresses about as well as a drawing
+    img = Image.radial_gradient("L").resize(size).convert("RGB")
+    img = Image.blend(img, Image.effect_noise(size, 64).convert("RGB"), 0.3)
+    body = BytesIO()
+    img.save(body, format="JPEG", quality=90)
+    return body.getvalue()
+
+
+def start_server(images_dir):
+    """
+        Serves post 1 with its renditions from images_dir. Returns the stand-in's address and the post
+    """
+    start_stand_in()
+    post = {"id": 1}
+    for name, size in RENDITIONS.items():
+        path = f"/data/{name}/1.jpg"
+        with open(os.path.join(images_dir, f"{name}.jpg"), "rb") as f:
+            StandIn.files[path] = f.read()
+        post[name] = {"width": size[0], "height": size[1], "ext": "jpg", "url": StandIn.base_url + path}
+    post["sample"]["has"] = True
+    StandIn.posts[1] = post
+    return StandIn.base_url, post
+
+
+def legacy_thumb(e621, post_id, side):
+    """
+        get_post_thumb before it picked renditions: always the original file, fully decoded
+    """
+    data = e621.request("GET", f"{e621.base_url}/posts/{post_id}.json").json()
+    response = e621.request("GET", data["post"]["file"]["url"])
+    img = Image.open(BytesIO(response.content))
+    l = int(min(img.size[0], img.size[1]) / 2)
+    xc = int(img.size[0] / 2)
+    yc = int(img.size[1] / 2)
+    img = img.crop((xc - l, yc - l, xc + l, yc + l))
+    return img.resize((side, side))
+
+
+def run(mode, images_dir):
+    from e621_client import e621Client
+    from rate_limiter import TokenBucketRateLimiter
+
+    base_url, post = start_server(images_dir)
+    e621 = e621Client("credentials.json", base_url=base_url, rate_limiter=TokenBucketRateLimiter(0.0))
+    fetch = {
+        "legacy": lambda: legacy_thumb(e621, 1, SIDE),
+        "by id": lambda: e621.get_post_thumb(1, SIDE),
+        "post dict": lambda: e621.get_post_thumb(post, SIDE)
+    }[mode]
+
+    baseline = peak_rss_mib()
+    start = time.perf_counter()
+    for _ in range(TIMES):
+        fetch()
+    return {
+        "ms": (time.perf_counter() - start) / TIMES * 1000,
+        "kib": StandIn.sent / TIMES / 2**10,
+        "requests": e621.latency_summary()["requests"] / TIMES,
+        "peak_rss_mib": peak_rss_mib() - baseline
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "prepare":
+        # Child process, since the peak RSS of making the big image would carry over to the modes
+        for name, size in RENDITIONS.items():
+            with open(os.path.join(sys.argv[2], f"{name}.jpg"), "wb") as f:
+                f.write(make_image(size))
+        sys.exit(0)
+    if len(sys.argv) == 3:
+        # Child process: a single mode, so each one gets its own peak RSS
+        print(json.dumps(run(sys.argv[1], sys.argv[2])))
+        sys.exit(0)
+
+    if os.name == "nt":
+        print("This benchmark needs the resource module, which isn't available on Windows")
+        sys.exit(1)
+
+    print(f"{SIDE}x{SIDE} thumbnail of a {RENDITIONS['file'][0]}x{RENDITIONS['file'][1]} post, local server")
+    print(f"{'mode':>10} | {'requests':>8} | {'downloaded (KiB)':>16} | {'time (ms)':>9} | {'peak RSS (MiB)':>15}")
+    with tempfile.TemporaryDirectory() as images_dir:
+        subprocess.run([sys.executable, __file__, "prepare", images_dir], check=True)
+
+        for mode in ["legacy", "by id", "post dict"]:
+            output = subprocess.run([sys.executable, __file__, mode, images_dir], capture_output=True, text=True, check=True).stdout
+            result = json.loads(output.splitlines()[-1])
+            print(f"{mode:>10} | {result['requests']:>8.0f} | {result['kib']:>16.0f} | {result['ms']:>9.1f} | {result['peak_rss_mib']:>15.1f}")
@@ -0,0 +1,82 @@
+import threading
+import numpy as np
+
+
+# How many of the top favorites of each category (tags, species, characters, artists) get their own search
+QUERY_TAGS_PER_CATEGORY = [4, 2, 2, 2]
+PAGE_SIZE = 320
+
+
+def build_queries(favorites, extra_tags=(), per_category=QUERY_TAGS_PER_CATEGORY):
+    """
+        The searches to spread the pages between: the plain random one, plus one for each of the top
+        favorite tags of every category. extra_tags are added to all of them. Tags are separated by
+        spaces, and only escaped when the search is sent
+    """
+    queries = [" ".join(extra_tags)]
+    for category_favorites, amount in zip(favorites, per_category):
+        for tag in category_favorites[:amount]:
+            queries.append(" ".join([tag.split(":", 1)[1]] + list(extra_tags)))
+    return list(dict.fromkeys(queries))
+
+
+class SeenPosts():
+    """
+        Sorted array of the ids of every post that was already looked at, so a whole page can be checked
+        at once. It's kept in the profile, so posts aren't looked at again on the next run either
+    """
+    def __init__(self, ids=None):
+        self.ids = np.unique(np.asarray(ids if ids is not None else [], dtype=np.int64))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def contains(self, ids):
+        """
+            Returns a bool array: whether each of ids was seen
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        idx = np.minimum(np.searchsorted(self.ids, ids), max(len(self.ids) - 1, 0))
+        return (self.ids[idx] == ids) if len(self.ids) > 0 else np.zeros(len(ids), dtype=bool)
+
+    def add(self, ids):
+        self.ids = np.union1d(self.ids, np.asarray(ids, dtype=np.int64))
+
+
+class QueryBandit():
+    """
+        Decides which search gets the next page. Every search keeps how many of the posts it returned were
+        recommended, and the next page goes to the one with the best sampled yield per request (Thompson
+        sampling), so searches that keep returning good posts get most pages while the others are still
+        tried every now and then
+    """
+    def __init__(self, queries, seed=None):
+        self.queries = queries
+        self.requests = np.zeros(len(queries), dtype=np.int64)
+        self.posts = np.zeros(len(queries), dtype=np.int64)
+        self.found = np.zeros(len(queries), dtype=np.int64)
+        self.rng = np.random.default_rng(seed)
+        self.lock = threading.Lock()
+
+    def choose(self):
+        """
+            Returns the index of the search the next page should come from
+        """
+        with self.lock:
+            # Chance of a post being recommended, times how many posts a page of that search brings
+            rates = self.rng.beta(self.found + 1, self.posts - self.found + 1)
+            page_sizes = np.where(self.requests > 0, self.posts / np.maximum(self.requests, 1), PAGE_SIZE)
+            return int(np.argmax(rates * page_sizes))
+
+    def update(self, query, posts, found):
+        with self.lock:
+            self.requests[query] += 1
+            self.posts[query] += posts
+            self.found[query] += found
+
+    def summary(self):
+        """
+            (query, requests, recommendations) for every search that got at least one page, best first
+        """
+        order = np.argsort(-self.found, kind="stable")
+        return [(self.queries[i], int(self.requests[i]), int(self.found[i])) for i in order.tolist() if self.requests[i] > 0]
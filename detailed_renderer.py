@@ -0,0 +1,108 @@
+import threading
+from matplotlib.figure import Figure
+
+
+DETAILED_SIZE = (20, 12)
+# Bars in each chart
+BARS = 25
+# Longer tag names are cut, so they always fit in the space the layout leaves for them
+LABEL_MAX_CHARS = 24
+# What tight_layout picks for tag names of LABEL_MAX_CHARS characters. The layout is fixed, so nothing
+# has to be measured for each report
+LAYOUT = {"left": 0.046, "right": 0.9925, "bottom": 0.185, "top": 0.941, "wspace": 0.163, "hspace": 0.735}
+# (title, y label, whether the bars are enjoyment and get their presence written on them)
+CHARTS = [
+    ("Favorite tags", "Enjoyment", True),
+    ("Favorite species", "Enjoyment", True),
+    ("Favorite characters", "Enjoyment", True),
+    ("Favorite artists", "Enjoyment", True),
+    ("Least favorite tags", "How much less present than the average", False),
+    ("Your likes in one post", "Post score", False),
+]
+
+
+def short_label(tag):
+    name = str(tag).split(":")[-1]
+    return name if len(name) <= LABEL_MAX_CHARS else name[:LABEL_MAX_CHARS - 1] + "…"
+
+
+def set_limits(ax, heights):
+    """
+        The limits autoscaling would give a bar chart of heights (5% margins, none below 0), without
+        measuring every bar
+    """
+    if len(heights) == 0:
+        return
+    left, right = -0.4, len(heights) - 0.6
+    ax.set_xlim(left - 0.05 * (right - left), right + 0.05 * (right - left))
+    bottom, top = min(0, min(heights)), max(0, max(heights))
+    margin = 0.05 * (top - bottom) if top > bottom else 0.001
+    ax.set_ylim(bottom if bottom == 0 else bottom - margin, top if top == 0 else top + margin)
+
+
+class DetailedRenderer():
+    """
+        Plots detailed reports on one figure that's built once: the axes, bars and labels of every chart
+        are updated in place for each report instead of being created again, and the layout is fixed, so
+        a report only pays for drawing and saving. A renderer draws one report at a time
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        # A bare Figure instead of pyplot, so nothing global is kept around between reports or threads
+        self.figure = Figure(figsize=DETAILED_SIZE)
+        self.figure.subplots_adjust(**LAYOUT)
+        self.charts = []
+        for ax, (title, ylabel, annotated) in zip(self.figure.subplots(2, 3).flat, CHARTS):
+            ax.set_title(title)
+            ax.set_ylabel(ylabel)
+            ax.tick_params(axis="x", labelrotation=90)
+            bars = ax.bar(range(BARS), [0] * BARS, color="skyblue")
+            # Presence on top of each bar and relative presence at its bottom
+            presence = [ax.text(idx, 0, "", ha="center", va="bottom", fontsize=8, rotation=45) for idx in range(BARS)] if annotated else []
+            relative_presence = [ax.text(idx, 0, "", ha="center", va="bottom", fontsize=8, rotation=45) for idx in range(BARS)] if annotated else []
+            self.charts.append((ax, bars, presence, relative_presence))
+
+    def update_chart(self, chart, tags, user_profile, override_enjoyment=None):
+        """
+            Shows the tags in a chart, with their enjoyment (or override_enjoyment) as the height of the bars
+        """
+        ax, bars, presence, relative_presence = chart
+        tags = tags[:BARS]
+        heights = []
+        for idx, tag in enumerate(tags):
+            if override_enjoyment is not None:
+                heights.append(override_enjoyment[tag])
+                continue
+            profile = user_profile.get(tag)
+            heights.append(profile["enjoyment"] if profile is not None else 0)
+            presence[idx].set_text(f"{profile['presence'] * 100 if profile is not None else 0:.1f}%")
+            presence[idx].set_y(heights[-1])
+            relative_presence[idx].set_text(f"{profile['relative_presence'] if profile is not None else -1:.1f}x")
+
+        for idx, bar in enumerate(bars):
+            bar.set_visible(idx < len(tags))
+            if idx < len(tags):
+                bar.set_height(heights[idx])
+        for text in presence + relative_presence:
+            text.set_visible(text.get_position()[0] < len(tags))
+        ax.set_xticks(range(len(tags)), [short_label(tag) for tag in tags])
+        set_limits(ax, heights)
+
+    def render(self, results, user_name, file):
+        """
+            Plots the top 25 of every list and saves the report as PNG to file, a path or a file object
+        """
+        user_profile = results["user_profile"]
+        lists = [
+            (results["favorite_tags"], None),
+            (results["favorite_species"], None),
+            (results["favorite_characters"], None),
+            (results["favorite_artists"], None),
+            (results["least_favorite_tags"], results["least_favorite_tags_dict"]),
+            (results["post_by_scores"], results["post_scores"]),
+        ]
+        with self.lock:
+            for chart, (tags, override_enjoyment) in zip(self.charts, lists):
+                self.update_chart(chart, tags, user_profile, override_enjoyment)
+            self.figure.suptitle(f"{user_name}'s e621 Wrapped (detailed)")
+            self.figure.savefig(file, format="png")
@@ -1,13 +1,106 @@
+import asyncio
+from collections import deque
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from rate_limiter import RATE_LIMITED_STATUSES, SharedRateLimiter, parse_retry_after
+from response_cache import CachedResponse, credential_identity
 import json
 import time
-from PIL import Image
 from io import BytesIO
 import os
+from urllib.parse import quote
+
+
+try:
+    # Optional, but decodes API responses several times faster
+    import orjson
+    decode_json = orjson.loads
+except ImportError:
+    decode_json = json.loads
+
+
+BASE_URL = "https://e621.net"
+POOL_SIZE = 4
+# (connect, read) timeouts in seconds
+TIMEOUT = (5, 30)
+RETRIES = 3
+RETRY_BACKOFF = 0.5
+# 429 and 503 are left to the rate limiter, which slows every client down instead of just retrying
+RETRY_STATUSES = [500, 502, 504]
+# Only these are sent again after a server error, since sending them twice changes nothing
+RETRY_METHODS = ["GET", "HEAD"]
+RATE_LIMIT_RETRIES = 3
+# Images are downloaded in chunks of this size, and given up on past the limit
+THUMB_CHUNK_SIZE = 64 * 2**10
+THUMB_MAX_BYTES = 64 * 2**20
+# Post files we can decode. Anything else (videos, flash) can still use its sample or preview
+IMAGE_EXTENSIONS = ["png", "jpg", "gif", "webp"]
+# The most posts the API returns in one page
+MAX_PAGE_SIZE = 320
+# Only the latest requests are kept for inspection, the summary covers all of them
+LATENCY_HISTORY = 1000
+
+
+def quote_tags(tags):
+    """
+        A search (space separated tags, like on the site) as it goes in a URL. Each tag is escaped on its own,
+        since tags can have &, #, + or % in them
+    """
+    return "+".join(quote(tag, safe=":") for tag in tags.split())
+
+
+def create_session(pool_size=POOL_SIZE, retries=RETRIES, backoff=RETRY_BACKOFF):
+    """
+        Creates a keep-alive session with a connection pool and a retry policy with exponential backoff
+        for connection errors. Server errors aren't retried here, since those retries would skip the rate
+        limiter: e621Client.send retries them
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=[],
+        allowed_methods=RETRY_METHODS,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
+        "Accept-Encoding": "gzip, deflate",
+        "Connection": "keep-alive"
+    })
+    return session
+
+
+def pick_rendition(post, side):
+    """
+        Returns the URL of the smallest rendition of a post (preview, sample or the original file) whose
+        shortest edge is at least side pixels, or of the biggest one if none is. None if it has none
+    """
+    renditions = []
+    for name in ["preview", "sample", "file"]:
+        rendition = post.get(name)
+        if rendition is None or rendition.get("url") is None:
+            continue
+        if name == "sample" and not rendition.get("has", True):
+            continue
+        if name == "file" and not rendition.get("ext") in IMAGE_EXTENSIONS:
+            continue
+        renditions.append(rendition)
+
+    if len(renditions) == 0:
+        return None
+    for rendition in renditions:
+        if min(rendition.get("width", 0), rendition.get("height", 0)) >= side:
+            return rendition["url"]
+    return renditions[-1]["url"]
 
 
 class e621Client():
-    def __init__(self, credentials_path, delay = 1):
+    def __init__(self, credentials_path, delay = 1, session=None, base_url=BASE_URL, timeout=TIMEOUT, pool_size=POOL_SIZE, retries=RETRIES, rate_limiter=None, cache=None, refresh=False, retry_backoff=RETRY_BACKOFF):
         if os.path.exists("credentials.json"):
             with open(credentials_path, 'r') as f:
                 credentials = json.load(f)
@@ -22,47 +115,165 @@ class e621Client():
                     "User-Agent": "e621Wrapped/1.0 (by mormonara on e621)"
             }
         
+        # By default every client on this machine shares the same request budget
         self.delay = delay
-        self.time_since_last_request = 0.0
+        self.rate_limiter = rate_limiter if rate_limiter is not None else SharedRateLimiter(delay)
+
+        # The session can be injected, e.g. to point the client at a local stand-in server
+        self.session = session if session is not None else create_session(pool_size, retries, retry_backoff)
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.latencies = deque(maxlen=LATENCY_HISTORY)
+        self.request_count = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+        # Optional ResponseCache. With refresh, cached responses are always revalidated with the server
+        self.cache = cache
+        self.refresh = refresh
+        self.identity = credential_identity(self.auth)
     
 
     def wait_delay(self):
-        new_time = time.time()
-        if new_time - self.time_since_last_request < self.delay:
-            time.sleep(self.delay - new_time + self.time_since_last_request)
-        self.time_since_last_request = time.time()
+        self.rate_limiter.acquire()
 
 
-    def get_favorites(self, user_id, page_num):
-        url = f'https://e621.net/favorites.json?limit=320&user_id={user_id}&page={page_num}'
-        try:
+    def send(self, method, url, headers, **kwargs):
+        """
+            Sends a rate limited request through the pooled session and records how long it took.
+            Requests that get a 429/503 are sent again once the rate limiter allows it, and GET/HEAD requests
+            that get a server error are sent again with exponential backoff, also through the rate limiter
+        """
+        rate_limited = 0
+        server_errors = 0
+        while True:
             self.wait_delay()
-            response = requests.get(
-                    url,
-                    auth=self.auth,
-                    headers=self.headers
-                )
+            start = time.perf_counter()
+            response = self.session.request(
+                method,
+                url,
+                auth=self.auth,
+                headers=headers,
+                timeout=self.timeout,
+                **kwargs
+            )
+            latency = time.perf_counter() - start
+            self.latencies.append((method, url, response.status_code, latency))
+            self.request_count += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+            self.rate_limiter.on_response(response.status_code, parse_retry_after(response.headers.get("Retry-After")))
+            if response.status_code in RATE_LIMITED_STATUSES and rate_limited < RATE_LIMIT_RETRIES:
+                rate_limited += 1
+            elif response.status_code in RETRY_STATUSES and method in RETRY_METHODS and server_errors < self.retries:
+                time.sleep(self.retry_backoff * 2**server_errors)
+                server_errors += 1
+            else:
+                return response
+            # It's sent again, so this one won't be read
+            response.close()
+
+
+    def request(self, method, url, refresh=False, **kwargs):
+        """
+            Like send, but GET requests are answered from the cache while fresh, and revalidated with a
+            conditional request once they are stale (or always, with refresh). Streamed responses aren't read here, so they're only
+            cached once the caller hands their body to cache_streamed
+        """
+        if method != "GET" or self.cache is None or self.cache.ttl(url) is None:
+            return self.send(method, url, self.headers, **kwargs)
+
+        key = self.cache.key(url, self.identity)
+        cached = self.cache.get(key)
+        if cached is not None and cached.fresh and not (self.refresh or refresh):
+            return cached
+
+        headers = self.headers if cached is None else {**self.headers, **cached.validators()}
+        response = self.send(method, url, headers, **kwargs)
+        if response.status_code == 304 and cached is not None:
+            self.cache.revalidated(key, url)
+            return cached
+
+        if not kwargs.get("stream", False):
+            self.cache.put(key, url, response)
+        return response
+
+
+    def cache_streamed(self, url, response, body):
+        """
+            Caches a response that request streamed, with the body the caller read from it
+        """
+        if self.cache is None or isinstance(response, CachedResponse):
+            return
+        self.cache.put(self.cache.key(url, self.identity), url, response, body)
+
+
+    def latency_summary(self):
+        """
+            Returns the amount of requests sent and their mean, max and total latency in seconds
+        """
+        if self.request_count == 0:
+            return {"requests": 0, "mean": 0.0, "max": 0.0, "total": 0.0}
+        return {"requests": self.request_count, "mean": self.total_latency / self.request_count, "max": self.max_latency, "total": self.total_latency}
+
+
+    def close(self):
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
+
+
+    def get_favorites(self, user_id, page_num, limit=MAX_PAGE_SIZE, refresh=False):
+        """
+            A page of the user's favorites, most recently favorited first. With refresh, a cached page is
+            checked with e621 even if it's still fresh. Returns None if the page couldn't be fetched
+        """
+        url = f'{self.base_url}/favorites.json?limit={min(limit, MAX_PAGE_SIZE)}&user_id={user_id}&page={page_num}'
+        try:
+            response = self.request("GET", url, refresh=refresh)
         except:
             print(f"Failed to get favorites for {user_id} - An unexpected error occurred")
-            return []
+            return None
         
         if response.status_code != 200:
             print(f"Failed to get favorites for {user_id} - Status: {response.status_code}")
-            return []
+            return None
         
-        data = response.json()
+        data = decode_json(response.content)
+        return data['posts']
+
+
+    def get_posts(self, tags, page="", limit=MAX_PAGE_SIZE):
+        """
+            A page of a post search (tags separated by spaces), highest ids first. page can be an id cursor:
+            "b<id>" is the page of posts with ids below id, which the server finds as fast however deep it is.
+            Returns None if the page couldn't be fetched
+        """
+        url = f"{self.base_url}/posts.json?limit={min(limit, MAX_PAGE_SIZE)}&tags={quote_tags(tags)}{'&page=' + str(page) if page != '' else ''}"
+        try:
+            response = self.request("GET", url)
+        except:
+            print(f"Failed to get posts - An unexpected error occurred")
+            return None
+        
+        if response.status_code != 200:
+            print(f"Failed to get posts - Status: {response.status_code}")
+            return None
+        
+        data = decode_json(response.content)
         return data['posts']
 
 
     def get_random_posts(self, min_upvotes, extra_tags):
-        url = f"https://e621.net/posts.json?tags=order:random+score:>={min_upvotes}{'+' + extra_tags if len(extra_tags) > 0 else ''}"
+        """
+            A page of random posts with at least min_upvotes and the tags in extra_tags, separated by spaces
+        """
+        url = f"{self.base_url}/posts.json?tags={quote_tags(f'order:random score:>={min_upvotes} {extra_tags}')}"
         try:
-            self.wait_delay()
-            response = requests.get(
-                    url,
-                    auth=self.auth,
-                    headers=self.headers
-                )
+            response = self.request("GET", url)
         except:
             print(f"Failed to get posts - An unexpected error occurred")
             return []
@@ -71,19 +282,14 @@ class e621Client():
             print(f"Failed to get posts - Status: {response.status_code}")
             return []
         
-        data = response.json()
+        data = decode_json(response.content)
         return data['posts']
     
 
     def get_top_users(self, page_num):
-        url = f"https://e621.net/users.json?limit=320&page={page_num}&search[order]=post_upload_count"
+        url = f"{self.base_url}/users.json?limit=320&page={page_num}&search[order]=post_upload_count"
         try:
-            self.wait_delay()
-            response = requests.get(
-                    url,
-                    auth=self.auth,
-                    headers=self.headers
-                )
+            response = self.request("GET", url)
         except:
             print(f"Failed to get users - An unexpected error occurred")
             return[]
@@ -92,64 +298,88 @@ class e621Client():
             print(f"Failed to get users - Status: {response.status_code}")
             return []
         
-        return response.json()
+        return decode_json(response.content)
     
 
     def get_user(self, user_id):
-        url = f"https://e621.net/users/{user_id}.json"
+        """
+            The user's data, None if there's no such user, or [] if it couldn't be fetched
+        """
+        url = f"{self.base_url}/users/{user_id}.json"
         try:
-            self.wait_delay()
-            response = requests.get(
-                    url,
-                    auth=self.auth,
-                    headers=self.headers
-                )
+            response = self.request("GET", url)
         except:
             print(f"Failed to get post - An unexpected error occurred")
             return[]
         
+        if response.status_code == 404:
+            print(f"Failed to get user {user_id} - There's no such user")
+            return None
         if response.status_code != 200:
             print(f"Failed to get post - Status: {response.status_code}")
             return []
         
-        return response.json()
+        return decode_json(response.content)
 
 
-    def get_post_thumb(self, post_id, side):
-        url = f"https://e621.net/posts/{post_id}.json"
-        try:
-            self.wait_delay()
-            response = requests.get(
-                    url,
-                    auth=self.auth,
-                    headers=self.headers
-                )
-        except:
-            print(f"Failed to get post - An unexpected error occurred")
-            return[]
-        
-        if response.status_code != 200:
-            print(f"Failed to get post - Status: {response.status_code}")
+    def get_post_thumb(self, post, side, cancelled=None):
+        """
+            Downloads a post as a side x side image, center cropped. post is either its id or the post as
+            returned by the API, which saves asking for it again. Only the smallest rendition that's big
+            enough is downloaded, and JPEGs are decoded at a reduced size when they're much bigger than side.
+            Once the threading.Event cancelled is set, the download stops and [] is returned
+        """
+        if cancelled is not None and cancelled.is_set():
+            return []
+        if not isinstance(post, dict):
+            url = f"{self.base_url}/posts/{post}.json"
+            try:
+                response = self.request("GET", url)
+            except:
+                print(f"Failed to get post - An unexpected error occurred")
+                return[]
+            
+            if response.status_code != 200:
+                print(f"Failed to get post - Status: {response.status_code}")
+                return []
+            
+            post = decode_json(response.content)["post"]
+
+        url = pick_rendition(post, side)
+        if url is None:
+            print(f"Failed to get post - It has no image we can download")
+            return []
+        if cancelled is not None and cancelled.is_set():
             return []
-        
-        data = response.json()
-        url = data["post"]["file"]["url"]
         try:
-            self.wait_delay()
-            response = requests.get(
-                    url,
-                    auth=self.auth,
-                    headers=self.headers
-                )
+            response = self.request("GET", url, stream=True)
         except:
             print(f"Failed to get post - An unexpected error occurred")
             return[]
         
-        if response.status_code != 200:
-            print(f"Failed to get post - Status: {response.status_code}")
-            return []
+        try:
+            if response.status_code != 200:
+                print(f"Failed to get post - Status: {response.status_code}")
+                return []
+
+            body = BytesIO()
+            for chunk in response.iter_content(THUMB_CHUNK_SIZE):
+                if cancelled is not None and cancelled.is_set():
+                    return []
+                body.write(chunk)
+                if body.tell() > THUMB_MAX_BYTES:
+                    print(f"Failed to get post - It's bigger than {THUMB_MAX_BYTES // 2**20} MiB")
+                    return []
+        finally:
+            response.close()
+        self.cache_streamed(url, response, body.getvalue())
 
-        img = Image.open(BytesIO(response.content))
+        # Only imported here, so scripts that never download images don't pay for it
+        from PIL import Image
+        body.seek(0)
+        img = Image.open(body)
+        # Lets the JPEG decoder skip straight to a smaller scale that still covers side x side
+        img.draft("RGB", (side, side))
         l = int(min(img.size[0], img.size[1]) / 2)
         xc = int(img.size[0] / 2)
         yc = int(img.size[1] / 2)
@@ -158,18 +388,30 @@ class e621Client():
         return img
     
 
+    def get_set_posts(self, set_id):
+        """
+            The ids of every post in the set, or None if the set couldn't be fetched
+        """
+        url = f"{self.base_url}/post_sets/{set_id}.json"
+        try:
+            response = self.request("GET", url)
+        except:
+            print(f"Failed to get set - An unexpected error occurred")
+            return None
+
+        if response.status_code != 200:
+            print(f"Failed to get set - Status: {response.status_code}")
+            return None
+
+        return decode_json(response.content)["post_ids"]
+
+
     def add_posts_to_set(self, set_id, posts):
-        url = f"https://e621.net/post_sets/{set_id}/add_posts.json"
+        url = f"{self.base_url}/post_sets/{set_id}/add_posts.json"
         data = [('post_ids[]', str(post_id)) for post_id in posts]
 
         try:
-            self.wait_delay()
-            response = requests.post(
-                    url,
-                    auth=self.auth,
-                    headers=self.headers,
-                    data=data
-                )
+            response = self.request("POST", url, data=data)
         except:
             print(f"Failed to add posts - An unexpected error occurred")
             return False
@@ -181,29 +423,185 @@ class e621Client():
         return True
 
 
+    def find_set(self, set_short_name):
+        """
+            The id of the set with this short name that we made, or -1 if there's none or it couldn't be
+            found. Short names are taken for everyone, so a set someone else made with it is never used
+        """
+        if self.auth is None:
+            # Only a logged in user can have made sets
+            return -1
+        url = f"{self.base_url}/post_sets.json?search[shortname]={quote(set_short_name, safe='')}&search[creator_name]={quote(self.auth[0], safe='')}"
+        try:
+            response = self.request("GET", url)
+        except:
+            print(f"Failed to find set - An unexpected error occurred")
+            return -1
+
+        if response.status_code != 200:
+            print(f"Failed to find set - Status: {response.status_code}")
+            return -1
+
+        sets = [post_set for post_set in decode_json(response.content) if post_set["shortname"] == set_short_name]
+        return sets[0]["id"] if len(sets) > 0 else -1
+
+
     def create_set(self, set_title, set_short_name):
-        url = "https://e621.net/post_sets.json"
+        """
+            Creates a private set and returns its id, or -1 if it couldn't be created. If there's a set with
+            this short name already (e.g. from a profile that was lost), that one is used instead
+        """
+        url = f"{self.base_url}/post_sets.json"
         data = {
             'post_set[name]': set_title,
             'post_set[shortname]': set_short_name,
             "post_set[is_public]": "false"
         }
         try:
-            self.wait_delay()
-            response = requests.post(
-                    url,
-                    auth=self.auth,
-                    headers=self.headers,
-                    data=data
-                )
+            response = self.request("POST", url, data=data)
         except:
             print(f"Failed to create set - An unexpected error occurred")
             return -1
 
-        if response.status_code != 201 and response.status_code != 422:
+        if response.status_code == 422:
+            # The short name is taken
+            return self.find_set(set_short_name)
+        if response.status_code != 201:
             print(f"Failed to create set - Status: {response.status_code}")
             return -1
         
-        result = response.json()
+        result = decode_json(response.content)
         return result["id"]
-        
\ No newline at end of file
+
+
+class AsyncE621Client():
+    """
+        asyncio counterpart to e621Client with the same methods. Calls run on worker threads through the
+        wrapped client, so they share its session and rate limiter. The page iterators keep the next
+        request in flight while the previous page is being processed
+    """
+    def __init__(self, client, prefetch=1):
+        self.client = client
+        self.prefetch = prefetch
+
+
+    async def get_favorites(self, user_id, page_num, limit=MAX_PAGE_SIZE, refresh=False):
+        return await asyncio.to_thread(self.client.get_favorites, user_id, page_num, limit, refresh)
+
+
+    async def get_posts(self, tags, page="", limit=MAX_PAGE_SIZE):
+        return await asyncio.to_thread(self.client.get_posts, tags, page, limit)
+
+
+    async def get_random_posts(self, min_upvotes, extra_tags):
+        return await asyncio.to_thread(self.client.get_random_posts, min_upvotes, extra_tags)
+
+
+    async def get_top_users(self, page_num):
+        return await asyncio.to_thread(self.client.get_top_users, page_num)
+
+
+    async def get_user(self, user_id):
+        return await asyncio.to_thread(self.client.get_user, user_id)
+
+
+    async def get_post_thumb(self, post, side, cancelled=None):
+        return await asyncio.to_thread(self.client.get_post_thumb, post, side, cancelled)
+
+
+    async def get_set_posts(self, set_id):
+        return await asyncio.to_thread(self.client.get_set_posts, set_id)
+
+
+    async def add_posts_to_set(self, set_id, posts):
+        return await asyncio.to_thread(self.client.add_posts_to_set, set_id, posts)
+
+
+    async def find_set(self, set_short_name):
+        return await asyncio.to_thread(self.client.find_set, set_short_name)
+
+
+    async def create_set(self, set_title, set_short_name):
+        return await asyncio.to_thread(self.client.create_set, set_title, set_short_name)
+
+
+    async def pipeline(self, fetch_page, total_pages, is_last_page=lambda page: False):
+        """
+            Yields fetch_page(0), fetch_page(1)... keeping up to prefetch pages requested ahead of the one
+            being processed. The rate limiter spaces the requests, so waiting for the next slot overlaps
+            with the current page. Without total_pages, it goes on until is_last_page
+        """
+        in_flight = deque()
+        next_page = 0
+
+        def schedule(limit):
+            nonlocal next_page
+            while (total_pages is None or next_page < total_pages) and len(in_flight) < limit:
+                in_flight.append(asyncio.ensure_future(asyncio.to_thread(fetch_page, next_page)))
+                next_page += 1
+
+        try:
+            while True:
+                schedule(1)
+                if len(in_flight) == 0:
+                    break
+                page = await in_flight.popleft()
+                if is_last_page(page):
+                    yield page
+                    break
+                # Request the next pages before handing this one over to be processed
+                schedule(self.prefetch)
+                yield page
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+
+    async def iter_favorites(self, user_id, max_pages=None, page_size=MAX_PAGE_SIZE, refresh=False):
+        """
+            Yields pages of favorites, most recently favorited first, until a page comes back short or
+            max_pages (if any) is reached. A page that couldn't be fetched is yielded as None, and is the last one
+        """
+        page_size = min(page_size, MAX_PAGE_SIZE)
+        async for page in self.pipeline(lambda page_num: self.client.get_favorites(user_id, page_num, page_size, refresh), max_pages, lambda page: page is None or len(page) < page_size):
+            yield page
+
+
+    async def iter_posts(self, tags, max_pages=None, page_size=MAX_PAGE_SIZE):
+        """
+            Yields the pages of a post search, highest ids first, until it runs out or max_pages is reached.
+            Each page starts below the lowest id of the one before (page=b<id>), so posts added in the
+            meantime don't shift the pages and nothing is skipped or fetched twice. The next page is requested
+            as soon as a page arrives, before it's processed. A page that couldn't be fetched is yielded as
+            None, and is the last one
+        """
+        page_size = min(page_size, MAX_PAGE_SIZE)
+        fetched = 0
+        next_page = self.get_posts(tags, "", page_size)
+        try:
+            while next_page is not None:
+                page = await next_page
+                next_page = None
+                fetched += 1
+                if page is None:
+                    yield page
+                    break
+                if len(page) == 0:
+                    break
+
+                # A short page is the last one
+                if len(page) == page_size and (max_pages is None or fetched < max_pages):
+                    next_page = self.get_posts(tags, f"b{min(post['id'] for post in page)}", page_size)
+                    if self.prefetch > 0:
+                        next_page = asyncio.ensure_future(next_page)
+                yield page
+        finally:
+            if next_page is not None and asyncio.isfuture(next_page):
+                next_page.cancel()
+            elif next_page is not None:
+                next_page.close()
+
+
+    async def iter_random_posts(self, min_upvotes, extra_tags, pages):
+        async for page in self.pipeline(lambda _: self.client.get_random_posts(min_upvotes, extra_tags), pages):
+            yield page
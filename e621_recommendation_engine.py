@@ -1,13 +1,142 @@
 from argparse import ArgumentParser
-from e621_client import e621Client
-from e621_wrapped import get_post_score
-import json
+import asyncio
+from candidate_search import QueryBandit, SeenPosts, build_queries
+from e621_client import AsyncE621Client, e621Client
+from response_cache import ResponseCache
+from post_scorer import PostScorer
+from profile_store import load_profile
+from set_sync import SetSync
+from tag_filters import add_exclusion_arguments, tag_filter_from_args
+import numpy as np
 import os
 
 
 CREDENTIALS_FILE = "credentials.json"
 
 
+async def recommend_posts(e621_async, profile, args, recommended_posts, found=None, quiet=False, tag_filter=None, set_sync=None):
+    """
+        Scores pages of random posts against the profile, fetching the next page while the current one is scored.
+        With the adaptive strategy, pages are spread between random searches for the profile's top favorite tags,
+        and most go to the searches that have been finding the most posts. Posts in profile.seen_posts are skipped,
+        and every post looked at is added to it. Favorite tags that tag_filter excludes aren't searched for or scored.
+        If found is a list, every recommendation is appended to it as (post_id, score, best_tags). With a SetSync,
+        its set is checked against e621 first, and recommendations are added to it in batches as they're found.
+        If the set can't be checked, nothing is added to it
+    """
+    if set_sync is not None:
+        if await set_sync.reconcile():
+            recommended_posts.update(set_sync.posts.tolist())
+        else:
+            # Without knowing what's in the set, posts could be sent to it again
+            print("- I couldn't check what's in your set, so I won't add anything to it this time <:3c")
+            set_sync = None
+
+    favorites = profile.favorites if tag_filter is None else [tag_filter.keep(tags) for tags in profile.favorites]
+    scorer = PostScorer(profile.user_profile, profile.weights, favorites)
+    max_score = 0
+    recommended_ids = []
+
+    if getattr(args, "strategy", "adaptive") == "random":
+        queries = [" ".join(args.extra_tags)]
+    else:
+        queries = build_queries(favorites, args.extra_tags)
+    bandit = QueryBandit(queries)
+    seen = SeenPosts(profile.seen_posts)
+
+    def fetch_page(_):
+        query = bandit.choose()
+        return query, e621_async.client.get_random_posts(int(args.min_upvotes), queries[query])
+
+    i = 0
+    total_found = 0
+    async for query, posts in e621_async.pipeline(fetch_page, int(args.pages)):
+        if not quiet:
+            print(f"\n- Looking for posts in page {i + 1}{' (' + queries[query] + ')' if len(queries[query]) > 0 else ''}... :3c\n")
+        i += 1
+
+        # Random pages overlap, so a post that was already looked at doesn't cost scoring it again
+        post_ids = np.fromiter((post["id"] for post in posts), dtype=np.int64, count=len(posts))
+        new = ~(seen.contains(post_ids) | np.isin(post_ids, profile.fav_ids))
+        posts = [post for post, is_new in zip(posts, new.tolist()) if is_new and not post["id"] in recommended_posts]
+        seen.add(post_ids)
+
+        scores, post_best_tags = scorer.score_posts(posts, True)
+        recommended_ids = []
+        for post, score, best_tags in zip(posts, scores.tolist(), post_best_tags):
+            if score >= float(args.score):
+                recommended_posts.add(post["id"])
+                recommended_ids.append(post["id"])
+                if found is not None:
+                    found.append((post["id"], score, best_tags))
+
+                if not quiet:
+                    print(f"{str(int(score)) + ('*' if score > max_score and max_score != 0 else ''):3s}| https://e621.net/posts/{str(post['id']):10s} | {' '.join(best_tags)}")
+                if score > max_score:
+                    max_score = score
+        bandit.update(query, len(post_ids), len(recommended_ids))
+        total_found += len(recommended_ids)
+
+        if set_sync is not None:
+            set_sync.add(recommended_ids)
+
+    profile.seen_posts = seen.ids
+    if set_sync is not None:
+        await set_sync.close()
+    if not quiet and i > 0:
+        print(f"\n- Found {total_found} posts in {i} requests ({total_found / i:.2f} per request) :3")
+        if len(queries) > 1:
+            print("- Best searches: " + ", ".join(f"{query or 'random'} ({found}/{requests})" for query, requests, found in bandit.summary()[:5]))
+    return recommended_ids
+
+
+def run_recommendations(e621, user_name, args, tag_filter=None, output_dir=""):
+    """
+        Loads the user's profile, gets their set ready if args.add_to_set is "y", recommends posts and saves
+        the profile again, with the posts that were looked at and everything that's in the set. Returns the
+        profile, or None if there's no profile or no set to add to
+    """
+    profile_file = os.path.join(output_dir, f"{user_name}_profile.npz")
+    if not os.path.exists(profile_file) and os.path.exists(os.path.join(output_dir, f"{user_name}_profile.json")):
+        profile_file = os.path.join(output_dir, f"{user_name}_profile.json")
+    if not os.path.exists(profile_file):
+        print(f"\n- Sorry, I couldn't find your profile <:3c")
+        print("- Please make sure to run e621_wrapped.py before running this script :3")
+        return None
+    profile = load_profile(profile_file)
+    if args.forget_seen:
+        profile.seen_posts = []
+
+    if args.add_to_set == "y":
+        if profile.set_id is None:
+            new_id = e621.create_set(f"{user_name} Wrapped Recommendations", f"{user_name}_wrapped_recommendations")
+            if new_id == -1:
+                return None
+
+            profile.set_id = new_id
+            profile.set_posts = []
+    
+
+    ###################
+    # Recommend posts #
+    ###################
+    e621_async = AsyncE621Client(e621)
+    recommended_posts = set()
+    set_sync = None
+    if args.add_to_set == "y":
+        recommended_posts.update(profile.set_posts.tolist())
+        set_sync = SetSync(e621_async, profile.set_id, profile.set_posts)
+
+    asyncio.run(recommend_posts(e621_async, profile, args, recommended_posts, tag_filter=tag_filter, set_sync=set_sync))
+
+    if set_sync is not None:
+        # Everything that's in the set, so later runs don't send it again
+        profile.set_posts = set_sync.posts
+    # Also keeps the posts that were looked at, so the next run skips them
+    profile.save(os.path.join(output_dir, f"{user_name}_profile.npz"))
+    return profile
+
+
 if __name__ == "__main__":
     ##################
     # Initialization #
@@ -22,67 +151,19 @@ if __name__ == "__main__":
     parser.add_argument("-m", "--min_upvotes", default=100, help="Minimum upvote score of searched posts")
     parser.add_argument("-t", "--extra_tags", default="", help="Extra tags to be used on searched posts", nargs="*")
     parser.add_argument("-a", "--add_to_set", default="n", help="Adds posts gathered to a new set (y/n)")
+    parser.add_argument("--strategy", default="adaptive", choices=["adaptive", "random"], help="adaptive spreads pages between searches for your top favorite tags, favoring the ones that find the most posts. random only uses random pages")
+    parser.add_argument("--forget-seen", action="store_true", help="Look at posts that previous runs already looked at again")
+    add_exclusion_arguments(parser)
+    parser.add_argument("--no-cache", action="store_true", help="Don't read or write the local response cache")
+    parser.add_argument("--refresh", action="store_true", help="Revalidate every cached response with e621 instead of trusting it")
     args = parser.parse_args()
     
-    e621 = e621Client(CREDENTIALS_FILE)
+    e621 = e621Client(CREDENTIALS_FILE, cache=None if args.no_cache else ResponseCache(), refresh=args.refresh)
     user_data = e621.get_user(args.user)
     user_name = user_data["name"]
     print(f"- Hi {user_name}! Let's look for some posts you might like...")
 
-    if not os.path.exists(f"{user_name}_profile.json"):
-        print(f"\n- Sorry, I couldn't find your profile <:3c")
-        print("- Please make sure to run e621_wrapped.py before running this script :3")
-        exit(0)
-    with open(f"{user_name}_profile.json") as f:
-        profile = json.load(f)
-
-    if args.add_to_set == "y":
-        if not "set" in profile:
-            new_id = e621.create_set(f"{user_name} Wrapped Recommendations", f"{user_name}_wrapped_recommendations")
-            if new_id == -1:
-                exit(0)
-
-            profile["set"] = {
-                "id": new_id,
-                "posts": {}
-            }
-    
-
-    ###################
-    # Recommend posts #
-    ###################
-    recommended_posts = profile["fav_dict"]
-    if args.add_to_set == "y":
-        for post_id in profile["set"]["posts"]:
-            recommended_posts[post_id] = True
-    max_score = 0
-
-    for i in range(int(args.pages)):
-        print(f"\n- Looking for posts in page {i + 1}... :3c\n")
-
-        posts = e621.get_random_posts(int(args.min_upvotes), "+".join(args.extra_tags))
-        recommended_ids = []
-        for post in posts:
-            if str(post["id"]) in recommended_posts:
-                continue
-
-            score, best_tags = get_post_score(post, profile["profile"], profile["weights"], profile["favorites"], True)
-            if score >= int(args.score):
-                recommended_posts[str(post["id"])] = True
-                recommended_ids.append(post["id"])
-
-                print(f"{str(int(score)) + ('*' if score > max_score and max_score != 0 else ''):3s}| https://e621.net/posts/{str(post['id']):10s} | {' '.join(best_tags)}")
-                if score > max_score:
-                    max_score = score
-        
-        if args.add_to_set == "y" and len(recommended_ids) > 0:
-            e621.add_posts_to_set(profile["set"]["id"], recommended_ids)
-            print("Added posts to set!")
-
-    if args.add_to_set == "y":
-        profile["set"]["posts"] = recommended_ids
-        with open(f"{user_name}_profile.json", "w") as f:
-            json.dump(profile, f, indent=4)
+    run_recommendations(e621, user_name, args, tag_filter_from_args(args))
 
 
 
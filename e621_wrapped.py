@@ -1,128 +1,190 @@
 from argparse import ArgumentParser
-from e621_client import e621Client
-from interest_generator import get_user_interests
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from e621_client import MAX_PAGE_SIZE, AsyncE621Client, e621Client
+from response_cache import ResponseCache
+from tag_filters import add_exclusion_arguments, tag_filter_from_args
+from tag_implications import load_tag_implications
 from tqdm.auto import tqdm
-import json
-import csv
-import matplotlib.pyplot as plt
-import math
-from PIL import Image, ImageDraw, ImageFont
+import os
+import threading
+from wrapped_core import TAG_IMPLICATIONS_FILE, build_results, load_favorites, load_global_interests, save_profile
 
 
 CREDENTIALS_FILE = "credentials.json"
-INTERESTS_FILE = "interests.json"
-TAG_IMPLICATIONS_FILE = "data/tag_implications.csv"
+# The favorite post of the Wrapped is the best scored one of these that can be downloaded
+THUMBNAIL_CANDIDATES = 10
+# How many of them are downloading at once, the avatar aside
+THUMBNAIL_PREFETCH = 2
 
-MIN_PERCENT = 0.001
-EXCLUDE_WORDS = ["male", "anthro", "female"]
-RELATIVE_PRESENCE_CAP = 100
-ALLOWED_FILE_TYPES = ["png", "jpg"]
+# See get_renderer and get_detailed_renderer
+shared_renderer = None
+shared_detailed_renderer = None
 
-def plot_tags(ax, tags, user_profile, override_enjoyment=None):
+
+async def fetch_favorites(e621_async, user_id, max_pages, fav_matrix, quiet=False, user_name=None, page_size=MAX_PAGE_SIZE, favorite_count=None, refresh=False):
     """
-        Plots the tags in the ax
+        Adds the user's favorites to fav_matrix page by page, while the next page is already being fetched.
+        Stops at the first favorite fav_matrix already has, so refreshing a saved profile only fetches what
+        was favorited since. That goes on past max_pages if it has to: stopping early would leave a gap
+        between the new favorites and the saved ones, and later runs would stop before it and never fill it.
+        Returns how many favorites were added, or None if a page couldn't be fetched
+
+        Starting from nothing, when all of the user's favorites (favorite_count, from their user data) fit in
+        max_pages, the whole history is walked as a fav: search with an id cursor instead, which stays as fast
+        on the last page as on the first. That search goes by post id rather than by when posts were
+        favorited, so when max_pages would cut it short the most recent favorites are fetched as usual.
+        With refresh, cached pages of favorites are checked with e621 even if they're still fresh
     """
-    presence = []
-    relative_presence = []
-    enjoyment = []
-    new_tags = []
-    for tag in tags:
-        new_tags.append(str(tag).split(":")[-1])
-
-        if not override_enjoyment is None:
-            enjoyment.append(override_enjoyment[tag])
-            continue
-
-        presence.append(user_profile[tag]["presence"] if tag in user_profile else 0)
-        relative_presence.append(user_profile[tag]["relative_presence"] if tag in user_profile else -1)
-        enjoyment.append(user_profile[tag]["enjoyment"] if tag in user_profile else 0)
-    tags = new_tags
-
-    # Plot
-    bars = ax.bar(tags, enjoyment, color='skyblue')
-    if override_enjoyment is None:
-        for idx, bar in enumerate(bars):
-            height = bar.get_height()
-            ax.text(bar.get_x() + bar.get_width() / 2, height, f"{presence[idx] * 100:.1f}%", 
-                    ha='center', va='bottom', fontsize=8, rotation=45)
-            ax.text(bar.get_x() + bar.get_width() / 2, 0, f"{relative_presence[idx]:.1f}x", 
-                    ha='center', va='bottom', fontsize=8, rotation=45)
-    ax.tick_params(axis='x', labelrotation=90)
-
-
-def draw_favorite(tag_name, user_profile, bb, img, first):
+    page_size = min(page_size, MAX_PAGE_SIZE)
+    known_ids = set(fav_matrix.post_ids)
+    total_new = 0
+    if len(fav_matrix) == 0 and user_name is not None and favorite_count is not None and favorite_count <= max_pages * page_size:
+        pages = e621_async.iter_posts(f"fav:{user_name} status:any", max_pages, page_size)
+        description = f"Getting all of your favorites ({favorite_count})"
+        total_pages = favorite_count // page_size + 1
+    elif len(fav_matrix) > 0:
+        pages = e621_async.iter_favorites(user_id, None, page_size, refresh)
+        description = "Getting your new favorites"
+        total_pages = None
+    else:
+        pages = e621_async.iter_favorites(user_id, max_pages, page_size, refresh)
+        description = f"Getting your most recent favorites (up to {max_pages * page_size})"
+        total_pages = max_pages
+    with tqdm(desc=description, unit=" pages", total=total_pages, disable=quiet) as progress:
+        async for new_favs in pages:
+            progress.update(1)
+            if new_favs is None:
+                return None
+            reached_known = False
+            for fav in new_favs:
+                if fav["id"] in known_ids:
+                    reached_known = True
+                    break
+                fav_matrix.add_post(fav)
+                total_new += 1
+            if reached_known:
+                break
+    return total_new
+
+
+async def update_favorites(e621, user_id, user_name, max_pages, full=False, output_dir="", quiet=False, page_size=MAX_PAGE_SIZE, favorite_count=None, refresh=False):
     """
-        Given a bounding box, writes the name of the tag, its presence, and its relative presence
+        Loads the saved favorites, fetches the new ones and saves them again. Returns the matrix and how
+        many favorites were new. If e621 couldn't give all of them, nothing is saved and the matrix is None
     """
-    draw = ImageDraw.Draw(img)
-    font = ImageFont.truetype("fonts/liberation-fonts-ttf-2.1.5/LiberationSans-Bold.ttf", size=36 if first else 16)
-    bold_font = ImageFont.truetype("fonts/liberation-fonts-ttf-2.1.5/LiberationSans-BoldItalic.ttf", size=26 if first else 14)
-
-    text = tag_name.split(":")[1].replace("_", " ").capitalize()
-    line_start_pos = 0
-    for pos in range(len(text)):
-        if text[pos] != " ":
-            continue
-
-        if pos - line_start_pos + 1 > 10:
-            text = text[:pos] + '\n' + text[pos:]
-            line_start_pos = pos + 1
-    
-    if len(text) > 32:
-        text = text[:32] + "..."  
-
-    x = int((bb[0] + bb[2]) / 2)
-    y = int((bb[1] + bb[3]) / 2)
-    draw.multiline_text(
-        (x, y + 8),
-        text=text,
-        font=font,
-        fill=(255, 255, 255),
-        anchor="mm",
-        align="center"
-    )
+    fav_matrix = load_favorites(user_name, full, output_dir)
+    if len(fav_matrix) > 0 and not quiet:
+        print(f"- Found {len(fav_matrix)} favorites from last time, so I'll only look for new ones :3\n")
+    # With saved favorites we'll most likely stop after the first page or two, so don't request pages ahead
+    e621_async = AsyncE621Client(e621, prefetch=0 if len(fav_matrix) > 0 else 1)
+
+    total_new = await fetch_favorites(e621_async, user_id, max_pages, fav_matrix, quiet, user_name, page_size, favorite_count, refresh)
+    if total_new is None:
+        return None, None
+    fav_matrix.save(os.path.join(output_dir, f"{user_name}_favorites.npz"))
+    return fav_matrix, total_new
 
-    h = (bb[3] - bb[1]) / 2
-    draw.text(
-        (bb[0] + h, bb[1] + 8),
-        text=f"{user_profile[tag_name]['presence'] * 100:.1f}%",
-        font=bold_font,
-        fill=(38, 154, 255),
-        anchor="mt",
-        align="center"
-    )
-    draw.text(
-        (bb[2] - h, bb[1] + 8),
-        text=f"{min(999.9, user_profile[tag_name]['relative_presence']):.1f}x",
-        font=bold_font,
-        fill=(252, 191, 49),
-        anchor="mt",
-        align="center"
-    )
 
+def get_renderer():
+    """
+        The renderer shared by every Wrapped made in this process, created the first time it's needed
+    """
+    global shared_renderer
+    if shared_renderer is None:
+        # PIL is only imported once something is drawn
+        from wrapped_renderer import WrappedRenderer
+        shared_renderer = WrappedRenderer()
+    return shared_renderer
 
-def get_post_score(post, user_profile, weights, favorite_tag_categories, return_best_tags=False):
-    score = 0
 
-    post["clean_tags"] = []
-    for topic in post["tags"]:
-        for tag in post["tags"][topic]:
-            post["clean_tags"].append(f"{topic}:{tag}")
+def get_detailed_renderer():
+    """
+        The detailed report renderer shared by every report made in this process, created the first time
+        it's needed
+    """
+    global shared_detailed_renderer
+    if shared_detailed_renderer is None:
+        # matplotlib is only imported once something is plotted
+        from detailed_renderer import DetailedRenderer
+        shared_detailed_renderer = DetailedRenderer()
+    return shared_detailed_renderer
+
+
+def get_thumbnails(e621, results, avatar_id, thumbnails=None, candidates=THUMBNAIL_CANDIDATES, prefetch=THUMBNAIL_PREFETCH):
+    """
+        Downloads the favorite post and the avatar at the same time, through the thumbnail cache if there
+        is one. The best scored posts are tried in order while the next ones are already downloading, so a
+        deleted or broken post only costs the wait for the next. The rest are stopped as soon as one works.
+        Returns the favorite post, the avatar and the id of the post used. The images are None if they
+        couldn't be downloaded
+
+        The posts themselves (where their images are) come from a single id: search, so only the images are
+        downloaded one by one. Posts the search doesn't return are skipped
+    """
+    post_ids = results["post_by_scores"][:candidates]
+    stop = threading.Event()
+
+    wanted = post_ids + ([avatar_id] if avatar_id is not None else [])
+    found = e621.get_posts(f"id:{','.join(str(post_id) for post_id in wanted)} status:any", limit=len(wanted)) if len(wanted) > 0 else []
+    if found is not None:
+        posts = {post["id"]: post for post in found}
+        avatar = posts.get(avatar_id, avatar_id)
+        candidate_posts = [(post_id, posts[post_id]) for post_id in post_ids if post_id in posts]
+    else:
+        # Without the search, every post is asked for on its own
+        avatar = avatar_id
+        candidate_posts = [(post_id, post_id) for post_id in post_ids]
+
+    def fetch(post, side, cancelled=None):
+        try:
+            img = thumbnails.get(e621, post, side, cancelled) if thumbnails is not None else e621.get_post_thumb(post, side, cancelled)
+        except:
+            return None
+        # get_post_thumb returns [] when it fails
+        return None if isinstance(img, list) else img
+
+    pool = ThreadPoolExecutor(max_workers=prefetch + 1)
+    try:
+        avatar = pool.submit(fetch, avatar, 300)
+        fav_post, fav_post_id = None, post_ids[0] if len(post_ids) > 0 else None
+        downloads = [pool.submit(fetch, post, 400, stop) for _, post in candidate_posts[:prefetch]]
+        for rank, (post_id, _) in enumerate(candidate_posts):
+            img = downloads[rank].result()
+            if img is not None:
+                fav_post, fav_post_id = img, post_id
+                break
+            if rank + prefetch < len(candidate_posts):
+                downloads.append(pool.submit(fetch, candidate_posts[rank + prefetch][1], 400, stop))
+        stop.set()
+        user_pfp = avatar.result()
+    finally:
+        # Downloads that were stopped finish on their own, they don't need to be waited for
+        stop.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+    return fav_post, user_pfp, fav_post_id
+
+
+def render_wrapped(results, user_name, fav_post, user_pfp, output_dir="", renderer=None, fav_post_id=None):
+    """
+        Draws the Wrapped and saves it as {user_name}.png. Returns the path
+    """
+    if renderer is None:
+        renderer = get_renderer()
+    path = os.path.join(output_dir, f"{user_name}.png")
+    renderer.render(results, user_name, fav_post, user_pfp, fav_post_id).save(path)
+    return path
 
-    best_tags = []
-    for i, favorites in enumerate(favorite_tag_categories):
-        added_best_tag = False
-        for tag in favorites:
-            if tag in post["clean_tags"]:
-                if not added_best_tag:
-                    added_best_tag = True
-                    best_tags.append(tag.split(":")[1])
-                score += weights[i] * user_profile[tag]["enjoyment"]
 
-    final_score = score / math.pow(len(post["clean_tags"]), 0.2) * (math.pow(post["score"]["total"], 0.1) if post["score"]["total"] > 0 else 0)
-    if return_best_tags:
-        return final_score, best_tags
-    return final_score
+def plot_detailed(results, user_name, output_dir="", renderer=None):
+    """
+        Plots the top 25 of every list and saves it as {user_name}_detailed.png. Returns the path
+    """
+    if renderer is None:
+        renderer = get_detailed_renderer()
+    path = os.path.join(output_dir, f"{user_name}_detailed.png")
+    renderer.render(results, user_name, path)
+    return path
 
 
 if __name__ == "__main__":
@@ -135,329 +197,51 @@ if __name__ == "__main__":
     )
     parser.add_argument("-u", "--user", required=True, help="The user_id to make the Wrapped for")
     parser.add_argument("-p", "--pages", default=100, help="The max amount of pages to look for favorites in. Each page contains 320 users (at least 1 second per page)")
+    parser.add_argument("--page-size", default=MAX_PAGE_SIZE, type=int, help=f"How many favorites to ask for per page, up to {MAX_PAGE_SIZE}")
+    parser.add_argument("-f", "--full", action="store_true", help="Fetch every favorite again instead of only the ones added since the last run (use this if you removed favorites)")
+    parser.add_argument("--json", action="store_true", help="Also save the profile as JSON, like older versions did")
+    parser.add_argument("--no-cache", action="store_true", help="Don't read or write the local response cache")
+    parser.add_argument("--refresh", action="store_true", help="Revalidate every cached response with e621 instead of trusting it")
+    add_exclusion_arguments(parser)
     args = parser.parse_args()
 
-    with open(INTERESTS_FILE, "r") as f:
-        global_interests = json.load(f)
-    
-    e621 = e621Client(CREDENTIALS_FILE)
+    global_interests = load_global_interests(tag_filter=tag_filter_from_args(args))
+
+    e621 = e621Client(CREDENTIALS_FILE, cache=None if args.no_cache else ResponseCache(), refresh=args.refresh)
     user_data = e621.get_user(args.user)
     user_name = user_data["name"]
     print(f"- Hi {user_name}! I'm generating your e621 Wrapped, so hang tight :3\n")
-    
+
     ########################
     # Compute user profile #
     ########################
-    # Get favorites
-    favs = []
-    fav_dict = {}
-    for i in tqdm(range(int(args.pages)), f"Getting favorites most recent favorites (up to {int(args.pages) * 320})", unit=" pages", total=int(args.pages)):
-        new_favs = e621.get_favorites(args.user, i)
-        for fav in new_favs:
-            favs.append(fav)
-            fav_dict[fav["id"]] = True
-        if len(new_favs) < 320:
-            break
-    
-    print("\n- Got your favorites! Now just give me a moment to sort through them... <:3c")
-    
-    # Compute interests
-    user_interests = get_user_interests(favs)
-
-    # Compute profile
-    user_profile = {}
-    min_percent = min(global_interests.values())
-    for tag in user_interests:
-        # Exclude criteria
-        if user_interests[tag] < MIN_PERCENT:
-            continue
-
-        word_excluded = False
-        for word in EXCLUDE_WORDS:
-            if word in tag:
-                word_excluded = True
-                break
-        if word_excluded:
-            continue
-
-        # Calculates profile
-        # percent - How present this tag is in the users favorites
-        # relative_presence - How present this tag is in the users favorites compared to the global average
-        # enjoyment - The harmonic mean between the capped normalized relative_presence and the presence
-        user_profile[tag] = {
-            "presence": user_interests[tag],
-            "relative_presence": user_interests[tag] / (global_interests[tag] if tag in global_interests else min_percent)
-        }
-        user_profile[tag]["enjoyment"] = 2 / (1 / (min(RELATIVE_PRESENCE_CAP, user_profile[tag]["relative_presence"]) / RELATIVE_PRESENCE_CAP) + 1 / user_profile[tag]["presence"])
-
-    tags_by_enjoyment = sorted(user_profile.keys(), key=lambda tag: user_profile[tag]["enjoyment"], reverse=True)
-    tags_by_presence = sorted(user_profile.keys(), key=lambda tag: user_profile[tag]["presence"], reverse=True)
-
-    ###############
-    # Tag pooling #
-    ###############
-    # Create tags dict
-    with open(TAG_IMPLICATIONS_FILE, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        
-        implication_dict = {}
-        for row in reader:
-            if row["status"] == "active":
-                if not row["consequent_name"] in implication_dict:
-                    implication_dict[row["consequent_name"]] = []
-                implication_dict[row["consequent_name"]].append(row["antecedent_name"])
-    
-    i = 0
-    changed = True
-    while changed:
-        changed = False
-
-        # If a <- b <- c, simplifies it to a <- b, c
-        to_change = {}
-        for tag in implication_dict:
-            for implicator_tag in implication_dict[tag]:
-                if implicator_tag in implication_dict:
-                    to_change[implicator_tag] = tag
-                
-        if len(to_change) > 0:
-            changed = True
-        
-        for tag in to_change:
-            for implicator_tag in implication_dict[tag]:
-                if not implicator_tag in implication_dict[to_change[tag]]:
-                    implication_dict[to_change[tag]].append(implicator_tag)
-            implication_dict[tag] = []
-
-        to_delete = []
-        for tag in implication_dict:
-            if len(implication_dict[tag]) == 0:
-                to_delete.append(tag)
-        for tag in to_delete:
-            del implication_dict[tag]
-
-    tag_to_parent = {}
-    for tag in implication_dict:
-        tag_to_parent[tag] = tag
-        for implicator_tag in implication_dict[tag]:
-            tag_to_parent[implicator_tag] = tag
-
-    ####################
-    # Building results #
-    ####################
-    # Build favorite tags
-    favorite_tags = []
-    included_categories = {}
-    for tag in tags_by_enjoyment:
-        split_tag = tag.split(":")
-        category = split_tag[0]
-        name = split_tag[1]
-        if not category in ["general", "lore"]:
-            continue
-        if name in tag_to_parent:
-            if tag_to_parent[name] in included_categories:
-                continue
-            included_categories[tag_to_parent[name]] = True
-        
-        favorite_tags.append(tag)
-
-    # Build favorite species
-    favorite_species = []
-    included_categories = {}
-    for tag in tags_by_enjoyment:
-        split_tag = tag.split(":")
-        category = split_tag[0]
-        name = split_tag[1]
-
-        if not category == "species":
-            continue
-        if name in tag_to_parent:
-            if tag_to_parent[name] in included_categories:
-                continue
-            included_categories[tag_to_parent[name]] = True
-        
-        favorite_species.append(tag)
-    
-    # Build favorite characters
-    favorite_characters = []
-    for tag in tags_by_enjoyment:
-        split_tag = tag.split(":")
-        category = split_tag[0]
-        name = split_tag[1]
-
-        if not category == "character":
-            continue
-        
-        favorite_characters.append(tag)
-    
-    # Build favorite artists
-    favorite_artists = []
-    for tag in tags_by_enjoyment:
-        split_tag = tag.split(":")
-        category = split_tag[0]
-        name = split_tag[1]
-
-        if not category == "artist":
-            continue
-        if name in ["sound_warning", "conditional_dnp"]:
-            continue
-        
-        favorite_artists.append(tag)
-    
-    # Build least favorite tags
-    least_favorite_tags_dict = {}
-    for tag in global_interests:
-        word_excluded = False
-        for word in EXCLUDE_WORDS:
-            if word in tag:
-                word_excluded = True
-                break
-        if word_excluded:
-            continue
-
-        least_favorite_tags_dict[tag] = global_interests[tag] - (user_profile[tag]["presence"] if tag in user_profile else 0)
-    tags_by_least_favorite = sorted(least_favorite_tags_dict.keys(), key=lambda x: least_favorite_tags_dict[x], reverse=True)
-    
-    least_favorite_tags = []
-    for tag in tags_by_least_favorite:
-        split_tag = tag.split(":")
-        category = split_tag[0]
-        name = split_tag[1]
-
-        if not category in ["general", "lore", "species"]:
-            continue
-        
-        least_favorite_tags.append(tag)
-
-    # Favorite post
-    favorite_tag_categories = [favorite_tags, favorite_species, favorite_characters, favorite_artists]
-    weights = [1.0, 1.0, 1.0, 1.0]
-    for idx, favorites in enumerate(favorite_tag_categories):
-        weights[idx] *= 1.0 / user_profile[favorites[0]]["enjoyment"]
-
-    post_scores = {}
-    
-    for fav in favs:
-        if fav["file"]["url"] is None:
-            continue
-        if not fav["file"]["url"].split(".")[-1] in ALLOWED_FILE_TYPES:
-            continue
-            
-        post_scores[fav["id"]] = get_post_score(fav, user_profile, weights, favorite_tag_categories)
-    
-    post_by_scores = sorted(post_scores.keys(), key=lambda post: post_scores[post], reverse=True)
-
-    saved_profile = {
-        "profile": user_profile,
-        "weights": weights, 
-        "favorites": favorite_tag_categories,
-        "fav_dict": fav_dict
-    }
-
-    with open(f"{user_name}_profile.json", "w") as f:
-        json.dump(saved_profile, f, indent=4)
-    print(f"- Saved your profile as {user_name}_profile.json :3\n")
+    fav_matrix, total_new = asyncio.run(update_favorites(e621, args.user, user_name, int(args.pages), args.full, page_size=args.page_size, favorite_count=user_data.get("favorite_count")))
+    if fav_matrix is None:
+        print("\n- e621 didn't give me all of your favorites, so I left your saved ones as they were. Try again in a bit <:3c")
+        exit(1)
+
+    print(f"\n- Got your favorites ({total_new} new)! Now just give me a moment to sort through them... <:3c")
+
+    tag_to_parent = load_tag_implications(TAG_IMPLICATIONS_FILE)
+    results = build_results(fav_matrix, global_interests, tag_to_parent)
+
+    save_profile(results, fav_matrix.post_ids, user_name, args.json)
+    print(f"- Saved your profile as {user_name}_profile.npz :3\n")
 
     ######################
     # Generating Wrapped #
     ######################
     print("- And that's everything! Now just give me a moment to create your e621 Wrapped >:3c")
 
-    wrapped = Image.new("RGBA", (1080, 1080))
-
-    try:
-        fav_post = e621.get_post_thumb(post_by_scores[0], 400)
-        wrapped.paste(fav_post, (582, 608))
-    except:
-        pass
-
-    try:
-        user_pfp = e621.get_post_thumb(user_data["avatar_id"], 300)
-        wrapped.paste(user_pfp, (30, 13))
-    except:
-        pass
-
-    template = Image.open("template.png")
-    wrapped.paste(template, (0, 0), template)
-
-    favorites = [favorite_tags, favorite_species, favorite_artists, favorite_characters]
-    bounding_boxes = [
-        [(63, 451, 463, 541), (66, 556, 256, 626), (267, 556, 457, 626), (66, 639, 256, 709), (267, 639, 457, 709)],
-        [(63, 801, 463, 891), (66, 906, 256, 976), (267, 906, 457, 976)],
-        [(624, 111, 1024, 201), (627, 216, 817, 286), (828, 216, 1018, 285)],
-        [(624, 387, 1024, 477), (627, 492, 817, 562), (828, 492, 1018, 562)],
-    ]
-    for f_idx, favorite in enumerate(favorites):
-        for b_idx, bb in enumerate(bounding_boxes[f_idx]):
-            draw_favorite(favorite[b_idx], user_profile, bb, wrapped, b_idx == 0)
-
-    draw = ImageDraw.Draw(wrapped)
-
-    fontsize = 36
-    if len(user_name) > 11:
-        fontsize = 24
-    if len(user_name) > 18:
-        fontsize=12
-
-    font = ImageFont.truetype("fonts/liberation-fonts-ttf-2.1.5/LiberationSans-BoldItalic.ttf", size=fontsize)
-
-    x = int((bb[0] + bb[2]) / 2)
-    y = int((bb[1] + bb[3]) / 2)
-    draw.text(
-        (470, 65),
-        text=user_name,
-        font=font,
-        fill=(255, 255, 255),
-        anchor="mm",
-        align="center"
-    )
-
-    id_img = Image.new("RGBA", (1080, 1080))
-    id_center = (1040, 805)
-    draw = ImageDraw.Draw(id_img)
-    id_font = ImageFont.truetype("fonts/liberation-fonts-ttf-2.1.5/LiberationSans-BoldItalic.ttf", size=36)
-    draw.text(
-        (id_center[0] - 200, id_center[1]),
-        text=f"ID {post_by_scores[0]}",
-        font=font,
-        fill=(255, 255, 255),
-        anchor="mm",
-        align="center"
-    )
-    id_img = id_img.rotate(270, center=(id_center[0] - 200, id_center[1]))
-    id_img = id_img.transform(id_img.size, Image.AFFINE, (1, 0, -200, 0, 1, 0))
-    wrapped.paste(id_img, (0, 0), id_img)
-
-    wrapped.save(f"{user_name}.png")
+    fav_post, user_pfp, fav_post_id = get_thumbnails(e621, results, user_data["avatar_id"], get_renderer().thumbnails)
+    render_wrapped(results, user_name, fav_post, user_pfp, fav_post_id=fav_post_id)
 
     #############################
     # Plotting detailed results #
     #############################
     print(f"- Done! Your e621 Wrapped has been saved as {user_name}.png B3")
 
-    favorites = [favorite_tags, favorite_species, favorite_characters, favorite_artists]
-    titles = ["Favorite tags", "Favorite species", "Favorite characters", "Favorite artists", "Least favorite tags"]
-    fig, axes = plt.subplots(2, 3, figsize=(20, 12))
-    for i in range(4):
-        ax = axes[int(i / 3)][i % 3]
-        plot_tags(ax, favorites[i][:25], user_profile)
-        ax.set_title(titles[i])
-        ax.set_ylabel("Enjoyment")
-    
-    extras = [least_favorite_tags, post_by_scores]
-    titles = ["Least favorite tags", "Your likes in one post"]
-    override_user_profile = [least_favorite_tags_dict, post_scores]
-    ylabels = ["How much less present than the average", "Post score"]
-    for i in range(2):
-        ax = axes[int((i + 4) / 3)][(i + 4) % 3]
-        plot_tags(ax, extras[i][:25], user_profile, override_user_profile[i])
-        ax.set_title(titles[i])
-        ax.set_ylabel(ylabels[i])
-
-    plt.suptitle(f"{user_name}'s e621 Wrapped (detailed)")
-    plt.tight_layout()
-    plt.savefig(f"{user_name}_detailed.png")
+    plot_detailed(results, user_name)
 
     print(f"\n- Saved your detailed report as {user_name}_detailed.png :3")
-    print(f"\n- So you're into {favorite_tags[0].split(':')[1].replace('_', ' ')}, huh... ;3\n")
-
-    
\ No newline at end of file
+    print(f"\n- So you're into {results['favorite_tags'][0].split(':')[1].replace('_', ' ')}, huh... ;3\n")
@@ -1,29 +1,141 @@
-from e621_client import e621Client
+from e621_client import AsyncE621Client, e621Client
+from response_cache import ResponseCache
 from argparse import ArgumentParser
+import asyncio
 import json
+import os
+from tag_vocabulary import FavoritesMatrix
 from tqdm.auto import tqdm
 
 
 def get_user_interests(favs):
-    user_interests = {}
-    for fav in favs:
-        for topic in fav["tags"]:
-            for tag in fav["tags"][topic]:
-                tag_name = f"{topic}:{tag}"
-                if not tag_name in user_interests:
-                    user_interests[tag_name] = 0
-                user_interests[tag_name] += 1
-    
-    for tag in user_interests:
-        user_interests[tag] /= len(favs)
-    
-    return user_interests
+    favorites = FavoritesMatrix()
+    favorites.add_posts(favs)
+    return dict(zip(favorites.vocabulary.names, favorites.presence().tolist()))
 
 
 CREDENTIALS_FILE = "credentials.json"
 INTERESTS_FILE = "interests.json"
+AGGREGATE_FILE = "interests_aggregate.json"
+AGGREGATE_VERSION = 1
 
 MIN_FAVORITES = 100
+# How many users are analyzed between saves of the aggregate
+SAVE_EVERY = 20
+
+
+class InterestAggregate():
+    """
+        The average user profile as a sum of presences per tag and the amount of users summed, so adding
+        a user only touches the tags in their favorites. Aggregates of different users can be merged, and
+        the users (and finished pages) they contain are remembered so nobody is counted twice
+    """
+    def __init__(self):
+        self.sums = {}
+        self.user_ids = set()
+        self.skipped_ids = set()
+        self.pages = set()
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def has_user(self, user_id):
+        return user_id in self.user_ids or user_id in self.skipped_ids
+
+    def add_user(self, user_id, user_interests):
+        if user_id in self.user_ids:
+            return
+        for tag, presence in user_interests.items():
+            self.sums[tag] = self.sums.get(tag, 0.0) + presence
+        self.user_ids.add(user_id)
+
+    def skip_user(self, user_id):
+        """
+            Remembers a user that doesn't count towards the average (not enough favorites)
+        """
+        self.skipped_ids.add(user_id)
+
+    def merge(self, other):
+        """
+            Adds the users of another aggregate to this one
+        """
+        overlap = self.user_ids & other.user_ids
+        if len(overlap) > 0:
+            raise ValueError(f"Can't merge aggregates that share users ({len(overlap)} users, e.g. {min(overlap)})")
+        for tag, total in other.sums.items():
+            self.sums[tag] = self.sums.get(tag, 0.0) + total
+        self.user_ids |= other.user_ids
+        self.skipped_ids |= other.skipped_ids
+        self.pages |= other.pages
+
+    def interests(self):
+        """
+            The average presence of every tag, in the format of interests.json
+        """
+        total_users = len(self.user_ids)
+        return {tag: total / total_users for tag, total in self.sums.items()}
+
+    def save(self, path):
+        data = {
+            "version": AGGREGATE_VERSION,
+            "pages": sorted(self.pages),
+            "user_ids": sorted(self.user_ids),
+            "skipped_ids": sorted(self.skipped_ids),
+            "sums": self.sums
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as f:
+            data = json.load(f)
+        if data["version"] != AGGREGATE_VERSION:
+            raise ValueError(f"{path} is a version {data['version']} aggregate, but only version {AGGREGATE_VERSION} is supported")
+
+        aggregate = cls()
+        aggregate.sums = data["sums"]
+        aggregate.user_ids = set(data["user_ids"])
+        aggregate.skipped_ids = set(data["skipped_ids"])
+        aggregate.pages = set(data["pages"])
+        return aggregate
+
+
+def save_interests(aggregate, path=INTERESTS_FILE):
+    with open(path, 'w') as f:
+        json.dump(aggregate.interests(), f, indent=4)
+
+
+async def analyze_page(e621, aggregate, users, page_num, aggregate_path):
+    """
+        Adds every user of the page that isn't in the aggregate yet. The favorites of the next user are
+        fetched while the current one is being added, and the aggregate is saved every SAVE_EVERY users.
+        Returns whether every user of the page is now accounted for
+    """
+    pending = [user for user in users if not aggregate.has_user(user["id"])]
+    e621_async = AsyncE621Client(e621)
+    analyzed = 0
+    unresolved = 0
+    with tqdm(desc=f" Analyzing page {page_num + 1} of users", unit=" users", total=len(users), initial=len(users) - len(pending)) as progress:
+        async for idx, favs in e621_async.pipeline(lambda idx: (idx, e621.get_favorites(pending[idx]["id"], 0)), len(pending)):
+            progress.update(1)
+            user_id = pending[idx]["id"]
+            if favs is None:
+                # The request failed, so the user is tried again next time
+                unresolved += 1
+                continue
+            if len(favs) < MIN_FAVORITES:
+                aggregate.skip_user(user_id)
+                continue
+
+            aggregate.add_user(user_id, get_user_interests(favs))
+            analyzed += 1
+            if analyzed % SAVE_EVERY == 0:
+                aggregate.save(aggregate_path)
+    return unresolved == 0
+
 
 if __name__ == "__main__":
     parser = ArgumentParser(
@@ -31,38 +143,43 @@ if __name__ == "__main__":
         description="Generates medium tag interest from the favorites of top uploaders"
     )
     parser.add_argument("-p", "--pages", default=1, help="The amount of pages to look for users in. Each page contains 320 users (at least 1 second per user)")
+    parser.add_argument("-s", "--start-page", default=0, type=int, help="The first page to look for users in (starting at 0)")
+    parser.add_argument("-a", "--aggregate", default=AGGREGATE_FILE, help="Where the progress is kept. Running again with the same file only analyzes users that aren't in it yet")
+    parser.add_argument("--shard", default=None, help="K/N: only analyze every Nth user, starting at the Kth. Run N of these with different aggregate files and --merge them")
+    parser.add_argument("--merge", nargs="+", default=None, help="Merge these aggregates into --aggregate and write interests.json, without fetching anything")
+    parser.add_argument("--no-cache", action="store_true", help="Don't read or write the local response cache")
+    parser.add_argument("--refresh", action="store_true", help="Revalidate every cached response with e621 instead of trusting it")
     args = parser.parse_args()
 
-    e621 = e621Client(CREDENTIALS_FILE)
-    
-    interests = {}
-
-    total_users = 0
-    for i in range(int(args.pages)):
-        users = e621.get_top_users(i)
-        for user in tqdm(users, f" Analyzing page {i + 1} of users", unit=" users", total=len(users)):
-            favs = e621.get_favorites(user["id"], 0)
-
-            if len(favs) < MIN_FAVORITES:
-                continue
-
-            user_interests = get_user_interests(favs)
-            
-            for tag in user_interests:
-                if not tag in interests:
-                    interests[tag] = 0.0
-            
-            for tag in interests:
-                user_interest_in_tag = user_interests[tag] if tag in user_interests else 0.0
-                interests[tag] = (interests[tag] * total_users + user_interest_in_tag) / (total_users + 1)
-
-            total_users += 1
-    
-    with open(INTERESTS_FILE, 'w') as f:
-        json.dump(interests, f, indent=4)
-
-
+    aggregate = InterestAggregate.load(args.aggregate) if os.path.exists(args.aggregate) else InterestAggregate()
+    if len(aggregate) > 0:
+        print(f"- Found {len(aggregate)} users from last time in {args.aggregate}, so they won't be analyzed again :3")
 
+    if args.merge is not None:
+        for path in args.merge:
+            aggregate.merge(InterestAggregate.load(path))
+        aggregate.save(args.aggregate)
+        save_interests(aggregate)
+        print(f"- Merged {len(args.merge)} aggregates, interests.json now averages {len(aggregate)} users :3")
+        exit(0)
 
+    shard, total_shards = (int(part) for part in args.shard.split("/")) if args.shard is not None else (0, 1)
 
+    e621 = e621Client(CREDENTIALS_FILE, cache=None if args.no_cache else ResponseCache(), refresh=args.refresh)
 
+    for i in range(args.start_page, args.start_page + int(args.pages)):
+        if i in aggregate.pages:
+            continue
+        users = e621.get_top_users(i)
+        if len(users) == 0:
+            continue
+        complete = asyncio.run(analyze_page(e621, aggregate, users[shard::total_shards], i, args.aggregate))
+
+        # Every user of the page is in, so it can be skipped entirely next time. A shard only has part
+        # of the page, so it relies on the user ids instead
+        if complete and total_shards == 1:
+            aggregate.pages.add(i)
+        aggregate.save(args.aggregate)
+
+    if len(aggregate) > 0:
+        save_interests(aggregate)
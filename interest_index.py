@@ -0,0 +1,179 @@
+from argparse import ArgumentParser
+import json
+import os
+import numpy as np
+from tag_filters import TagFilter
+from tag_vocabulary import TagVocabulary
+
+
+INTERESTS_FILE = "interests.json"
+
+INDEX_VERSION = 1
+
+
+def index_path_for(interests_path):
+    """
+        The compiled index lives next to the JSON it was built from: interests.json -> interests.npz
+    """
+    return os.path.splitext(interests_path)[0] + ".npz"
+
+
+def _encode_lines(lines):
+    return np.frombuffer("\n".join(lines).encode("utf-8"), dtype=np.uint8)
+
+
+def _decode_lines(data):
+    text = data.tobytes().decode("utf-8")
+    return text.split("\n") if len(text) > 0 else []
+
+
+class GlobalInterests():
+    """
+        The average user profile as arrays indexed by tag id, in the order of interests.json: the presence
+        of each tag, its category, and whether tag_filter keeps it out of profiles. The lowest presence,
+        which tags the average user doesn't have get, is computed once
+    """
+    def __init__(self, names, presence, categories, category_names, excluded, tag_filter):
+        self.vocabulary = TagVocabulary.from_names(names)
+        self.presence = presence
+        self.categories = categories
+        self.category_names = category_names
+        self.excluded = excluded
+        self.tag_filter = tag_filter
+        self.min_presence = float(presence.min()) if len(presence) > 0 else 0.0
+
+    def __len__(self):
+        return len(self.presence)
+
+    def __contains__(self, tag):
+        return tag in self.vocabulary
+
+    def get(self, tag, default=None):
+        tag_id = self.vocabulary.get_id(tag)
+        return float(self.presence[tag_id]) if tag_id != -1 else default
+
+    def tag_ids(self, tags):
+        """
+            The id of each tag, -1 for the ones the average user profile doesn't have
+        """
+        return np.fromiter((self.vocabulary.get_id(tag) for tag in tags), dtype=np.int64, count=len(tags))
+
+    def in_categories(self, categories):
+        """
+            Bool array: whether each tag is in one of categories
+        """
+        category_ids = [idx for idx, name in enumerate(self.category_names) if name in categories]
+        return np.isin(self.categories, category_ids)
+
+    @classmethod
+    def from_dict(cls, interests, tag_filter=None):
+        tag_filter = tag_filter if tag_filter is not None else TagFilter()
+        names = list(interests)
+        category_names = list(dict.fromkeys(tag.split(":")[0] for tag in names))
+        category_ids = {name: idx for idx, name in enumerate(category_names)}
+        return cls(
+            names,
+            np.fromiter(interests.values(), dtype=np.float64, count=len(names)),
+            np.fromiter((category_ids[tag.split(":")[0]] for tag in names), dtype=np.uint8, count=len(names)),
+            category_names,
+            tag_filter.mask(names),
+            tag_filter
+        )
+
+    def save(self, index_path, source_stat):
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                version=np.array(INDEX_VERSION),
+                source=np.array([source_stat.st_mtime_ns, source_stat.st_size], dtype=np.int64),
+                exclude_words=_encode_lines(self.tag_filter.exclude_words),
+                names=_encode_lines(self.vocabulary.names),
+                presence=self.presence,
+                categories=self.categories,
+                category_names=_encode_lines(self.category_names),
+                excluded=self.excluded
+            )
+        os.replace(tmp_path, index_path)
+
+    @classmethod
+    def load(cls, index_path, tag_filter=None):
+        """
+            The exclusion mask saved in the index is used if it was made with the same words as tag_filter.
+            Otherwise only the mask is computed again
+        """
+        tag_filter = tag_filter if tag_filter is not None else TagFilter()
+        with np.load(index_path) as data:
+            names = _decode_lines(data["names"])
+            same_words = _decode_lines(data["exclude_words"]) == tag_filter.exclude_words
+            return cls(
+                names,
+                data["presence"],
+                data["categories"],
+                _decode_lines(data["category_names"]),
+                data["excluded"] if same_words else tag_filter.mask(names),
+                tag_filter
+            )
+
+
+def build_index(interests_path=INTERESTS_FILE, index_path=None, tag_filter=None):
+    """
+        Compiles interests.json into its index. Returns the GlobalInterests it saved
+    """
+    stat = os.stat(interests_path)
+    with open(interests_path, "r") as f:
+        global_interests = GlobalInterests.from_dict(json.load(f), tag_filter)
+    global_interests.save(index_path or index_path_for(interests_path), stat)
+    return global_interests
+
+
+def index_is_fresh(interests_path=INTERESTS_FILE, index_path=None):
+    """
+        Checks whether the index was built from the current interests.json (same mtime and size)
+    """
+    index_path = index_path or index_path_for(interests_path)
+    if not os.path.exists(index_path):
+        return False
+
+    try:
+        with np.load(index_path) as data:
+            if int(data["version"]) != INDEX_VERSION:
+                return False
+            mtime_ns, size = data["source"].tolist()
+    except (OSError, ValueError, KeyError):
+        return False
+
+    stat = os.stat(interests_path)
+    return stat.st_mtime_ns == mtime_ns and stat.st_size == size
+
+
+def load_interests(interests_path=INTERESTS_FILE, index_path=None, tag_filter=None):
+    """
+        Returns the GlobalInterests of interests.json, compiling it first if it changed since the last time
+    """
+    index_path = index_path or index_path_for(interests_path)
+    if not index_is_fresh(interests_path, index_path):
+        print(f"- Compiling {interests_path}. This only happens when it changes :3")
+        return build_index(interests_path, index_path, tag_filter)
+    return GlobalInterests.load(index_path, tag_filter)
+
+
+if __name__ == "__main__":
+    from tag_filters import add_exclusion_arguments, tag_filter_from_args
+
+    parser = ArgumentParser(
+        prog="Interest index",
+        description="Compiles the average user profile into arrays that load without parsing the JSON"
+    )
+    parser.add_argument("-i", "--input", default=INTERESTS_FILE, help="The average user profile made by interest_generator.py")
+    parser.add_argument("-o", "--output", default=None, help="Where to write the index (next to the input by default)")
+    parser.add_argument("-f", "--force", action="store_true", help="Rebuild even if the index is up to date")
+    add_exclusion_arguments(parser)
+    args = parser.parse_args()
+
+    output = args.output or index_path_for(args.input)
+    if args.force or not index_is_fresh(args.input, output):
+        build_index(args.input, output, tag_filter_from_args(args))
+        print(f"- Built {output} :3")
+    else:
+        print(f"- {output} is already up to date :3")
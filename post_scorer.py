@@ -0,0 +1,111 @@
+import numpy as np
+from tag_vocabulary import TagVocabulary
+
+
+TAG_COUNT_PENALTY = 0.2
+SCORE_BONUS = 0.1
+# Posts scored at once, which bounds the size of the temporary arrays
+SCORE_BLOCK_SIZE = 4096
+
+
+class PostScorer():
+    """
+        Scores posts against a user profile. The profile, the category weights and the favorite tag
+        lists are folded once into a tag id -> weighted enjoyment array, so scoring a page of posts
+        is a sparse matrix-vector product instead of list scans per tag
+    """
+    def __init__(self, user_profile, weights, favorite_tag_categories, vocabulary=None):
+        self.vocabulary = vocabulary if vocabulary is not None else TagVocabulary()
+        self.favorite_tag_categories = favorite_tag_categories
+
+        tag_weights = {}
+        tag_categories = {}
+        tag_ranks = {}
+        for category, favorites in enumerate(favorite_tag_categories):
+            for rank, tag in enumerate(favorites):
+                tag_id = self.vocabulary.add(tag)
+                tag_weights[tag_id] = tag_weights.get(tag_id, 0.0) + weights[category] * user_profile[tag]["enjoyment"]
+                if not tag_id in tag_categories:
+                    tag_categories[tag_id] = category
+                    tag_ranks[tag_id] = rank
+
+        self.tag_weights = np.zeros(len(self.vocabulary))
+        self.tag_categories = np.full(len(self.vocabulary), -1, dtype=np.int32)
+        self.tag_ranks = np.zeros(len(self.vocabulary), dtype=np.int32)
+        for tag_id in tag_weights:
+            self.tag_weights[tag_id] = tag_weights[tag_id]
+            self.tag_categories[tag_id] = tag_categories[tag_id]
+            self.tag_ranks[tag_id] = tag_ranks[tag_id]
+
+    def _lookup(self, table, indices, fill):
+        """
+            Gathers table[indices], treating ids the scorer has never seen (or -1) as fill
+        """
+        known = (indices >= 0) & (indices < len(table))
+        values = np.full(len(indices), fill, dtype=table.dtype)
+        values[known] = table[indices[known]]
+        return values
+
+    def _score(self, indices, indptr, post_scores, return_best_tags):
+        total_posts = len(indptr) - 1
+        tag_counts = np.diff(indptr)
+        rows = np.repeat(np.arange(total_posts), tag_counts)
+
+        # Sparse matrix-vector product: each post adds up the weighted enjoyment of its tags
+        score = np.bincount(rows, weights=self._lookup(self.tag_weights, indices, 0.0), minlength=total_posts)
+
+        penalty = np.power(np.maximum(tag_counts, 1), TAG_COUNT_PENALTY)
+        bonus = np.where(post_scores > 0, np.power(np.maximum(post_scores, 1), SCORE_BONUS), 0.0)
+        final_scores = score / penalty * bonus
+        if not return_best_tags:
+            return final_scores
+
+        # The best tag of each category is the highest ranked favorite that the post contains
+        categories = self._lookup(self.tag_categories, indices, -1)
+        matched = categories >= 0
+        best_ranks = np.full((total_posts, len(self.favorite_tag_categories)), np.iinfo(np.int32).max, dtype=np.int32)
+        np.minimum.at(best_ranks, (rows[matched], categories[matched]), self._lookup(self.tag_ranks, indices, 0)[matched])
+
+        best_tags = []
+        for post_ranks in best_ranks.tolist():
+            post_best_tags = []
+            for category, rank in enumerate(post_ranks):
+                if rank < len(self.favorite_tag_categories[category]):
+                    post_best_tags.append(self.favorite_tag_categories[category][rank].split(":")[1])
+            best_tags.append(post_best_tags)
+        return final_scores, best_tags
+
+    def score_matrix(self, fav_matrix, return_best_tags=False):
+        """
+            Scores every post in a FavoritesMatrix. It must share this scorer's vocabulary
+        """
+        scores = []
+        best_tags = []
+        for indices, indptr, post_scores in fav_matrix.row_blocks(SCORE_BLOCK_SIZE):
+            result = self._score(indices, indptr, post_scores, return_best_tags)
+            if return_best_tags:
+                scores.append(result[0])
+                best_tags.extend(result[1])
+            else:
+                scores.append(result)
+
+        scores = np.concatenate(scores) if len(scores) > 0 else np.zeros(0)
+        if return_best_tags:
+            return scores, best_tags
+        return scores
+
+    def score_posts(self, posts, return_best_tags=False):
+        """
+            Scores a page of API posts in one batch, without modifying them
+        """
+        indices = []
+        indptr = [0]
+        post_scores = []
+        for post in posts:
+            for topic in post["tags"]:
+                for tag in post["tags"][topic]:
+                    indices.append(self.vocabulary.get_id(f"{topic}:{tag}"))
+            indptr.append(len(indices))
+            post_scores.append(post["score"]["total"])
+
+        return self._score(np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64), np.array(post_scores, dtype=np.int64), return_best_tags)
@@ -0,0 +1,226 @@
+from argparse import ArgumentParser
+import json
+import os
+import numpy as np
+
+
+PROFILE_VERSION = 1
+
+
+def _join(strings):
+    return np.frombuffer("\n".join(strings).encode("utf-8"), dtype=np.uint8)
+
+
+def _split(array):
+    text = array.tobytes().decode("utf-8")
+    return text.split("\n") if len(text) > 0 else []
+
+
+class Profile():
+    """
+        A user profile as saved by e621_wrapped.py. Profiles loaded from disk are stored as a versioned .npz
+        (an interned tag table plus flat arrays) and every part is only decoded the first time it's used,
+        so e.g. the recommender never builds the full tag dict unless it needs it
+    """
+    def __init__(self, user_profile=None, weights=None, favorites=None, fav_ids=None, set_id=None, set_posts=None, seen_posts=None):
+        self.values = {}
+        self.data = None
+        for name, value in [("user_profile", user_profile), ("weights", weights), ("favorites", favorites)]:
+            if value is not None:
+                self.values[name] = value
+        if fav_ids is not None:
+            self.values["fav_ids"] = np.unique(np.asarray(fav_ids, dtype=np.int64))
+        if set_posts is not None:
+            self.values["set_posts"] = np.unique(np.asarray(set_posts, dtype=np.int64))
+        if seen_posts is not None:
+            self.values["seen_posts"] = np.unique(np.asarray(seen_posts, dtype=np.int64))
+        self.set_id = set_id
+
+    def _get(self, name):
+        if not name in self.values:
+            self.values[name] = getattr(self, f"_decode_{name}")()
+        return self.values[name]
+
+    def _tags(self):
+        if not "tags" in self.values:
+            self.values["tags"] = _split(self.data["tags"])
+        return self.values["tags"]
+
+    def _decode_user_profile(self):
+        presence = self.data["presence"].tolist()
+        relative_presence = self.data["relative_presence"].tolist()
+        enjoyment = self.data["enjoyment"].tolist()
+        return {
+            tag: {"presence": presence[idx], "relative_presence": relative_presence[idx], "enjoyment": enjoyment[idx]}
+            for idx, tag in enumerate(self._tags())
+        }
+
+    def _decode_weights(self):
+        return self.data["weights"].tolist()
+
+    def _decode_favorites(self):
+        tags = self._tags()
+        indices = self.data["favorites_indices"].tolist()
+        indptr = self.data["favorites_indptr"].tolist()
+        return [[tags[idx] for idx in indices[indptr[i]:indptr[i + 1]]] for i in range(len(indptr) - 1)]
+
+    def _decode_fav_ids(self):
+        return self.data["fav_ids"]
+
+    def _decode_set_posts(self):
+        if self.data is None:
+            return np.zeros(0, dtype=np.int64)
+        return self.data["set_posts"]
+
+    def _decode_seen_posts(self):
+        # Profiles saved before the recommender remembered what it saw don't have it
+        if self.data is None or not "seen_posts" in self.data.files:
+            return np.zeros(0, dtype=np.int64)
+        return self.data["seen_posts"]
+
+    @property
+    def user_profile(self):
+        return self._get("user_profile")
+
+    @property
+    def weights(self):
+        return self._get("weights")
+
+    @property
+    def favorites(self):
+        return self._get("favorites")
+
+    @property
+    def fav_ids(self):
+        return self._get("fav_ids")
+
+    @property
+    def set_posts(self):
+        return self._get("set_posts")
+
+    @set_posts.setter
+    def set_posts(self, posts):
+        self.values["set_posts"] = np.unique(np.asarray(posts, dtype=np.int64))
+
+    @property
+    def seen_posts(self):
+        """
+            Every post the recommender already looked at for this profile
+        """
+        return self._get("seen_posts")
+
+    @seen_posts.setter
+    def seen_posts(self, posts):
+        self.values["seen_posts"] = np.unique(np.asarray(posts, dtype=np.int64))
+
+    def close(self):
+        """
+            Closes the file a loaded profile reads from. Only what was already used is still there afterwards
+        """
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+
+    def has_favorite(self, post_id):
+        idx = np.searchsorted(self.fav_ids, post_id)
+        return idx < len(self.fav_ids) and self.fav_ids[idx] == post_id
+
+    def save(self, path):
+        # Everything is read before writing, since path may be the file this profile was loaded from
+        tags = list(self.user_profile.keys())
+        tag_ids = {tag: idx for idx, tag in enumerate(tags)}
+        favorites_indices = [tag_ids[tag] for favorites in self.favorites for tag in favorites]
+        arrays = {
+            "version": np.array(PROFILE_VERSION),
+            "tags": _join(tags),
+            "presence": np.array([self.user_profile[tag]["presence"] for tag in tags], dtype=np.float64),
+            "relative_presence": np.array([self.user_profile[tag]["relative_presence"] for tag in tags], dtype=np.float64),
+            "enjoyment": np.array([self.user_profile[tag]["enjoyment"] for tag in tags], dtype=np.float64),
+            "weights": np.array(self.weights, dtype=np.float64),
+            "favorites_indices": np.array(favorites_indices, dtype=np.int32),
+            "favorites_indptr": np.cumsum([0] + [len(favorites) for favorites in self.favorites]).astype(np.int64),
+            "fav_ids": np.asarray(self.fav_ids),
+            "set_id": np.array(self.set_id if self.set_id is not None else -1),
+            "set_posts": np.asarray(self.set_posts),
+            "seen_posts": np.asarray(self.seen_posts)
+        }
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(f, **arrays)
+        self.close()
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+            Opens a .npz profile. Arrays are read from the file as they are needed
+        """
+        data = np.load(path)
+        version = int(data["version"])
+        if version != PROFILE_VERSION:
+            raise ValueError(f"{path} is a version {version} profile, but only version {PROFILE_VERSION} is supported")
+
+        profile = cls()
+        profile.data = data
+        set_id = int(data["set_id"])
+        profile.set_id = set_id if set_id != -1 else None
+        return profile
+
+    def to_json(self):
+        """
+            The profile in the layout of the old {user_name}_profile.json
+        """
+        profile = {
+            "profile": self.user_profile,
+            "weights": self.weights,
+            "favorites": self.favorites,
+            "fav_dict": {str(post_id): True for post_id in self.fav_ids.tolist()}
+        }
+        if self.set_id is not None:
+            profile["set"] = {"id": self.set_id, "posts": self.set_posts.tolist()}
+        if len(self.seen_posts) > 0:
+            profile["seen"] = self.seen_posts.tolist()
+        return profile
+
+    @classmethod
+    def from_json(cls, profile):
+        return cls(
+            user_profile=profile["profile"],
+            weights=profile["weights"],
+            favorites=profile["favorites"],
+            fav_ids=[int(post_id) for post_id in profile["fav_dict"]],
+            set_id=profile["set"]["id"] if "set" in profile else None,
+            set_posts=[int(post_id) for post_id in profile["set"]["posts"]] if "set" in profile else [],
+            seen_posts=profile.get("seen", [])
+        )
+
+
+def load_profile(path):
+    """
+        Loads a .npz profile, or an old .json one
+    """
+    if path.endswith(".json"):
+        with open(path, "r") as f:
+            return Profile.from_json(json.load(f))
+    return Profile.load(path)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        prog="Profile export",
+        description="Converts profiles between the binary .npz format and JSON"
+    )
+    parser.add_argument("input", help="The profile to convert (.npz or .json)")
+    parser.add_argument("-o", "--output", default=None, help="Where to write the converted profile. Defaults to the input with the other extension")
+    args = parser.parse_args()
+
+    profile = load_profile(args.input)
+    if args.input.endswith(".json"):
+        output = args.output if args.output is not None else args.input[:-len(".json")] + ".npz"
+        profile.save(output)
+    else:
+        output = args.output if args.output is not None else args.input[:-len(".npz")] + ".json"
+        with open(output, "w") as f:
+            json.dump(profile.to_json(), f, indent=4)
+    print(f"- Saved {output} :3")
@@ -0,0 +1,154 @@
+from abc import ABC, abstractmethod
+from email.utils import parsedate_to_datetime
+import os
+import struct
+import tempfile
+import threading
+import time
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+
+RATE_LIMITED_STATUSES = [429, 503]
+# How much slower we go after being told to back off, and how fast we recover afterwards
+BACKOFF_FACTOR = 2.0
+RECOVERY_FACTOR = 0.9
+MAX_INTERVAL = 60.0
+SHARED_RATE_LIMIT_FILE = os.path.join(tempfile.gettempdir(), "e621_wrapped_rate_limit")
+
+
+def parse_retry_after(value):
+    """
+        Returns the seconds to wait from a Retry-After header, which is either a number or an HTTP date
+    """
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter(ABC):
+    """
+        Base rate limiter. It works like a token bucket, tracked as the time at which the bucket will be
+        full again (GCRA), so a request can reserve its slot and sleep without holding any lock.
+        Subclasses only decide where that state lives
+    """
+    def __init__(self, interval=1.0, burst=1):
+        self.base_interval = interval
+        self.burst = burst
+
+    @abstractmethod
+    def _locked(self, update):
+        """
+            Runs update(state, now) -> (new_state, result) atomically and returns result
+        """
+
+    def _recover(self, tat, interval, now):
+        """
+            The interval to use now. After a whole interval without any request, whatever made us back off
+            is over, so the configured rate is used again instead of recovering one response at a time
+        """
+        return self.base_interval if now >= tat + interval else interval
+
+    def _reserve(self, state, now):
+        # state: (theoretical arrival time, current interval)
+        tat, interval = state
+        interval = self._recover(tat, interval, now)
+        # Another process may share this state with a slower configured rate
+        interval = max(interval, self.base_interval)
+        tolerance = (self.burst - 1) * interval
+        tat = max(tat, now)
+        wait = max(0.0, tat - tolerance - now)
+        return (tat + interval, interval), wait
+
+    def acquire(self):
+        """
+            Blocks until a request can be sent
+        """
+        wait = self._locked(self._reserve)
+        if wait > 0:
+            time.sleep(wait)
+
+    def on_response(self, status_code, retry_after=None):
+        """
+            Slows down (and honors Retry-After) when the server says we're going too fast, and slowly
+            goes back to the configured rate otherwise
+        """
+        def update(state, now):
+            tat, interval = state
+            interval = self._recover(tat, interval, now)
+            if status_code in RATE_LIMITED_STATUSES:
+                interval = min(MAX_INTERVAL, max(interval * BACKOFF_FACTOR, self.base_interval))
+                pause = retry_after if retry_after is not None else interval
+                tat = max(tat, now + pause + (self.burst - 1) * interval)
+            else:
+                interval = max(self.base_interval, interval * RECOVERY_FACTOR)
+            return (tat, interval), None
+        self._locked(update)
+
+
+class TokenBucketRateLimiter(RateLimiter):
+    """
+        Rate limiter for a single process. Threads of that process share its budget
+    """
+    def __init__(self, interval=1.0, burst=1):
+        super().__init__(interval, burst)
+        self.lock = threading.Lock()
+        self.state = (0.0, interval)
+
+    def _locked(self, update):
+        with self.lock:
+            self.state, result = update(self.state, time.monotonic())
+        return result
+
+
+class SharedRateLimiter(RateLimiter):
+    """
+        Rate limiter whose state lives in a small locked file, so every process on the machine that
+        uses the same file shares one budget
+    """
+    STATE = struct.Struct("<dd")
+
+    def __init__(self, interval=1.0, burst=1, path=SHARED_RATE_LIMIT_FILE):
+        super().__init__(interval, burst)
+        self.path = path
+        self.thread_lock = threading.Lock()
+
+    def _lock_file(self, f):
+        if os.name == "nt":
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    def _unlock_file(self, f):
+        if os.name == "nt":
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _locked(self, update):
+        with self.thread_lock:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+            with os.fdopen(fd, "r+b") as f:
+                self._lock_file(f)
+                try:
+                    data = f.read(self.STATE.size)
+                    state = self.STATE.unpack(data) if len(data) == self.STATE.size else (0.0, self.base_interval)
+                    state, result = update(state, time.time())
+                    f.seek(0)
+                    f.write(self.STATE.pack(*state))
+                    f.flush()
+                finally:
+                    self._unlock_file(f)
+        return result
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+
+CACHE_FILE = "cache/e621_responses.sqlite3"
+MAX_CACHE_BYTES = 256 * 2**20
+
+# Seconds each kind of response stays fresh. Anything that doesn't match isn't cached
+ENDPOINT_TTLS = [
+    (re.compile(r"^/favorites\.json$"), 60 * 60),
+    (re.compile(r"^/users/\d+\.json$"), 24 * 60 * 60),
+    (re.compile(r"^/users\.json$"), 24 * 60 * 60),
+    (re.compile(r"^/posts/\d+\.json$"), 24 * 60 * 60),
+    (re.compile(r"^/post_sets/\d+\.json$"), 60),
+    (re.compile(r"^/data/"), 30 * 24 * 60 * 60),
+]
+# Queries whose result changes on every request, no matter the TTL
+UNCACHEABLE_QUERIES = ["order:random"]
+
+
+class CachedResponse():
+    """
+        The parts of requests.Response the client uses, rebuilt from the cache
+    """
+    def __init__(self, status_code, headers, content, fresh):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.fresh = fresh
+
+    def json(self):
+        return json.loads(self.content)
+
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+    def validators(self):
+        """
+            Headers for a conditional request that revalidates this response
+        """
+        headers = {}
+        if "ETag" in self.headers:
+            headers["If-None-Match"] = self.headers["ETag"]
+        if "Last-Modified" in self.headers:
+            headers["If-Modified-Since"] = self.headers["Last-Modified"]
+        return headers
+
+
+class ResponseCache():
+    """
+        Persistent, size bounded (LRU) cache of successful GET responses, stored in SQLite
+    """
+    def __init__(self, path=CACHE_FILE, max_bytes=MAX_CACHE_BYTES, ttls=ENDPOINT_TTLS):
+        if os.path.dirname(path) != "":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttls = ttls
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                status INTEGER,
+                headers TEXT,
+                body BLOB,
+                stored_at REAL,
+                expires_at REAL,
+                accessed_at REAL,
+                size INTEGER
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self.db.commit()
+
+    def ttl(self, url):
+        """
+            Returns how long a response for this URL stays fresh, or None if it shouldn't be cached
+        """
+        parts = urlsplit(url)
+        for query in UNCACHEABLE_QUERIES:
+            if query in parts.query:
+                return None
+        for pattern, ttl in self.ttls:
+            if pattern.match(parts.path):
+                return ttl
+        return None
+
+    def key(self, url, identity):
+        """
+            Normalizes the URL (lowercase host, sorted query) and ties it to whoever is asking, since
+            authenticated users can see private favorites
+        """
+        parts = urlsplit(url)
+        query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+        normalized = urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, query, ""))
+        return f"{identity}|{normalized}"
+
+    def get(self, key):
+        with self.lock:
+            row = self.db.execute("SELECT status, headers, body, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            self.db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.db.commit()
+
+        status, headers, body, expires_at = row
+        return CachedResponse(status, json.loads(headers), body, now < expires_at)
+
+    def put(self, key, url, response, body=None):
+        """
+            Stores a successful response. body is its content, for responses that were streamed
+        """
+        ttl = self.ttl(url)
+        if ttl is None or response.status_code != 200:
+            return
+
+        # Only what's needed to serve and revalidate it
+        headers = {name: response.headers[name] for name in ["Content-Type", "ETag", "Last-Modified"] if name in response.headers}
+        body = response.content if body is None else body
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, response.status_code, json.dumps(headers), body, now, now + ttl, now, len(body))
+            )
+            self._evict()
+            self.db.commit()
+
+    def revalidated(self, key, url):
+        """
+            The server answered 304 Not Modified, so the stored response is fresh again
+        """
+        ttl = self.ttl(url)
+        if ttl is None:
+            return
+        now = time.time()
+        with self.lock:
+            self.db.execute("UPDATE responses SET stored_at = ?, expires_at = ?, accessed_at = ? WHERE key = ?", (now, now + ttl, now, key))
+            self.db.commit()
+
+    def _evict(self):
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        while total > self.max_bytes:
+            rows = self.db.execute("SELECT key, size FROM responses ORDER BY accessed_at LIMIT 64").fetchall()
+            if len(rows) == 0:
+                break
+            for key, size in rows:
+                self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+    def clear(self):
+        with self.lock:
+            self.db.execute("DELETE FROM responses")
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+def credential_identity(auth):
+    """
+        Short, non-reversible id for a set of credentials, so the cache never stores the API key
+    """
+    if auth is None:
+        return "anonymous"
+    return hashlib.sha256(f"{auth[0]}:{auth[1]}".encode("utf-8")).hexdigest()[:16]
@@ -0,0 +1,99 @@
+import asyncio
+import time
+import numpy as np
+
+
+# The most posts sent in one request. A set holds up to 10,000 posts, so a few requests fill any of them
+SET_BATCH_SIZE = 1000
+# Queued posts are sent once the oldest of them has waited this long, even if there aren't enough for a batch
+SET_FLUSH_SECONDS = 60
+
+
+class SetSync():
+    """
+        Adds recommendations to a set in the background. Posts are queued as they are found and sent in
+        batches, once there are batch_size of them or the oldest has waited flush_seconds, instead of one
+        request per page. posts is every post known to be in the set (it's kept in the profile), and none
+        of them is ever sent again
+    """
+    def __init__(self, e621_async, set_id, posts=None, batch_size=SET_BATCH_SIZE, flush_seconds=SET_FLUSH_SECONDS, quiet=False):
+        self.e621_async = e621_async
+        self.set_id = set_id
+        self.posts = np.unique(np.asarray(posts if posts is not None else [], dtype=np.int64))
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.quiet = quiet
+        self.queued = []
+        # The batch that's being sent right now
+        self.sending = []
+        self.queued_since = None
+        self.flushing = None
+        self.requests = 0
+        self.added = 0
+
+    async def reconcile(self):
+        """
+            Fetches the posts in the set once and adds them to posts, so what was added to it some other way
+            (or by a run that didn't get to save the profile) isn't sent again. Posts that were taken out of
+            the set stay in posts, so they aren't added back. Returns whether the set could be fetched
+        """
+        set_posts = await self.e621_async.get_set_posts(self.set_id)
+        if set_posts is None:
+            return False
+        self.posts = np.union1d(self.posts, np.asarray(set_posts, dtype=np.int64))
+        return True
+
+    def due(self):
+        return len(self.queued) >= self.batch_size or (self.queued_since is not None and time.monotonic() - self.queued_since >= self.flush_seconds)
+
+    def add(self, post_ids):
+        """
+            Queues the posts that aren't in the set or queued already, and starts sending them if it's time
+        """
+        new = np.asarray(list(dict.fromkeys(post_ids)), dtype=np.int64)
+        new = new[~(np.isin(new, self.posts) | np.isin(new, self.queued + self.sending))]
+        if len(new) > 0 and len(self.queued) == 0:
+            self.queued_since = time.monotonic()
+        self.queued.extend(new.tolist())
+
+        if (self.flushing is None or self.flushing.done()) and self.due():
+            # Only a batch that waited long enough goes out before it's full
+            self.flushing = asyncio.ensure_future(self.flush(everything=len(self.queued) < self.batch_size))
+
+    async def flush(self, everything=True):
+        """
+            Sends the queued posts, batch_size at a time. Unless everything, the last batch is left queued if
+            it isn't full. Posts that couldn't be added are queued again
+        """
+        failed = []
+        while len(self.queued) > 0 and (everything or len(self.queued) >= self.batch_size):
+            self.sending = self.queued[:self.batch_size]
+            del self.queued[:self.batch_size]
+            self.requests += 1
+            if await self.e621_async.add_posts_to_set(self.set_id, self.sending):
+                self.posts = np.union1d(self.posts, np.asarray(self.sending, dtype=np.int64))
+                self.added += len(self.sending)
+            else:
+                failed.extend(self.sending)
+            self.sending = []
+
+        self.queued = failed + self.queued
+        if len(failed) > 0:
+            self.queued_since = time.monotonic()
+        elif len(self.queued) == 0:
+            self.queued_since = None
+
+    async def close(self):
+        """
+            Waits for the batch that's being sent and sends everything that's still queued. Returns the posts
+            that couldn't be added
+        """
+        if self.flushing is not None:
+            await self.flushing
+        if len(self.queued) > 0:
+            await self.flush()
+        if not self.quiet:
+            print(f"- Added {self.added} posts to your set in {self.requests} requests :3")
+            if len(self.queued) > 0:
+                print(f"- I couldn't add {len(self.queued)} of them, sorry <:3c")
+        return self.queued
@@ -0,0 +1,95 @@
+import os
+import re
+import numpy as np
+
+
+EXCLUSIONS_FILE = "exclusions.txt"
+EXCLUDE_WORDS = ["male", "anthro", "female"]
+# Up to this many words, each one is looked for on its own with str.find, which is faster than the
+# regular expression until there are a lot of them
+FIND_WORDS_LIMIT = 100
+
+
+def trie_pattern(words):
+    """
+        A regular expression that matches any of words, nested like a trie (e.g. "f(?:emale|oo)") so a tag is
+        scanned once however many words there are, instead of once per word
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def pattern(node):
+        if "" in node:
+            # A shorter word already matched, longer ones with the same start don't matter
+            return ""
+        branches = [re.escape(char) + pattern(child) for char, child in sorted(node.items())]
+        return branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    return pattern(trie)
+
+
+def load_exclude_words(path):
+    """
+        One word per line. Empty lines and lines starting with # are skipped
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if len(line.strip()) > 0 and not line.strip().startswith("#")]
+
+
+class TagFilter():
+    """
+        Leaves out every tag that contains one of exclude_words (e.g. "male" also leaves out "female" and
+        "male/female"), which are too common to say anything about someone's taste
+    """
+    def __init__(self, exclude_words=EXCLUDE_WORDS):
+        self.exclude_words = list(dict.fromkeys(word for word in exclude_words if len(word) > 0))
+        self.pattern = re.compile(trie_pattern(self.exclude_words)) if len(self.exclude_words) > 0 else None
+
+    def is_excluded(self, tag):
+        return self.pattern is not None and self.pattern.search(tag) is not None
+
+    def mask(self, tags):
+        """
+            Bool array: whether each of tags is excluded
+        """
+        mask = np.zeros(len(tags), dtype=bool)
+        if self.pattern is None or len(tags) == 0:
+            return mask
+
+        # Every tag is searched at once, joined by newlines, which words can't contain
+        text = "\n".join(tags)
+        if len(self.exclude_words) <= FIND_WORDS_LIMIT:
+            positions = []
+            for word in self.exclude_words:
+                position = text.find(word)
+                while position != -1:
+                    positions.append(position)
+                    # The rest of this tag doesn't matter anymore
+                    tag_end = text.find("\n", position)
+                    position = text.find(word, tag_end + 1) if tag_end != -1 else -1
+        else:
+            positions = [match.start() for match in self.pattern.finditer(text)]
+
+        lengths = np.fromiter((len(tag) + 1 for tag in tags), dtype=np.int64, count=len(tags))
+        starts = np.cumsum(lengths) - lengths
+        mask[np.searchsorted(starts, np.asarray(positions, dtype=np.int64), side="right") - 1] = True
+        return mask
+
+    def keep(self, tags):
+        """
+            The tags that aren't excluded, in the same order
+        """
+        return [tag for tag in tags if not self.is_excluded(tag)]
+
+
+def add_exclusion_arguments(parser):
+    parser.add_argument("--exclude", default=[], nargs="*", help="More words to leave out tags with, on top of the exclusions file")
+    parser.add_argument("--exclusions", default=EXCLUSIONS_FILE, help=f"A file with the words to leave out tags with, one per line. Without it, tags with {', '.join(EXCLUDE_WORDS)} are left out")
+
+
+def tag_filter_from_args(args):
+    exclude_words = load_exclude_words(args.exclusions) if os.path.exists(args.exclusions) else EXCLUDE_WORDS
+    return TagFilter(exclude_words + args.exclude)
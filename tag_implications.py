@@ -0,0 +1,213 @@
+from argparse import ArgumentParser
+import bisect
+import csv
+import hashlib
+import mmap
+import os
+import struct
+
+
+TAG_IMPLICATIONS_FILE = "data/tag_implications.csv"
+TAG_IMPLICATIONS_INDEX_FILE = "data/tag_implications.idx"
+
+INDEX_MAGIC = b"E6TI"
+INDEX_VERSION = 2
+# magic, version, csv mtime (ns), csv size, csv sha256, tag count, name blob size
+INDEX_HEADER = struct.Struct("<4sIqq32sII")
+
+
+def compute_tag_to_parent(csv_path):
+    """
+        Computes the transitive closure of the active tag implications, mapping every tag to the
+        top-most tag it implies. This gives the exact parents of the fixpoint loop the Wrapped used to
+        run, which decides between several top-most tags by the order it merges them in. Each tag keeps
+        its implicators in an ordered set instead of a list, so every pass is linear
+    """
+    # consequent -> its implicators, both in the order they first appear in the CSV
+    implication_dict = {}
+    with open(csv_path, "r", encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        antecedent_idx = header.index("antecedent_name")
+        consequent_idx = header.index("consequent_name")
+        status_idx = header.index("status")
+        for row in reader:
+            if row[status_idx] != "active":
+                continue
+            implication_dict.setdefault(row[consequent_idx], {})[row[antecedent_idx]] = None
+
+    changed = True
+    while changed:
+        # If a <- b <- c, simplifies it to a <- b, c. When b is implied by several tags, the last one wins
+        to_change = {}
+        for tag, implicators in implication_dict.items():
+            for implicator_tag in implicators:
+                if implicator_tag in implication_dict:
+                    to_change[implicator_tag] = tag
+        changed = len(to_change) > 0
+
+        for tag, parent in to_change.items():
+            implication_dict[parent].update(dict.fromkeys(implication_dict[tag]))
+            implication_dict[tag] = {}
+
+        implication_dict = {tag: implicators for tag, implicators in implication_dict.items() if len(implicators) > 0}
+
+    tag_to_parent = {}
+    for tag, implicators in implication_dict.items():
+        tag_to_parent[tag] = tag
+        for implicator_tag in implicators:
+            tag_to_parent[implicator_tag] = tag
+
+    return tag_to_parent
+
+
+def _hash_file(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.digest()
+
+
+def build_index(csv_path=TAG_IMPLICATIONS_FILE, index_path=TAG_IMPLICATIONS_INDEX_FILE):
+    """
+        Writes the tag implication closure as a binary index: a sorted, interned table of tag names
+        followed by an int32 array with the position of each tag's parent in that same table
+    """
+    tag_to_parent = compute_tag_to_parent(csv_path)
+
+    names = sorted(tag.encode("utf-8") for tag in tag_to_parent)
+    positions = {name: idx for idx, name in enumerate(names)}
+    offsets = [0]
+    for name in names:
+        offsets.append(offsets[-1] + len(name))
+    parents = [positions[tag_to_parent[name.decode("utf-8")].encode("utf-8")] for name in names]
+    blob = b"".join(names)
+
+    stat = os.stat(csv_path)
+    header = INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, stat.st_mtime_ns, stat.st_size, _hash_file(csv_path), len(names), len(blob))
+
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(struct.pack(f"<{len(offsets)}i", *offsets))
+        f.write(struct.pack(f"<{len(parents)}i", *parents))
+        f.write(blob)
+    os.replace(tmp_path, index_path)
+
+
+class _NameTable():
+    """
+        Sequence view over the names blob so bisect can search it without decoding every name
+    """
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        return bytes(self.blob[self.offsets[idx]:self.offsets[idx + 1]])
+
+
+class TagImplicationIndex():
+    """
+        Read-only, memory-mapped mapping of tag name -> top-most implied tag name
+    """
+    def __init__(self, index_path):
+        with open(index_path, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, _, _, _, count, blob_size = INDEX_HEADER.unpack_from(self.mmap, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            self.mmap.close()
+            raise ValueError(f"{index_path} is not a valid tag implication index")
+
+        view = memoryview(self.mmap)
+        start = INDEX_HEADER.size
+        offsets = view[start:start + 4 * (count + 1)].cast("i")
+        start += 4 * (count + 1)
+        self.parents = view[start:start + 4 * count].cast("i")
+        start += 4 * count
+        self.names = _NameTable(view[start:start + blob_size], offsets)
+
+    def _find(self, tag):
+        key = tag.encode("utf-8")
+        idx = bisect.bisect_left(self.names, key)
+        if idx < len(self.names) and self.names[idx] == key:
+            return idx
+        return -1
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, tag):
+        return self._find(tag) != -1
+
+    def __getitem__(self, tag):
+        idx = self._find(tag)
+        if idx == -1:
+            raise KeyError(tag)
+        return self.names[self.parents[idx]].decode("utf-8")
+
+    def get(self, tag, default=None):
+        idx = self._find(tag)
+        if idx == -1:
+            return default
+        return self.names[self.parents[idx]].decode("utf-8")
+
+
+def index_is_fresh(csv_path=TAG_IMPLICATIONS_FILE, index_path=TAG_IMPLICATIONS_INDEX_FILE):
+    """
+        Checks whether the index was built from the current CSV. The mtime and size are checked
+        first, and the CSV is only hashed when those changed
+    """
+    if not os.path.exists(index_path):
+        return False
+
+    with open(index_path, "rb") as f:
+        header = f.read(INDEX_HEADER.size)
+    if len(header) < INDEX_HEADER.size:
+        return False
+    magic, version, mtime_ns, size, sha, count, blob_size = INDEX_HEADER.unpack(header)
+    if magic != INDEX_MAGIC or version != INDEX_VERSION:
+        return False
+
+    stat = os.stat(csv_path)
+    if stat.st_mtime_ns == mtime_ns and stat.st_size == size:
+        return True
+    if stat.st_size != size or _hash_file(csv_path) != sha:
+        return False
+
+    # Same content with a new mtime (e.g. a fresh checkout), so there's no need to hash it again next time
+    with open(index_path, "r+b") as f:
+        f.write(INDEX_HEADER.pack(magic, version, stat.st_mtime_ns, size, sha, count, blob_size))
+    return True
+
+
+def load_tag_implications(csv_path=TAG_IMPLICATIONS_FILE, index_path=TAG_IMPLICATIONS_INDEX_FILE):
+    """
+        Returns the tag -> parent index, rebuilding it first if the CSV changed since it was built
+    """
+    if not index_is_fresh(csv_path, index_path):
+        print("- Building the tag implication index. This only happens when the implications change :3")
+        build_index(csv_path, index_path)
+    return TagImplicationIndex(index_path)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        prog="Tag implication index",
+        description="Precomputes the tag implication closure used to pool similar tags"
+    )
+    parser.add_argument("-i", "--input", default=TAG_IMPLICATIONS_FILE, help="The tag implications CSV from e621's db_export")
+    parser.add_argument("-o", "--output", default=TAG_IMPLICATIONS_INDEX_FILE, help="Where to write the binary index")
+    parser.add_argument("-f", "--force", action="store_true", help="Rebuild even if the index is up to date")
+    args = parser.parse_args()
+
+    if args.force or not index_is_fresh(args.input, args.output):
+        build_index(args.input, args.output)
+        print(f"- Built {args.output} :3")
+    else:
+        print(f"- {args.output} is already up to date :3")
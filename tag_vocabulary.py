@@ -0,0 +1,159 @@
+from array import array
+import sys
+import numpy as np
+
+
+class TagVocabulary():
+    """
+        Interns "category:name" tags into consecutive integer ids, in order of first appearance
+    """
+    def __init__(self, tags=()):
+        self.ids = {}
+        self.names = []
+        for tag in tags:
+            self.add(tag)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, tag):
+        return tag in self.ids
+
+    @classmethod
+    def from_names(cls, names):
+        """
+            Vocabulary of names that are already unique, without interning them one by one
+        """
+        vocabulary = cls()
+        vocabulary.names = list(names)
+        vocabulary.ids = dict(zip(vocabulary.names, range(len(vocabulary.names))))
+        return vocabulary
+
+    def add(self, tag):
+        tag_id = self.ids.get(tag)
+        if tag_id is None:
+            tag_id = len(self.names)
+            self.ids[tag] = tag_id
+            self.names.append(tag)
+        return tag_id
+
+    def get_id(self, tag, default=-1):
+        return self.ids.get(tag, default)
+
+    def post_tag_ids(self, post):
+        """
+            Returns the ids of every tag in an API post, adding the new ones to the vocabulary
+        """
+        tag_ids = []
+        for topic in post["tags"]:
+            for tag in post["tags"][topic]:
+                tag_ids.append(self.add(f"{topic}:{tag}"))
+        return tag_ids
+
+
+class FavoritesMatrix():
+    """
+        Compact post x tag incidence matrix in CSR layout (indptr / indices) plus the few post fields
+        we need after the profile is computed. Stands in for keeping every post's JSON around
+    """
+    def __init__(self, vocabulary=None):
+        self.vocabulary = vocabulary if vocabulary is not None else TagVocabulary()
+        self.post_ids = array("q")
+        self.scores = array("i")
+        self.file_exts = []
+        self.indptr = array("q", [0])
+        self.indices = array("i")
+
+        # Tag counts of the first counted_entries entries of indices, so counts only need updating
+        # with the posts added since they were last computed
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.counted_entries = 0
+
+    def __len__(self):
+        return len(self.post_ids)
+
+    def add_post(self, post):
+        self.indices.extend(self.vocabulary.post_tag_ids(post))
+        self.indptr.append(len(self.indices))
+        self.post_ids.append(post["id"])
+        self.scores.append(post["score"]["total"])
+
+        url = post["file"]["url"]
+        self.file_exts.append(sys.intern(url.split(".")[-1]) if url is not None else None)
+
+    def add_posts(self, posts):
+        for post in posts:
+            self.add_post(post)
+
+    def csr_arrays(self):
+        """
+            Returns (data, indices, indptr) as NumPy arrays, which is what scipy.sparse.csr_matrix expects
+        """
+        # Copies, so the arrays can keep growing while the caller holds the result
+        indices = np.frombuffer(self.indices, dtype=np.int32).copy() if len(self.indices) > 0 else np.zeros(0, dtype=np.int32)
+        indptr = np.frombuffer(self.indptr, dtype=np.int64).copy()
+        return np.ones(len(indices), dtype=np.float64), indices, indptr
+
+    def row_blocks(self, block_size):
+        """
+            Yields (indices, indptr, scores) for consecutive blocks of up to block_size posts, with indptr
+            rebased to the block, so big matrices can be processed without large temporary arrays
+        """
+        for start in range(0, len(self), block_size):
+            stop = min(start + block_size, len(self))
+            block_indptr = np.array(self.indptr[start:stop + 1], dtype=np.int64) - self.indptr[start]
+            indices = np.array(self.indices[self.indptr[start]:self.indptr[stop]], dtype=np.int32)
+            scores = np.array(self.scores[start:stop], dtype=np.int64)
+            yield indices, block_indptr, scores
+
+    def row_tag_ids(self, row):
+        return self.indices[self.indptr[row]:self.indptr[row + 1]]
+
+    def tag_counts(self):
+        """
+            Column sums: in how many posts each vocabulary tag appears
+        """
+        if len(self.counts) < len(self.vocabulary):
+            self.counts = np.concatenate([self.counts, np.zeros(len(self.vocabulary) - len(self.counts), dtype=np.int64)])
+        if self.counted_entries < len(self.indices):
+            new_indices = np.frombuffer(self.indices[self.counted_entries:], dtype=np.int32)
+            self.counts += np.bincount(new_indices, minlength=len(self.vocabulary))
+            self.counted_entries = len(self.indices)
+        return self.counts.copy()
+
+    def presence(self):
+        """
+            What fraction of the posts contain each vocabulary tag
+        """
+        if len(self) == 0:
+            return np.zeros(len(self.vocabulary))
+        return self.tag_counts() / len(self)
+
+    def save(self, path):
+        """
+            Stores the matrix and its vocabulary as a compressed .npz
+        """
+        np.savez_compressed(
+            path,
+            vocabulary=np.frombuffer("\n".join(self.vocabulary.names).encode("utf-8"), dtype=np.uint8),
+            post_ids=np.frombuffer(self.post_ids, dtype=np.int64),
+            scores=np.frombuffer(self.scores, dtype=np.int32),
+            file_exts=np.frombuffer("\n".join(ext or "" for ext in self.file_exts).encode("utf-8"), dtype=np.uint8),
+            indptr=np.frombuffer(self.indptr, dtype=np.int64),
+            indices=np.frombuffer(self.indices, dtype=np.int32),
+            counts=self.tag_counts()
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            names = data["vocabulary"].tobytes().decode("utf-8")
+            fav_matrix = cls(TagVocabulary(names.split("\n") if len(names) > 0 else []))
+            fav_matrix.post_ids = array("q", data["post_ids"].tobytes())
+            fav_matrix.scores = array("i", data["scores"].tobytes())
+            fav_matrix.file_exts = [sys.intern(ext) if ext != "" else None for ext in data["file_exts"].tobytes().decode("utf-8").split("\n")] if len(fav_matrix.post_ids) > 0 else []
+            fav_matrix.indptr = array("q", data["indptr"].tobytes())
+            fav_matrix.indices = array("i", data["indices"].tobytes())
+            fav_matrix.counts = data["counts"].astype(np.int64)
+            fav_matrix.counted_entries = len(fav_matrix.indices)
+        return fav_matrix
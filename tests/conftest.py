@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope="session")
+def stand_in():
+    """
+        The local e621 stand-in, shared by every test that needs it. Tests reset what they use of it
+    """
+    from stand_in import StandIn, start_stand_in
+    server = start_stand_in()
+    yield StandIn
+    server.shutdown()
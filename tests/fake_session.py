@@ -0,0 +1,48 @@
+import json
+
+import requests
+
+from e621_client import e621Client
+from rate_limiter import TokenBucketRateLimiter
+
+
+def fake_post(post_id, tags=("fluffy", "smiling")):
+    return {
+        "id": post_id,
+        "score": {"total": post_id % 50},
+        "tags": {"general": list(tags), "species": ["wolf"], "artist": [f"artist_{post_id % 3}"]},
+        "file": {"url": f"https://static1.e621.net/data/{post_id}.png", "ext": "png"},
+    }
+
+
+class FakeSession():
+    """
+        A requests session that answers every request with the next (status, body) in responses, or the
+        last one once they run out, and remembers the urls it was asked for. Bodies that aren't bytes are
+        sent as JSON
+    """
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.urls = []
+
+    def request(self, method, url, **kwargs):
+        self.urls.append(url)
+        status, body = self.responses.pop(0) if len(self.responses) > 1 else self.responses[0]
+        response = requests.Response()
+        response.status_code = status
+        response.url = url
+        response._content = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+        response._content_consumed = True
+        return response
+
+    def close(self):
+        pass
+
+
+def make_client(responses, **options):
+    """
+        A client that talks to a FakeSession, without waiting between requests or before retrying them.
+        options go to e621Client
+    """
+    session = FakeSession(responses)
+    return e621Client("credentials.json", session=session, base_url="http://stand-in", rate_limiter=TokenBucketRateLimiter(0), retry_backoff=0, **options), session
@@ -0,0 +1,237 @@
+from base64 import b64decode
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+import json
+import random
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+from PIL import Image
+
+
+PAGE_SIZE = 320
+GENERAL_TAGS = [f"general_{i}" for i in range(40)]
+SPECIES_TAGS = [f"species_{i}" for i in range(8)]
+ARTIST_TAGS = [f"artist_{i}" for i in range(6)]
+CHARACTER_TAGS = [f"character_{i}" for i in range(6)]
+# Side of the image every generated post has
+IMAGE_SIDE = 300
+
+
+def post_tags(post_id):
+    rng = random.Random(post_id)
+    return {
+        "general": rng.sample(GENERAL_TAGS, 8),
+        "species": rng.sample(SPECIES_TAGS, 2),
+        "character": rng.sample(CHARACTER_TAGS, 1),
+        "artist": rng.sample(ARTIST_TAGS, 1),
+    }
+
+
+def average_interests(posts=2000):
+    """
+        How often every tag shows up in the stand-in's generated posts, in the format of interests.json
+    """
+    counts = {}
+    for post_id in range(posts):
+        for category, tags in StandIn.make_tags(post_id).items():
+            for tag in tags:
+                counts[f"{category}:{tag}"] = counts.get(f"{category}:{tag}", 0) + 1
+    return {tag: count / posts for tag, count in counts.items()}
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """
+        Just enough of the e621 API for the Wrapped, the service and the recommender: users, favorites
+        (also as a fav: search with an id cursor), id: and random post searches, single posts, images and
+        sets. Shared by the tests and the benchmarks, which fill it in before using it:
+
+        - Posts are generated from their id, with make_tags(post_id) as their tags, unless posts has them
+        - Every user has favorites[user_id] generated favorites (default_favorites if it's not there), or
+          favorite_ids[user_id], most recently favorited first. Their data is users[user_id] if it's there
+        - User 404 doesn't exist and user 500 can't be fetched. The favorites of the users in failing answer 500
+        - files are served as they are, before anything else. Other images are image
+        - Sets can be made, found by short name and creator, read and added to, and every post sent to a
+          set is kept in set_additions
+
+        Requests are counted in hits by path, searches by kind ("/posts.json fav", "/posts.json id" or
+        "/posts.json random") and POSTs as "POST <path>". sent is how many bytes of bodies were sent
+    """
+    protocol_version = "HTTP/1.1"
+    base_url = None
+    image = None
+    make_tags = staticmethod(post_tags)
+    default_favorites = 100
+    favorites = {}
+    favorite_ids = {}
+    users = {}
+    posts = {}
+    files = {}
+    failing = set()
+    # set id -> {"shortname", "creator", "post_ids"}
+    sets = {}
+    set_additions = []
+    hits = {}
+    sent = 0
+    # Reentrant, since replies are counted while a POST holds it
+    lock = threading.RLock()
+
+    @classmethod
+    def reset(cls):
+        """
+            Forgets everything the last test or benchmark filled in or counted
+        """
+        cls.make_tags = staticmethod(post_tags)
+        cls.default_favorites = 100
+        for values in [cls.favorites, cls.favorite_ids, cls.users, cls.posts, cls.files, cls.sets, cls.hits]:
+            values.clear()
+        cls.failing.clear()
+        cls.set_additions.clear()
+        cls.sent = 0
+
+    def log_message(self, *args):
+        pass
+
+    def post(self, post_id):
+        if post_id in self.posts:
+            return self.posts[post_id]
+        url = f"{self.base_url}/data/{post_id}.jpg"
+        return {
+            "id": post_id,
+            "tags": self.make_tags(post_id),
+            "score": {"up": 10, "down": 0, "total": post_id % 300},
+            "file": {"url": url, "ext": "jpg", "width": IMAGE_SIDE, "height": IMAGE_SIDE},
+            "sample": {"has": False, "url": url, "width": IMAGE_SIDE, "height": IMAGE_SIDE},
+            "preview": {"url": url, "width": IMAGE_SIDE // 2, "height": IMAGE_SIDE // 2},
+        }
+
+    def user_favorites(self, user_id):
+        """
+            The ids of the user's favorites, most recently favorited first
+        """
+        if user_id in self.favorite_ids:
+            return self.favorite_ids[user_id]
+        return range(user_id * 100000 + self.favorites.get(user_id, self.default_favorites) - 1, user_id * 100000 - 1, -1)
+
+    def user_data(self, user_id):
+        if user_id in self.users:
+            return self.users[user_id]
+        return {"id": user_id, "name": f"user_{user_id}", "avatar_id": 1, "favorite_count": len(self.user_favorites(user_id))}
+
+    def user_named(self, user_name):
+        for user_id, user_data in self.users.items():
+            if user_data["name"] == user_name:
+                return user_id
+        return int(user_name.split("_")[1])
+
+    def reply_posts(self, post_ids):
+        self.reply(json.dumps({"posts": [self.post(post_id) for post_id in post_ids]}).encode("utf-8"))
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+        tags = query.get("tags", "").split()
+        search = tags[0].split(":")[0] if len(tags) > 0 else ""
+        hit = f"{parts.path} {search if search in ['fav', 'id'] else 'random'}" if parts.path == "/posts.json" else parts.path
+        with self.lock:
+            StandIn.hits[hit] = StandIn.hits.get(hit, 0) + 1
+
+        if parts.path in self.files:
+            self.reply(self.files[parts.path], "image/jpeg" if parts.path.startswith("/data/") else "application/json")
+        elif parts.path.startswith("/data/"):
+            self.reply(self.image, "image/jpeg")
+        elif parts.path.startswith("/users/"):
+            user_id = int(parts.path.split("/")[2].split(".")[0])
+            if user_id in [404, 500]:
+                self.reply(b"{}", status=user_id)
+            else:
+                self.reply(json.dumps(self.user_data(user_id)).encode("utf-8"))
+        elif parts.path.startswith("/posts/"):
+            post_id = int(parts.path.split("/")[2].split(".")[0])
+            self.reply(json.dumps({"post": self.post(post_id)}).encode("utf-8"))
+        elif parts.path == "/favorites.json":
+            user_id, page, limit = int(query["user_id"]), int(query["page"]), int(query.get("limit", PAGE_SIZE))
+            if user_id in self.failing:
+                self.reply(b"{}", status=500)
+                return
+            self.reply_posts(self.user_favorites(user_id)[page * limit:(page + 1) * limit])
+        elif parts.path == "/posts.json" and search == "fav":
+            user_id = self.user_named(tags[0][4:])
+            if user_id in self.failing:
+                self.reply(b"{}", status=500)
+                return
+            below = int(query["page"][1:]) if query.get("page", "").startswith("b") else None
+            post_ids = [post_id for post_id in sorted(self.user_favorites(user_id), reverse=True) if below is None or post_id < below]
+            self.reply_posts(post_ids[:int(query.get("limit", PAGE_SIZE))])
+        elif parts.path == "/posts.json" and search == "id":
+            self.reply_posts(sorted((int(post_id) for post_id in tags[0][3:].split(",")), reverse=True))
+        elif parts.path == "/post_sets.json":
+            found = [
+                {"id": set_id, **post_set} for set_id, post_set in self.sets.items()
+                if post_set["shortname"] == query.get("search[shortname]") and query.get("search[creator_name]") in [None, post_set["creator"]]
+            ]
+            self.reply(json.dumps(found).encode("utf-8"))
+        elif parts.path.startswith("/post_sets/"):
+            set_id = int(parts.path.split("/")[2].split(".")[0])
+            if not set_id in self.sets:
+                self.reply(b"{}", status=404)
+            else:
+                self.reply(json.dumps({"id": set_id, **self.sets[set_id]}).encode("utf-8"))
+        elif parts.path == "/posts.json":
+            rng = random.Random(query.get("tags", ""))
+            self.reply_posts([rng.randrange(10**7) for _ in range(PAGE_SIZE)])
+        else:
+            self.reply(b"{}", status=404)
+
+    def do_POST(self):
+        parts = urlsplit(self.path)
+        form = parse_qs(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8"))
+        with self.lock:
+            StandIn.hits[f"POST {parts.path}"] = StandIn.hits.get(f"POST {parts.path}", 0) + 1
+            if parts.path == "/post_sets.json":
+                shortname = form["post_set[shortname]"][0]
+                if any(post_set["shortname"] == shortname for post_set in self.sets.values()):
+                    self.reply(json.dumps({"errors": {"shortname": ["has already been taken"]}}).encode("utf-8"), status=422)
+                    return
+                set_id = len(self.sets) + 1
+                self.sets[set_id] = {"shortname": shortname, "creator": self.user_name(), "post_ids": []}
+                self.reply(json.dumps({"id": set_id}).encode("utf-8"), status=201)
+            elif parts.path.startswith("/post_sets/") and parts.path.endswith("/add_posts.json"):
+                post_ids = [int(post_id) for post_id in form["post_ids[]"]]
+                post_set = self.sets[int(parts.path.split("/")[2])]
+                post_set["post_ids"] = sorted(set(post_set["post_ids"]) | set(post_ids))
+                self.set_additions.extend(post_ids)
+                self.reply(b"{}", status=201)
+            else:
+                self.reply(b"{}", status=404)
+
+    def user_name(self):
+        """
+            Who's logged in, from the Authorization header
+        """
+        authorization = self.headers.get("Authorization", "")
+        if not authorization.startswith("Basic "):
+            return None
+        return b64decode(authorization[6:]).decode("utf-8").split(":")[0]
+
+    def reply(self, body, content_type="application/json", status=200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with self.lock:
+            StandIn.sent += len(body)
+
+
+def start_stand_in():
+    """
+        Starts the stand-in on a free port. Returns the server, which serves until shutdown() is called
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    StandIn.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    body = BytesIO()
+    Image.radial_gradient("L").resize((IMAGE_SIDE, IMAGE_SIDE)).convert("RGB").save(body, format="JPEG")
+    StandIn.image = body.getvalue()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
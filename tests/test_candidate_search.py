@@ -0,0 +1,8 @@
+from candidate_search import build_queries
+
+
+def test_queries_keep_tags_as_they_are():
+    favorites = [["general:m&m's", "general:c++"], ["species:wolf"], [], ["artist:100%_orange"]]
+    queries = build_queries(favorites, ("rating:s",), per_category=[2, 1, 1, 1])
+    assert queries == ["rating:s", "m&m's rating:s", "c++ rating:s", "wolf rating:s", "100%_orange rating:s"]
+    assert build_queries(favorites, per_category=[1, 0, 0, 0]) == ["", "m&m's"]
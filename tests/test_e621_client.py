@@ -0,0 +1,114 @@
+import asyncio
+from io import BytesIO
+from urllib.parse import parse_qs, urlsplit
+
+import e621_client
+from e621_client import LATENCY_HISTORY, AsyncE621Client
+from fake_session import fake_post, make_client
+from rate_limiter import TokenBucketRateLimiter
+from response_cache import ResponseCache
+
+
+def collect(pages):
+    async def run():
+        return [page async for page in pages]
+    return asyncio.run(run())
+
+
+def test_latency_history_is_bounded():
+    e621, _ = make_client([(200, {"posts": []})])
+    for page in range(LATENCY_HISTORY + 10):
+        e621.get_posts("fluffy", page)
+    assert len(e621.latencies) == LATENCY_HISTORY
+    summary = e621.latency_summary()
+    assert summary["requests"] == LATENCY_HISTORY + 10
+    assert 0 <= summary["mean"] <= summary["max"] <= summary["total"]
+
+
+def test_failed_pages_are_none():
+    e621, _ = make_client([(500, {})])
+    assert e621.get_posts("fluffy") is None
+    assert e621.get_favorites(1, 0) is None
+
+
+def test_iter_posts_ends_on_an_empty_or_short_page():
+    e621, session = make_client([(200, {"posts": [fake_post(i) for i in (9, 8)]}), (200, {"posts": [fake_post(7)]})])
+    pages = collect(AsyncE621Client(e621).iter_posts("fluffy", page_size=2))
+    assert [[post["id"] for post in page] for page in pages] == [[9, 8], [7]]
+    assert session.urls[1].endswith("&page=b8")
+
+    e621, _ = make_client([(200, {"posts": []})])
+    assert collect(AsyncE621Client(e621).iter_posts("fluffy", page_size=2)) == []
+
+
+def test_page_iterators_yield_none_on_failure():
+    # Without retries, so the page that fails stays failed
+    e621, session = make_client([(200, {"posts": [fake_post(i) for i in (9, 8)]}), (502, {}), (200, {"posts": [fake_post(7)]})], retries=0)
+    pages = collect(AsyncE621Client(e621, prefetch=0).iter_posts("fluffy", page_size=2))
+    assert len(pages) == 2 and pages[-1] is None
+    assert len(session.urls) == 2
+
+    e621, session = make_client([(200, {"posts": [fake_post(i) for i in (9, 8)]}), (502, {}), (200, {"posts": [fake_post(7)]})], retries=0)
+    pages = collect(AsyncE621Client(e621, prefetch=0).iter_favorites(1, 10, page_size=2))
+    assert len(pages) == 2 and pages[-1] is None
+    assert len(session.urls) == 2
+
+
+class CountingRateLimiter(TokenBucketRateLimiter):
+    def __init__(self):
+        super().__init__(0)
+        self.acquired = 0
+
+    def acquire(self):
+        self.acquired += 1
+        super().acquire()
+
+
+def test_server_errors_are_retried_through_the_rate_limiter():
+    # The session itself only retries connection errors
+    assert not e621_client.create_session().get_adapter("https://e621.net").max_retries.status_forcelist
+
+    e621, session = make_client([(500, {}), (502, {}), (200, {"posts": [fake_post(1)]})])
+    e621.rate_limiter = CountingRateLimiter()
+    assert [post["id"] for post in e621.get_posts("fluffy")] == [1]
+    assert len(session.urls) == 3 and e621.rate_limiter.acquired == 3
+
+    # Up to retries times
+    e621, session = make_client([(504, {})], retries=2)
+    assert e621.get_posts("fluffy") is None
+    assert len(session.urls) == 3
+
+    # Sending a POST again could do it twice
+    e621, session = make_client([(500, {})])
+    assert not e621.add_posts_to_set(1, [1, 2])
+    assert len(session.urls) == 1
+
+
+def image_bytes(size):
+    from PIL import Image
+    body = BytesIO()
+    Image.new("RGB", (size, size), "white").save(body, format="PNG")
+    return body.getvalue()
+
+
+def test_thumbnails_are_cached_once_they_fit(tmp_path, monkeypatch):
+    post = {"id": 1, "file": {"url": "http://stand-in/data/1.png", "ext": "png", "width": 64, "height": 64}}
+    image = image_bytes(64)
+    e621, session = make_client([(200, image)])
+    e621.cache = ResponseCache(str(tmp_path / "cache.sqlite3"))
+    assert e621.get_post_thumb(post, 32).size == (32, 32)
+    assert e621.get_post_thumb(post, 32).size == (32, 32)
+    assert len(session.urls) == 1
+
+    # Anything past the size cap is dropped without ever being cached
+    monkeypatch.setattr(e621_client, "THUMB_MAX_BYTES", len(image) - 1)
+    e621.cache.clear()
+    assert e621.get_post_thumb(post, 32) == []
+    assert e621.get_post_thumb(post, 32) == []
+    assert len(session.urls) == 3
+
+
+def test_tags_are_escaped():
+    e621, session = make_client([(200, {"posts": []})])
+    e621.get_random_posts(100, "m&m's c++ #1_fan 100%_cotton")
+    assert parse_qs(urlsplit(session.urls[0]).query)["tags"] == ["order:random score:>=100 m&m's c++ #1_fan 100%_cotton"]
@@ -0,0 +1,95 @@
+import asyncio
+import os
+from urllib.parse import parse_qs, urlsplit
+
+from PIL import Image
+
+import e621_wrapped
+from fake_session import fake_post, make_client
+from wrapped_core import load_favorites
+
+
+def test_failed_page_saves_nothing(tmp_path):
+    page = {"posts": [fake_post(i) for i in (9, 8)]}
+    e621, _ = make_client([(200, page), (503, {})])
+    fav_matrix, total_new = asyncio.run(e621_wrapped.update_favorites(e621, 1, "tester", 10, output_dir=tmp_path, quiet=True, page_size=2))
+    assert fav_matrix is None and total_new is None
+    assert not os.path.exists(tmp_path / "tester_favorites.npz")
+
+
+def test_short_page_is_the_end(tmp_path):
+    e621, session = make_client([(200, {"posts": [fake_post(i) for i in (9, 8)]}), (200, {"posts": [fake_post(7)]})])
+    fav_matrix, total_new = asyncio.run(e621_wrapped.update_favorites(e621, 1, "tester", 10, output_dir=tmp_path, quiet=True, page_size=2))
+    assert total_new == 3 and list(fav_matrix.post_ids) == [9, 8, 7]
+    assert list(load_favorites("tester", output_dir=tmp_path).post_ids) == [9, 8, 7]
+    assert len(session.urls) == 2
+
+
+def test_new_favorites_past_max_pages_are_all_fetched(tmp_path):
+    e621, _ = make_client([(200, {"posts": [fake_post(i) for i in (5, 4)]}), (200, {"posts": []})])
+    asyncio.run(e621_wrapped.update_favorites(e621, 1, "tester", 1, output_dir=tmp_path, quiet=True, page_size=2))
+
+    # More new favorites than max_pages holds: the pages go on until the saved ones are reached
+    pages = [[9, 8], [7, 6], [5, 4]]
+    e621, session = make_client([(200, {"posts": [fake_post(i) for i in page]}) for page in pages])
+    fav_matrix, total_new = asyncio.run(e621_wrapped.update_favorites(e621, 1, "tester", 1, output_dir=tmp_path, quiet=True, page_size=2))
+    assert total_new == 4 and len(session.urls) == 3
+    assert sorted(load_favorites("tester", output_dir=tmp_path).post_ids) == [4, 5, 6, 7, 8, 9]
+
+
+def test_full_fetch_walks_the_fav_search_when_it_fits(tmp_path):
+    e621, session = make_client([(200, {"posts": [fake_post(i) for i in (9, 8)]}), (200, {"posts": [fake_post(7)]})])
+    fav_matrix, total_new = asyncio.run(e621_wrapped.update_favorites(e621, 1, "a+b&c", 2, output_dir=tmp_path, quiet=True, page_size=2, favorite_count=3))
+    assert total_new == 3
+    query = parse_qs(urlsplit(session.urls[1]).query)
+    assert urlsplit(session.urls[1]).path == "/posts.json"
+    assert query["tags"] == ["fav:a+b&c status:any"] and query["page"] == ["b8"]
+
+
+def test_truncated_fetch_keeps_the_most_recent_favorites(tmp_path):
+    # By when they were favorited, not by id
+    e621, session = make_client([(200, {"posts": [fake_post(i) for i in (2, 9)]}), (200, {"posts": [fake_post(i) for i in (5, 1)]})])
+    fav_matrix, total_new = asyncio.run(e621_wrapped.update_favorites(e621, 1, "tester", 2, output_dir=tmp_path, quiet=True, page_size=2, favorite_count=5))
+    assert list(fav_matrix.post_ids) == [2, 9, 5, 1]
+    assert all(urlsplit(url).path == "/favorites.json" for url in session.urls)
+
+
+class ThumbnailSource():
+    """
+        Just the two calls get_thumbnails makes. Posts in missing aren't found, the images of the ones in
+        broken can't be downloaded, and searching fails if search_fails is set
+    """
+    def __init__(self, missing=(), broken=(), search_fails=False):
+        self.missing = set(missing)
+        self.broken = set(broken)
+        self.search_fails = search_fails
+        self.searches = []
+        self.downloads = []
+
+    def get_posts(self, tags, page="", limit=320):
+        self.searches.append(tags)
+        if self.search_fails:
+            return None
+        post_ids = [int(post_id) for post_id in tags.split()[0][len("id:"):].split(",")]
+        return [fake_post(post_id) for post_id in sorted(post_ids, reverse=True) if not post_id in self.missing]
+
+    def get_post_thumb(self, post, side, cancelled=None):
+        post_id = post["id"] if isinstance(post, dict) else post
+        self.downloads.append((post_id, isinstance(post, dict)))
+        return [] if post_id in self.broken else Image.new("RGB", (side, side))
+
+
+def test_thumbnails_come_from_one_search():
+    e621 = ThumbnailSource(missing=[10], broken=[20])
+    fav_post, user_pfp, fav_post_id = e621_wrapped.get_thumbnails(e621, {"post_by_scores": [10, 20, 30, 40]}, 5, prefetch=1)
+    assert fav_post_id == 30 and fav_post.size == (400, 400) and user_pfp.size == (300, 300)
+    assert e621.searches == ["id:10,20,30,40,5 status:any"]
+    # Every download got the post from the search, and the missing one wasn't tried
+    assert sorted(e621.downloads) == [(5, True), (20, True), (30, True)]
+
+
+def test_thumbnails_without_the_search():
+    e621 = ThumbnailSource(broken=[10], search_fails=True)
+    fav_post, user_pfp, fav_post_id = e621_wrapped.get_thumbnails(e621, {"post_by_scores": [10, 20]}, 5, prefetch=1)
+    assert fav_post_id == 20 and user_pfp is not None
+    assert sorted(e621.downloads) == [(5, False), (10, False), (20, False)]
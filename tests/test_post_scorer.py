@@ -0,0 +1,80 @@
+import copy
+import math
+import random
+
+import numpy as np
+import pytest
+
+from post_scorer import PostScorer
+from tag_vocabulary import FavoritesMatrix
+
+
+CATEGORIES = ["general", "species", "character", "artist"]
+
+
+def legacy_post_score(post, user_profile, weights, favorite_tag_categories, return_best_tags=False):
+    """
+        get_post_score as it was before PostScorer, the formula it has to keep
+    """
+    score = 0
+
+    post["clean_tags"] = []
+    for topic in post["tags"]:
+        for tag in post["tags"][topic]:
+            post["clean_tags"].append(f"{topic}:{tag}")
+
+    best_tags = []
+    for i, favorites in enumerate(favorite_tag_categories):
+        added_best_tag = False
+        for tag in favorites:
+            if tag in post["clean_tags"]:
+                if not added_best_tag:
+                    added_best_tag = True
+                    best_tags.append(tag.split(":")[1])
+                score += weights[i] * user_profile[tag]["enjoyment"]
+
+    final_score = score / math.pow(len(post["clean_tags"]), 0.2) * (math.pow(post["score"]["total"], 0.1) if post["score"]["total"] > 0 else 0)
+    if return_best_tags:
+        return final_score, best_tags
+    return final_score
+
+
+def random_profile(rng):
+    """
+        A profile with some of every category's tags, and favorite lists in a random order
+    """
+    user_profile = {}
+    favorite_tag_categories = []
+    for category in CATEGORIES:
+        tags = [f"{category}:tag_{i}" for i in range(60)]
+        for tag in tags:
+            user_profile[tag] = {"presence": rng.random(), "relative_presence": rng.random() * 10, "enjoyment": rng.uniform(-0.05, 0.1)}
+        favorite_tag_categories.append(rng.sample(tags, 25))
+    weights = [rng.uniform(0.5, 20) for _ in CATEGORIES]
+    return user_profile, weights, favorite_tag_categories
+
+
+def random_post(rng, post_id):
+    # At least one tag, since the old formula divides by the amount of them
+    tags = {category: [f"tag_{i}" for i in rng.sample(range(80), rng.randint(0, 12))] for category in CATEGORIES}
+    tags["meta"] = ["hi_res"] if rng.random() < 0.5 or sum(len(category_tags) for category_tags in tags.values()) == 0 else []
+    return {"id": post_id, "tags": tags, "score": {"total": rng.choice([0, -3, rng.randint(1, 2000)])}, "file": {"url": f"https://static1.e621.net/data/{post_id}.png"}}
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_batched_scores_match_the_old_formula(seed):
+    rng = random.Random(seed)
+    user_profile, weights, favorite_tag_categories = random_profile(rng)
+    posts = [random_post(rng, post_id) for post_id in range(500)]
+
+    expected = [legacy_post_score(copy.deepcopy(post), user_profile, weights, favorite_tag_categories, True) for post in posts]
+    scores, best_tags = PostScorer(user_profile, weights, favorite_tag_categories).score_posts(posts, True)
+    np.testing.assert_allclose(scores, [score for score, _ in expected], rtol=1e-12, atol=1e-15)
+    assert best_tags == [post_best_tags for _, post_best_tags in expected]
+    # Posts are left as they were
+    assert all(not "clean_tags" in post for post in posts)
+
+    fav_matrix = FavoritesMatrix()
+    fav_matrix.add_posts(posts)
+    scores = PostScorer(user_profile, weights, favorite_tag_categories, fav_matrix.vocabulary).score_matrix(fav_matrix)
+    np.testing.assert_allclose(scores, [score for score, _ in expected], rtol=1e-12, atol=1e-15)
@@ -0,0 +1,65 @@
+import rate_limiter
+from rate_limiter import MAX_INTERVAL, SharedRateLimiter
+
+
+class Clock():
+    """
+        Stands in for time.time and time.sleep, so waiting takes no time
+    """
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+        self.slept = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def shared_interval(path):
+    with open(path, "rb") as f:
+        return SharedRateLimiter.STATE.unpack(f.read(SharedRateLimiter.STATE.size))[1]
+
+
+def test_backoff_is_forgotten_after_idle_time(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limiter.time, "time", clock.time)
+    monkeypatch.setattr(rate_limiter.time, "sleep", clock.sleep)
+    path = tmp_path / "rate_limit"
+
+    limiter = SharedRateLimiter(1.0, path=path)
+    for _ in range(10):
+        limiter.acquire()
+        limiter.on_response(429)
+    assert shared_interval(path) == MAX_INTERVAL
+
+    # Right after the burst, another process still waits
+    clock.slept.clear()
+    SharedRateLimiter(1.0, path=path).acquire()
+    assert clock.slept[-1] > 0
+
+    # Much later, it starts at the configured rate
+    clock.now += 2 * MAX_INTERVAL
+    clock.slept.clear()
+    later = SharedRateLimiter(1.0, path=path)
+    later.acquire()
+    later.acquire()
+    assert shared_interval(path) == 1.0
+    assert clock.slept == [1.0]
+
+
+def test_backoff_holds_while_requests_keep_coming(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limiter.time, "time", clock.time)
+    monkeypatch.setattr(rate_limiter.time, "sleep", clock.sleep)
+
+    limiter = SharedRateLimiter(1.0, path=tmp_path / "rate_limit")
+    limiter.acquire()
+    limiter.on_response(429)
+    limiter.on_response(429)
+    clock.slept.clear()
+    for _ in range(3):
+        limiter.acquire()
+    assert clock.slept[1:] == [4.0, 4.0]
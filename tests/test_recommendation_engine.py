@@ -0,0 +1,106 @@
+import asyncio
+from argparse import Namespace
+import json
+import os
+
+import pytest
+
+from e621_client import e621Client
+from e621_recommendation_engine import run_recommendations
+import e621_wrapped
+from profile_store import load_profile
+from rate_limiter import TokenBucketRateLimiter
+from stand_in import average_interests
+from tag_implications import load_tag_implications
+import wrapped_core
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def e621(stand_in, tmp_path, monkeypatch):
+    monkeypatch.chdir(ROOT)
+    stand_in.reset()
+    e621 = e621Client("credentials.json", base_url=stand_in.base_url, rate_limiter=TokenBucketRateLimiter(0.0))
+    # Sets are made by whoever is logged in
+    e621.auth = ("tester", "api_key")
+    return e621
+
+
+def make_wrapped(e621, user_id, output_dir):
+    """
+        What e621_wrapped.py does up to saving the profile
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    interests_file = os.path.join(output_dir, "interests.json")
+    if not os.path.exists(interests_file):
+        with open(interests_file, "w") as f:
+            json.dump(average_interests(), f)
+    user_data = e621.get_user(user_id)
+    fav_matrix, _ = asyncio.run(e621_wrapped.update_favorites(e621, user_id, user_data["name"], 10, output_dir=output_dir, quiet=True, favorite_count=user_data["favorite_count"]))
+    results = wrapped_core.build_results(fav_matrix, wrapped_core.load_global_interests(interests_file), load_tag_implications(wrapped_core.TAG_IMPLICATIONS_FILE))
+    return wrapped_core.save_profile(results, fav_matrix.post_ids, user_data["name"], output_dir=output_dir)
+
+
+def recommender_args(**options):
+    return Namespace(**{"pages": 2, "score": 0, "min_upvotes": 0, "extra_tags": [], "add_to_set": "y", "strategy": "adaptive", "forget_seen": False, **options})
+
+
+def test_wrapped_keeps_the_set_for_the_next_recommendations(e621, stand_in, tmp_path):
+    output_dir = str(tmp_path)
+    make_wrapped(e621, 5, output_dir)
+    profile = run_recommendations(e621, "user_5", recommender_args(), output_dir=output_dir)
+    assert profile.set_id == 1 and len(profile.set_posts) > 0 and len(profile.seen_posts) > 0
+    first_set_posts = profile.set_posts.tolist()
+    first_seen = profile.seen_posts.tolist()
+    assert sorted(stand_in.set_additions) == first_set_posts
+
+    # A new Wrapped, then more recommendations: the same set is used, and nothing is sent to it twice
+    make_wrapped(e621, 5, output_dir)
+    profile = load_profile(os.path.join(output_dir, "user_5_profile.npz"))
+    assert profile.set_id == 1
+    assert profile.set_posts.tolist() == first_set_posts and profile.seen_posts.tolist() == first_seen
+
+    profile = run_recommendations(e621, "user_5", recommender_args(pages=4), output_dir=output_dir)
+    assert stand_in.hits["POST /post_sets.json"] == 1
+    assert len(stand_in.set_additions) == len(set(stand_in.set_additions))
+    assert set(first_seen) < set(profile.seen_posts.tolist())
+    assert profile.set_posts.tolist() == stand_in.sets[1]["post_ids"]
+
+
+def test_lost_profile_finds_its_set_again(e621, stand_in, tmp_path):
+    make_wrapped(e621, 6, str(tmp_path / "first"))
+    profile = run_recommendations(e621, "user_6", recommender_args(), output_dir=str(tmp_path / "first"))
+
+    # Starting over somewhere else, the set's short name is taken, so the set that has it is used
+    make_wrapped(e621, 6, str(tmp_path / "second"))
+    profile = run_recommendations(e621, "user_6", recommender_args(), output_dir=str(tmp_path / "second"))
+    assert profile.set_id == 1 and len(stand_in.sets) == 1
+    # What's in the set is checked first, so nothing that's in it already is sent again
+    assert len(stand_in.set_additions) == len(set(stand_in.set_additions))
+    assert profile.set_posts.tolist() == stand_in.sets[1]["post_ids"]
+
+
+def test_someone_elses_set_is_never_used(e621, stand_in, tmp_path):
+    stand_in.sets[1] = {"shortname": "user_6_wrapped_recommendations", "creator": "someone_else", "post_ids": [1]}
+    make_wrapped(e621, 6, str(tmp_path))
+    assert run_recommendations(e621, "user_6", recommender_args(), output_dir=str(tmp_path)) is None
+    assert stand_in.sets[1]["post_ids"] == [1] and stand_in.set_additions == []
+
+
+def test_nothing_is_added_to_a_set_that_cant_be_checked(e621, stand_in, tmp_path):
+    make_wrapped(e621, 5, str(tmp_path))
+    run_recommendations(e621, "user_5", recommender_args(), output_dir=str(tmp_path))
+    sent = len(stand_in.set_additions)
+
+    del stand_in.sets[1]
+    profile = run_recommendations(e621, "user_5", recommender_args(), output_dir=str(tmp_path))
+    assert len(stand_in.set_additions) == sent
+    assert stand_in.hits["POST /post_sets/1/add_posts.json"] == 1
+    # The posts were still looked at
+    assert profile.set_id == 1 and len(profile.seen_posts) > 0
+
+
+def test_no_profile(e621, tmp_path):
+    assert run_recommendations(e621, "user_7", recommender_args(), output_dir=str(tmp_path)) is None
@@ -0,0 +1,105 @@
+import csv
+import os
+
+from tag_implications import TAG_IMPLICATIONS_FILE, build_index, compute_tag_to_parent, TagImplicationIndex
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def legacy_tag_to_parent(csv_path):
+    """
+        The fixpoint loop e621_wrapped.py used to run on every start, as it was
+    """
+    with open(csv_path, 'r', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+
+        implication_dict = {}
+        for row in reader:
+            if row["status"] == "active":
+                if not row["consequent_name"] in implication_dict:
+                    implication_dict[row["consequent_name"]] = []
+                implication_dict[row["consequent_name"]].append(row["antecedent_name"])
+
+    changed = True
+    while changed:
+        changed = False
+
+        to_change = {}
+        for tag in implication_dict:
+            for implicator_tag in implication_dict[tag]:
+                if implicator_tag in implication_dict:
+                    to_change[implicator_tag] = tag
+
+        if len(to_change) > 0:
+            changed = True
+
+        for tag in to_change:
+            for implicator_tag in implication_dict[tag]:
+                if not implicator_tag in implication_dict[to_change[tag]]:
+                    implication_dict[to_change[tag]].append(implicator_tag)
+            implication_dict[tag] = []
+
+        to_delete = []
+        for tag in implication_dict:
+            if len(implication_dict[tag]) == 0:
+                to_delete.append(tag)
+        for tag in to_delete:
+            del implication_dict[tag]
+
+    tag_to_parent = {}
+    for tag in implication_dict:
+        tag_to_parent[tag] = tag
+        for implicator_tag in implication_dict[tag]:
+            tag_to_parent[implicator_tag] = tag
+    return tag_to_parent
+
+
+def write_csv(path, rows):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "antecedent_name", "consequent_name", "created_at", "status"])
+        for idx, (antecedent, consequent, status) in enumerate(rows):
+            writer.writerow([idx, antecedent, consequent, "", status])
+    return path
+
+
+def test_matches_legacy_on_shipped_csv():
+    csv_path = os.path.join(ROOT, TAG_IMPLICATIONS_FILE)
+    assert compute_tag_to_parent(csv_path) == legacy_tag_to_parent(csv_path)
+
+
+def test_matches_legacy_on_ties_and_cycles(tmp_path):
+    rows = [
+        # A chain, and a tag that leads to two top-most tags
+        ("wolf", "canine", "active"),
+        ("canine", "canid", "active"),
+        ("canid", "mammal", "active"),
+        ("canine", "furry", "active"),
+        ("fox", "canine", "active"),
+        # A tag implied twice, listed before and after its own implicator
+        ("red_fox", "fox", "active"),
+        ("red_fox", "red_body", "active"),
+        ("red_body", "colors", "active"),
+        # Cycles, and rows that don't count
+        ("a", "b", "active"),
+        ("b", "a", "active"),
+        ("c", "c", "active"),
+        ("old", "mammal", "deleted"),
+        ("mammal", "animal", "pending"),
+    ]
+    csv_path = write_csv(tmp_path / "implications.csv", rows)
+    assert compute_tag_to_parent(csv_path) == legacy_tag_to_parent(csv_path)
+    # The order rows come in decides the ties, so it has to match whichever way they're listed
+    csv_path = write_csv(tmp_path / "reversed.csv", rows[::-1])
+    assert compute_tag_to_parent(csv_path) == legacy_tag_to_parent(csv_path)
+
+
+def test_index_gives_the_closure(tmp_path):
+    csv_path = write_csv(tmp_path / "implications.csv", [("wolf", "canine", "active"), ("canine", "mammal", "active"), ("fox", "canine", "active")])
+    index_path = str(tmp_path / "implications.idx")
+    build_index(csv_path, index_path)
+    index = TagImplicationIndex(index_path)
+    assert len(index) == 4
+    assert index["wolf"] == "mammal" and index.get("fox") == "mammal" and index["mammal"] == "mammal"
+    assert "cat" not in index and index.get("cat") is None
@@ -0,0 +1,40 @@
+import json
+import os
+
+from profile_store import load_profile
+from wrapped_core import save_profile
+
+
+def make_results(tags):
+    return {
+        "user_profile": {tag: {"presence": 0.5, "relative_presence": 2.0, "enjoyment": 0.1} for tag in tags},
+        "weights": [1.0, 1.0, 1.0, 1.0],
+        "favorite_tags": tags[:1],
+        "favorite_species": tags[1:2],
+        "favorite_characters": [],
+        "favorite_artists": tags[2:],
+    }
+
+
+def test_new_wrapped_keeps_seen_posts(tmp_path):
+    save_profile(make_results(["general:fluffy", "species:wolf", "artist:someone"]), [1, 2], "tester", output_dir=str(tmp_path))
+
+    # What the recommender does with it
+    path = os.path.join(tmp_path, "tester_profile.npz")
+    profile = load_profile(path)
+    profile.seen_posts = [30, 10, 20]
+    profile.save(path)
+
+    saved_profile = save_profile(make_results(["general:smiling", "species:fox", "artist:someone"]), [1, 2, 3], "tester", as_json=True, output_dir=str(tmp_path))
+    assert saved_profile.seen_posts.tolist() == [10, 20, 30]
+    profile = load_profile(path)
+    assert profile.seen_posts.tolist() == [10, 20, 30]
+    assert profile.fav_ids.tolist() == [1, 2, 3]
+    assert list(profile.user_profile) == ["general:smiling", "species:fox", "artist:someone"]
+    with open(tmp_path / "tester_profile.json") as f:
+        assert json.load(f)["seen"] == [10, 20, 30]
+
+
+def test_first_wrapped_has_nothing_seen(tmp_path):
+    profile = save_profile(make_results(["general:fluffy"]), [1], "tester", output_dir=str(tmp_path))
+    assert profile.set_id is None and len(profile.seen_posts) == 0 and len(profile.set_posts) == 0
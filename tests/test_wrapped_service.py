@@ -0,0 +1,151 @@
+import asyncio
+from io import BytesIO
+import json
+import os
+
+from PIL import Image
+import pytest
+
+from e621_client import e621Client
+from profile_store import load_profile
+from rate_limiter import TokenBucketRateLimiter
+from response_cache import ResponseCache
+from stand_in import StandIn, average_interests
+import wrapped_service
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def service(stand_in, tmp_path, monkeypatch):
+    # The template, fonts and implication index are relative to the repository
+    monkeypatch.chdir(ROOT)
+    interests_file = tmp_path / "interests.json"
+    with open(interests_file, "w") as f:
+        json.dump(average_interests(), f)
+
+    stand_in.reset()
+    e621 = e621Client("credentials.json", base_url=stand_in.base_url, rate_limiter=TokenBucketRateLimiter(0.0))
+    return wrapped_service.WrappedService(e621, data_dir=str(tmp_path / "service"), interests_file=str(interests_file))
+
+
+@pytest.fixture
+def app(service):
+    return wrapped_service.create_app(service)
+
+
+def call(app, path, method="GET"):
+    """
+        Sends a request to the ASGI app, the way a server would. Returns the status and the body
+    """
+    return asyncio.run(send(app, path, method))
+
+
+async def send(app, path, method="GET"):
+    path, _, query = path.partition("?")
+    scope = {"type": "http", "method": method, "path": path, "query_string": query.encode("utf-8"), "headers": []}
+    response = {}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def respond(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        else:
+            response["body"] = message["body"]
+
+    await app(scope, receive, respond)
+    return response["status"], response["body"]
+
+
+def test_wrapped_and_detailed_are_pngs(app):
+    status, body = call(app, "/users/1/wrapped.png")
+    assert status == 200
+    wrapped = Image.open(BytesIO(body))
+    assert wrapped.format == "PNG" and wrapped.size == Image.open(os.path.join(ROOT, "template.png")).size
+
+    status, body = call(app, "/users/1/detailed.png")
+    assert status == 200
+    assert Image.open(BytesIO(body)).format == "PNG"
+    # Both come from the same favorites, which were only fetched once, and the posts of the Wrapped come
+    # from one search instead of a request each
+    assert StandIn.hits["/posts.json fav"] == 1
+    assert StandIn.hits["/posts.json id"] == 1
+    assert not any(hit.startswith("/posts/") for hit in StandIn.hits)
+
+
+def test_recommendations_are_best_first(app):
+    status, body = call(app, "/users/1/recommendations?pages=2&score=0")
+    assert status == 200
+    recommendations = json.loads(body)
+    assert len(recommendations) > 0
+    scores = [recommendation["score"] for recommendation in recommendations]
+    assert scores == sorted(scores, reverse=True)
+    assert all(set(recommendation) == {"id", "score", "best_tags"} for recommendation in recommendations)
+
+
+def test_recommendations_skip_what_was_looked_at(app, service):
+    first = json.loads(call(app, "/users/1/recommendations?pages=2&score=0")[1])
+    second = json.loads(call(app, "/users/1/recommendations?pages=2&score=0&min_upvotes=50")[1])
+    assert len(first) > 0 and len(second) > 0
+    assert not set(recommendation["id"] for recommendation in first) & set(recommendation["id"] for recommendation in second)
+
+    # Both are saved, and kept when the results are computed again
+    service.results_ttl = 0
+    assert call(app, "/users/1/wrapped.png")[0] == 200
+    seen = set(load_profile(os.path.join(service.data_dir, "user_1_profile.npz")).seen_posts.tolist())
+    assert set(recommendation["id"] for recommendation in first + second) <= seen
+
+
+def test_new_favorites_skip_the_response_cache(stand_in, tmp_path, monkeypatch):
+    monkeypatch.chdir(ROOT)
+    interests_file = tmp_path / "interests.json"
+    with open(interests_file, "w") as f:
+        json.dump(average_interests(), f)
+    stand_in.reset()
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"))
+    e621 = e621Client("credentials.json", base_url=stand_in.base_url, rate_limiter=TokenBucketRateLimiter(0.0), cache=cache)
+    service = wrapped_service.WrappedService(e621, data_dir=str(tmp_path / "service"), interests_file=str(interests_file), results_ttl=0)
+
+    # Favorites that came in after the first page of favorites was cached still show up
+    for favorite_count in [100, 110, 120]:
+        stand_in.favorites[4] = favorite_count
+        user = asyncio.run(service.get_user(4))
+        assert len(user["profile"].fav_ids) == favorite_count
+    cache.close()
+
+
+def test_concurrent_requests_are_coalesced(app):
+    StandIn.favorites[2] = 700
+
+    async def burst():
+        return await asyncio.gather(*(send(app, "/users/2/wrapped.png") for _ in range(8)))
+    responses = asyncio.run(burst())
+    assert [status for status, _ in responses] == [200] * 8
+    assert len(set(body for _, body in responses)) == 1
+    # 700 favorites are 3 pages, fetched once for all 8 requests
+    assert StandIn.hits["/posts.json fav"] == 3
+    assert StandIn.hits["/users/2.json"] == 1
+
+
+@pytest.mark.parametrize("query", ["pages=0", f"pages={wrapped_service.MAX_RECOMMENDATION_PAGES + 1}", "pages=many", "score=high", "min_upvotes=1.5"])
+def test_bad_recommendation_queries_are_400(app, query):
+    status, body = call(app, f"/users/1/recommendations?{query}")
+    assert status == 400
+    assert "error" in json.loads(body)
+    # Nothing was asked of e621 for them
+    assert StandIn.hits == {}
+
+
+def test_errors(app, service):
+    assert call(app, "/users/1/wrapped.png", method="POST")[0] == 405
+    assert call(app, "/users/1/nothing.png")[0] == 404
+    assert call(app, "/users/404/wrapped.png")[0] == 404
+    # Not being able to get a user isn't the same as there being no such user
+    assert call(app, "/users/500/wrapped.png")[0] == 502
+
+    StandIn.failing.add(3)
+    assert call(app, "/users/3/wrapped.png")[0] == 502
+    assert not os.path.exists(os.path.join(service.data_dir, "user_3_favorites.npz"))
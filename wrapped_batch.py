@@ -0,0 +1,203 @@
+from argparse import ArgumentParser
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from e621_client import AsyncE621Client, e621Client
+from response_cache import ResponseCache
+from tag_filters import TagFilter, add_exclusion_arguments, tag_filter_from_args
+from tag_implications import load_tag_implications
+from wrapped_renderer import ThumbnailCache
+import e621_wrapped
+import wrapped_core
+from tqdm.auto import tqdm
+import json
+import os
+import time
+
+
+CHECKPOINT_FILE = "batch_checkpoint.jsonl"
+# How many users have their favorites fetched at the same time. They all share one rate limit, so
+# this only needs to be high enough to keep requests going while other users are being rendered
+FETCHERS = 2
+
+# Loaded once in every worker process by init_worker
+worker_state = {}
+
+
+def init_worker(interests_file, tag_implications_file, exclude_words):
+    worker_state["global_interests"] = wrapped_core.load_global_interests(interests_file, TagFilter(exclude_words))
+    worker_state["tag_to_parent"] = load_tag_implications(tag_implications_file)
+
+
+def compute_user(user_name, as_json, output_dir):
+    """
+        Runs in a worker process: builds the results from the saved favorites, saves the profile and
+        plots the detailed report, with the figure that process keeps for every report it plots
+    """
+    fav_matrix = wrapped_core.load_favorites(user_name, output_dir=output_dir)
+    results = wrapped_core.build_results(fav_matrix, worker_state["global_interests"], worker_state["tag_to_parent"])
+    wrapped_core.save_profile(results, fav_matrix.post_ids, user_name, as_json, output_dir)
+    e621_wrapped.plot_detailed(results, user_name, output_dir)
+    return results
+
+
+def render_user(results, user_name, fav_post, user_pfp, fav_post_id, output_dir):
+    """
+        Runs in a worker process: draws the Wrapped itself, with the renderer that process keeps for every
+        Wrapped it draws
+    """
+    return e621_wrapped.render_wrapped(results, user_name, fav_post, user_pfp, output_dir, fav_post_id=fav_post_id)
+
+
+def read_user_ids(path):
+    """
+        One user_id per line. Empty lines and lines starting with # are skipped
+    """
+    user_ids = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if len(line) == 0 or line.startswith("#"):
+                continue
+            user_ids.append(line)
+    return user_ids
+
+
+class Checkpoint():
+    """
+        Append only log (one JSON object per line) of every user the batch finished, so a batch that was
+        stopped or crashed skips them when it's started again. Users that failed are tried again
+    """
+    def __init__(self, path=CHECKPOINT_FILE):
+        self.path = path
+        self.done = set()
+        ends_with_newline = True
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    ends_with_newline = line.endswith("\n")
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # The last line may have been cut short by a crash
+                        continue
+                    if entry["status"] == "done":
+                        self.done.add(entry["user_id"])
+        self.file = open(path, "a")
+        if not ends_with_newline:
+            self.file.write("\n")
+
+    def record(self, user_id, status, **info):
+        self.file.write(json.dumps({"user_id": user_id, "status": status, **info}) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        if status == "done":
+            self.done.add(user_id)
+
+    def close(self):
+        self.file.close()
+
+
+async def run_batch(e621, user_ids, checkpoint, pool, args):
+    """
+        Makes the Wrapped of every user. Favorites are fetched through the single e621 client (so every
+        request shares its rate limit) while the users that are already fetched are computed and rendered
+        in the process pool. Returns how many users were done and how many failed
+    """
+    loop = asyncio.get_running_loop()
+    e621_async = AsyncE621Client(e621)
+    fetch_slots = asyncio.Semaphore(args.fetchers)
+    thumbnails = ThumbnailCache()
+    start = time.perf_counter()
+    totals = {"done": 0, "failed": 0}
+    progress = tqdm(desc="Making Wrappeds", unit=" users", total=len(user_ids))
+
+    async def make_wrapped(user_id):
+        user_start = time.perf_counter()
+        try:
+            async with fetch_slots:
+                user_data = await e621_async.get_user(user_id)
+                user_name = user_data["name"]
+                fav_matrix, total_new = await e621_wrapped.update_favorites(e621, user_id, user_name, args.pages, args.full, args.output, quiet=True, favorite_count=user_data.get("favorite_count"))
+                if fav_matrix is None:
+                    raise ConnectionError(f"Couldn't get the favorites of {user_name}")
+
+            results = await loop.run_in_executor(pool, compute_user, user_name, args.json, args.output)
+            fav_post, user_pfp, fav_post_id = await asyncio.to_thread(e621_wrapped.get_thumbnails, e621, results, user_data["avatar_id"], thumbnails)
+            await loop.run_in_executor(pool, render_user, results, user_name, fav_post, user_pfp, fav_post_id, args.output)
+
+            checkpoint.record(user_id, "done", user_name=user_name, new_favorites=total_new, seconds=round(time.perf_counter() - user_start, 2))
+            totals["done"] += 1
+        except Exception as e:
+            checkpoint.record(user_id, "failed", error=repr(e))
+            totals["failed"] += 1
+            tqdm.write(f"- Couldn't make the Wrapped of user {user_id}: {e!r} :c")
+
+        progress.update(1)
+        progress.set_postfix(users_per_hour=f"{totals['done'] / (time.perf_counter() - start) * 3600:.0f}")
+
+    await asyncio.gather(*(make_wrapped(user_id) for user_id in user_ids))
+    progress.close()
+    return totals["done"], totals["failed"]
+
+
+if __name__ == "__main__":
+    ##################
+    # Initialization #
+    ##################
+    parser = ArgumentParser(
+        prog="E621 Wrapped (batch)",
+        description="Generates the Wrapped of many users at once"
+    )
+    parser.add_argument("-u", "--users", nargs="+", default=[], help="The user_ids to make Wrappeds for")
+    parser.add_argument("-i", "--input", default=None, help="A file with one user_id per line")
+    parser.add_argument("-p", "--pages", default=100, type=int, help="The max amount of pages to look for favorites in, for each user")
+    parser.add_argument("-f", "--full", action="store_true", help="Fetch every favorite again instead of only the ones added since the last run")
+    parser.add_argument("-o", "--output", default="", help="The folder to save the Wrappeds, profiles and favorites in")
+    parser.add_argument("-w", "--workers", default=os.cpu_count(), type=int, help="How many processes compute and render Wrappeds")
+    parser.add_argument("--fetchers", default=FETCHERS, type=int, help="How many users have their favorites fetched at the same time")
+    parser.add_argument("-c", "--checkpoint", default=CHECKPOINT_FILE, help="The file that keeps track of finished users, so the batch can be resumed")
+    parser.add_argument("--json", action="store_true", help="Also save the profiles as JSON")
+    parser.add_argument("--no-cache", action="store_true", help="Don't read or write the local response cache")
+    parser.add_argument("--refresh", action="store_true", help="Revalidate every cached response with e621 instead of trusting it")
+    add_exclusion_arguments(parser)
+    args = parser.parse_args()
+    tag_filter = tag_filter_from_args(args)
+
+    user_ids = list(args.users)
+    if args.input is not None:
+        user_ids += read_user_ids(args.input)
+    # Keep the order, but only once per user
+    user_ids = list(dict.fromkeys(user_ids))
+    if len(user_ids) == 0:
+        parser.error("give me some users with -u or -i")
+
+    if args.output != "":
+        os.makedirs(args.output, exist_ok=True)
+
+    checkpoint = Checkpoint(args.checkpoint)
+    pending = [user_id for user_id in user_ids if not user_id in checkpoint.done]
+    if len(pending) < len(user_ids):
+        print(f"- {len(user_ids) - len(pending)} users were already done last time, so I'll skip them :3")
+    print(f"- Making the e621 Wrapped of {len(pending)} users, so hang tight :3\n")
+
+    # Build the implications and interests indexes once here, so the workers only have to open them
+    load_tag_implications(wrapped_core.TAG_IMPLICATIONS_FILE)
+    wrapped_core.load_global_interests(wrapped_core.INTERESTS_FILE, tag_filter)
+
+    ###########
+    # Running #
+    ###########
+    e621 = e621Client(e621_wrapped.CREDENTIALS_FILE, cache=None if args.no_cache else ResponseCache(), refresh=args.refresh)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker, initargs=(wrapped_core.INTERESTS_FILE, wrapped_core.TAG_IMPLICATIONS_FILE, tag_filter.exclude_words)) as pool:
+        done, failed = asyncio.run(run_batch(e621, pending, checkpoint, pool, args))
+    elapsed = time.perf_counter() - start
+    checkpoint.close()
+    e621.close()
+
+    ###########
+    # Summary #
+    ###########
+    print(f"\n- Made {done} Wrappeds in {elapsed / 60:.1f} minutes, that's {done / elapsed * 3600:.0f} users per hour B3")
+    if failed > 0:
+        print(f"- {failed} users failed. They're in {args.checkpoint}, and running the batch again will retry them")
@@ -0,0 +1,198 @@
+import json
+import os
+import numpy as np
+from interest_index import load_interests
+from post_scorer import PostScorer
+from profile_store import Profile, load_profile
+from tag_vocabulary import FavoritesMatrix
+
+
+INTERESTS_FILE = "interests.json"
+TAG_IMPLICATIONS_FILE = "data/tag_implications.csv"
+
+MIN_PERCENT = 0.001
+RELATIVE_PRESENCE_CAP = 100
+ALLOWED_FILE_TYPES = ["png", "jpg"]
+# How many least favorite tags and best scored favorite posts are kept, as many as the detailed report plots
+TOP_LIST_SIZE = 25
+
+
+def build_user_profile(fav_matrix, global_interests):
+    """
+        Computes, for each tag in the favorites:
+        presence - How present this tag is in the users favorites
+        relative_presence - How present this tag is in the users favorites compared to the global average
+        enjoyment - The harmonic mean between the capped normalized relative_presence and the presence
+    """
+    vocabulary = fav_matrix.vocabulary
+    presence = fav_matrix.presence()
+    global_ids = global_interests.tag_ids(vocabulary.names)
+    known = global_ids >= 0
+    global_presence = np.full(len(vocabulary), global_interests.min_presence)
+    global_presence[known] = global_interests.presence[global_ids[known]]
+    relative_presence = presence / global_presence
+    enjoyment = 2 / (1 / (np.minimum(RELATIVE_PRESENCE_CAP, relative_presence) / RELATIVE_PRESENCE_CAP) + 1 / presence)
+
+    # Exclude criteria. Tags the average user has were already checked when interests.json was compiled
+    excluded = np.zeros(len(vocabulary), dtype=bool)
+    excluded[known] = global_interests.excluded[global_ids[known]]
+    unknown = np.flatnonzero(~known).tolist()
+    excluded[unknown] = global_interests.tag_filter.mask([vocabulary.names[tag_id] for tag_id in unknown])
+    included = (presence >= MIN_PERCENT) & ~excluded
+
+    user_profile = {}
+    presence, relative_presence, enjoyment = presence.tolist(), relative_presence.tolist(), enjoyment.tolist()
+    for tag_id in np.flatnonzero(included).tolist():
+        user_profile[vocabulary.names[tag_id]] = {
+            "presence": presence[tag_id],
+            "relative_presence": relative_presence[tag_id],
+            "enjoyment": enjoyment[tag_id]
+        }
+    return user_profile
+
+
+def load_global_interests(path=INTERESTS_FILE, tag_filter=None):
+    """
+        The average user profile, from the compiled index next to interests.json. tag_filter decides which
+        tags are left out of profiles (EXCLUDE_WORDS by default)
+    """
+    return load_interests(path, tag_filter=tag_filter)
+
+
+def load_favorites(user_name, full=False, output_dir=""):
+    """
+        The favorites saved by the last run for this user, or an empty matrix if there are none (or full is set)
+    """
+    favorites_file = os.path.join(output_dir, f"{user_name}_favorites.npz")
+    if not full and os.path.exists(favorites_file):
+        return FavoritesMatrix.load(favorites_file)
+    return FavoritesMatrix()
+
+
+def top_indices(values, k):
+    """
+        Indices of the k largest values, largest first. Equal values keep their order, like in a stable sort
+    """
+    if len(values) > k:
+        # Only the values that can make it into the top k get sorted
+        kth = np.partition(values, len(values) - k)[len(values) - k]
+        candidates = np.flatnonzero(values >= kth)
+    else:
+        candidates = np.arange(len(values))
+    return candidates[np.argsort(-values[candidates], kind="stable")][:k]
+
+
+def first_of_each_parent(tags, tag_to_parent):
+    """
+        Drops every (tag, name) that implies the same parent tag as one before it
+    """
+    kept = []
+    included_parents = set()
+    for tag, name in tags:
+        if name in tag_to_parent:
+            if tag_to_parent[name] in included_parents:
+                continue
+            included_parents.add(tag_to_parent[name])
+        kept.append(tag)
+    return kept
+
+
+def build_results(fav_matrix, global_interests, tag_to_parent):
+    """
+        Everything the Wrapped shows, as a dict: the user profile, the favorite tags of each category
+        (best first), and the TOP_LIST_SIZE least favorite tags and best scored favorite posts with their values
+    """
+    user_profile = build_user_profile(fav_matrix, global_interests)
+
+    # Every tag goes to its category in a single pass, in the order of user_profile, so sorting each
+    # category on its own orders it the same way as picking it out of every tag sorted at once
+    favorite_lists = {"general": [], "species": [], "character": [], "artist": []}
+    list_of_category = {"general": "general", "lore": "general", "species": "species", "character": "character", "artist": "artist"}
+    for tag in user_profile:
+        split_tag = tag.split(":")
+        if split_tag[0] in list_of_category:
+            favorite_lists[list_of_category[split_tag[0]]].append((tag, split_tag[1]))
+    for tags in favorite_lists.values():
+        tags.sort(key=lambda tag: user_profile[tag[0]]["enjoyment"], reverse=True)
+
+    favorite_tags = first_of_each_parent(favorite_lists["general"], tag_to_parent)
+    favorite_species = first_of_each_parent(favorite_lists["species"], tag_to_parent)
+    favorite_characters = [tag for tag, _ in favorite_lists["character"]]
+    favorite_artists = [tag for tag, name in favorite_lists["artist"] if not name in ["sound_warning", "conditional_dnp"]]
+
+    # Least favorite tags: how much less present each tag is than for the average user. Only the ones
+    # that can be shown are kept
+    profile_tags = list(user_profile)
+    profile_ids = global_interests.tag_ids(profile_tags)
+    profile_presence = np.fromiter((user_profile[tag]["presence"] for tag in profile_tags), dtype=np.float64, count=len(profile_tags))
+    user_presence = np.zeros(len(global_interests))
+    user_presence[profile_ids[profile_ids >= 0]] = profile_presence[profile_ids >= 0]
+    deltas = global_interests.presence - user_presence
+
+    candidates = np.flatnonzero(global_interests.in_categories(["general", "lore", "species"]) & ~global_interests.excluded)
+    least_favorite_ids = candidates[top_indices(deltas[candidates], TOP_LIST_SIZE)].tolist()
+    least_favorite_tags = [global_interests.vocabulary.names[tag_id] for tag_id in least_favorite_ids]
+    least_favorite_tags_dict = dict(zip(least_favorite_tags, deltas[least_favorite_ids].tolist()))
+
+    # Favorite post
+    favorite_tag_categories = [favorite_tags, favorite_species, favorite_characters, favorite_artists]
+    weights = [1.0, 1.0, 1.0, 1.0]
+    for idx, favorites in enumerate(favorite_tag_categories):
+        weights[idx] *= 1.0 / user_profile[favorites[0]]["enjoyment"]
+
+    scorer = PostScorer(user_profile, weights, favorite_tag_categories, fav_matrix.vocabulary)
+    scores = scorer.score_matrix(fav_matrix)
+    allowed = np.flatnonzero([file_ext in ALLOWED_FILE_TYPES for file_ext in fav_matrix.file_exts])
+    best_rows = allowed[top_indices(scores[allowed], TOP_LIST_SIZE)].tolist()
+    post_by_scores = [fav_matrix.post_ids[row] for row in best_rows]
+    post_scores = {fav_matrix.post_ids[row]: score for row, score in zip(best_rows, scores[best_rows].tolist())}
+
+    return {
+        "user_profile": user_profile,
+        "favorite_tags": favorite_tags,
+        "favorite_species": favorite_species,
+        "favorite_characters": favorite_characters,
+        "favorite_artists": favorite_artists,
+        "least_favorite_tags": least_favorite_tags,
+        "least_favorite_tags_dict": least_favorite_tags_dict,
+        "weights": weights,
+        "post_scores": post_scores,
+        "post_by_scores": post_by_scores
+    }
+
+
+def make_profile(results, fav_ids):
+    """
+        The part of the results the recommender needs
+    """
+    favorite_tag_categories = [results["favorite_tags"], results["favorite_species"], results["favorite_characters"], results["favorite_artists"]]
+    return Profile(results["user_profile"], results["weights"], favorite_tag_categories, fav_ids)
+
+
+def keep_recommender_state(profile, user_name, output_dir=""):
+    """
+        Copies what the recommender keeps in the user's saved profile (their set and the posts it already
+        looked at) to profile, so a new Wrapped doesn't make it forget them
+    """
+    for path in [os.path.join(output_dir, f"{user_name}_profile.npz"), os.path.join(output_dir, f"{user_name}_profile.json")]:
+        if os.path.exists(path):
+            saved_profile = load_profile(path)
+            profile.set_id = saved_profile.set_id
+            profile.set_posts = saved_profile.set_posts
+            profile.seen_posts = saved_profile.seen_posts
+            saved_profile.close()
+            break
+    return profile
+
+
+def save_profile(results, fav_ids, user_name, as_json=False, output_dir=""):
+    """
+        Saves what the recommender needs as {user_name}_profile.npz (and .json if as_json is set), keeping
+        the recommender's state from the last one. Returns the profile
+    """
+    saved_profile = keep_recommender_state(make_profile(results, fav_ids), user_name, output_dir)
+    saved_profile.save(os.path.join(output_dir, f"{user_name}_profile.npz"))
+    if as_json:
+        with open(os.path.join(output_dir, f"{user_name}_profile.json"), "w") as f:
+            json.dump(saved_profile.to_json(), f, indent=4)
+    return saved_profile
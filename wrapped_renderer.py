@@ -0,0 +1,193 @@
+from collections import OrderedDict
+import os
+import threading
+from PIL import Image, ImageDraw, ImageFont
+
+
+TEMPLATE_FILE = "template.png"
+FONTS_DIR = "fonts/liberation-fonts-ttf-2.1.5"
+# How many thumbnails (post and side) are kept in memory
+THUMBNAIL_CACHE_SIZE = 256
+
+WRAPPED_SIZE = (1080, 1080)
+FAV_POST_POSITION = (582, 608)
+AVATAR_POSITION = (30, 13)
+USER_NAME_CENTER = (470, 65)
+POST_ID_CENTER = (1040, 805)
+# Favorite tags, species, artists and characters
+BOUNDING_BOXES = [
+    [(63, 451, 463, 541), (66, 556, 256, 626), (267, 556, 457, 626), (66, 639, 256, 709), (267, 639, 457, 709)],
+    [(63, 801, 463, 891), (66, 906, 256, 976), (267, 906, 457, 976)],
+    [(624, 111, 1024, 201), (627, 216, 817, 286), (828, 216, 1018, 285)],
+    [(624, 387, 1024, 477), (627, 492, 817, 562), (828, 492, 1018, 562)],
+]
+
+
+class ThumbnailCache():
+    """
+        LRU cache of the cropped and resized images returned by get_post_thumb, keyed by post and side
+    """
+    def __init__(self, max_size=THUMBNAIL_CACHE_SIZE):
+        self.max_size = max_size
+        self.images = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, e621, post, side, cancelled=None):
+        """
+            Like e621.get_post_thumb, post is either its id or the post itself
+        """
+        key = (post["id"] if isinstance(post, dict) else post, side)
+        with self.lock:
+            if key in self.images:
+                self.images.move_to_end(key)
+                return self.images[key]
+
+        img = e621.get_post_thumb(post, side, cancelled)
+        # get_post_thumb returns [] when it fails, which shouldn't stick around
+        if isinstance(img, Image.Image):
+            with self.lock:
+                self.images[key] = img
+                while len(self.images) > self.max_size:
+                    self.images.popitem(last=False)
+        return img
+
+
+class WrappedRenderer():
+    """
+        Draws Wrappeds. The template and every font are loaded once and reused by every render, so
+        making many Wrappeds in the same process only pays for the drawing
+    """
+    def __init__(self, template_path=TEMPLATE_FILE, fonts_dir=FONTS_DIR, thumbnails=None):
+        self.fonts_dir = fonts_dir
+        self.fonts = {}
+        self.template = Image.open(template_path).convert("RGBA")
+        # Everything under the template is transparent, so this is the static layer every Wrapped starts from
+        self.background = Image.new("RGBA", WRAPPED_SIZE)
+        self.background.paste(self.template, (0, 0), self.template)
+        self.thumbnails = thumbnails if thumbnails is not None else ThumbnailCache()
+
+    def font(self, name, size):
+        """
+            The LiberationSans font with that style (e.g. Bold) and size, loaded the first time it's asked for
+        """
+        key = (name, size)
+        if not key in self.fonts:
+            self.fonts[key] = ImageFont.truetype(os.path.join(self.fonts_dir, f"LiberationSans-{name}.ttf"), size=size)
+        return self.fonts[key]
+
+    def draw_favorite(self, draw, tag_name, user_profile, bb, first):
+        """
+            Given a bounding box, writes the name of the tag, its presence, and its relative presence
+        """
+        font = self.font("Bold", 36 if first else 16)
+        bold_font = self.font("BoldItalic", 26 if first else 14)
+
+        text = tag_name.split(":")[1].replace("_", " ").capitalize()
+        line_start_pos = 0
+        for pos in range(len(text)):
+            if text[pos] != " ":
+                continue
+
+            if pos - line_start_pos + 1 > 10:
+                text = text[:pos] + '\n' + text[pos:]
+                line_start_pos = pos + 1
+
+        if len(text) > 32:
+            text = text[:32] + "..."
+
+        x = int((bb[0] + bb[2]) / 2)
+        y = int((bb[1] + bb[3]) / 2)
+        draw.multiline_text(
+            (x, y + 8),
+            text=text,
+            font=font,
+            fill=(255, 255, 255),
+            anchor="mm",
+            align="center"
+        )
+
+        h = (bb[3] - bb[1]) / 2
+        draw.text(
+            (bb[0] + h, bb[1] + 8),
+            text=f"{user_profile[tag_name]['presence'] * 100:.1f}%",
+            font=bold_font,
+            fill=(38, 154, 255),
+            anchor="mt",
+            align="center"
+        )
+        draw.text(
+            (bb[2] - h, bb[1] + 8),
+            text=f"{min(999.9, user_profile[tag_name]['relative_presence']):.1f}x",
+            font=bold_font,
+            fill=(252, 191, 49),
+            anchor="mt",
+            align="center"
+        )
+
+    def draw_post_id(self, wrapped, post_id, font):
+        """
+            Writes the ID of the favorite post vertically along the right edge of its picture
+        """
+        text = f"ID {post_id}"
+        # Drawn on a canvas just big enough for the text, centered on a whole pixel so that rotating it
+        # is exact
+        left, top, right, bottom = font.getbbox(text, anchor="mm")
+        half_w = max(-left, right) + 2
+        half_h = max(-top, bottom) + 2
+        id_img = Image.new("RGBA", (2 * half_w, 2 * half_h))
+        ImageDraw.Draw(id_img).text(
+            (half_w, half_h),
+            text=text,
+            font=font,
+            fill=(255, 255, 255),
+            anchor="mm",
+            align="center"
+        )
+        id_img = id_img.transpose(Image.Transpose.ROTATE_270)
+        wrapped.paste(id_img, (POST_ID_CENTER[0] - half_h, POST_ID_CENTER[1] - half_w), id_img)
+
+    def render(self, results, user_name, fav_post, user_pfp, fav_post_id=None):
+        """
+            Returns the Wrapped as an image. fav_post and user_pfp may be None if they couldn't be downloaded.
+            fav_post_id is the post fav_post is, the best scored one by default
+        """
+        user_profile = results["user_profile"]
+        post_by_scores = results["post_by_scores"]
+
+        if fav_post is None and user_pfp is None:
+            wrapped = self.background.copy()
+        else:
+            wrapped = Image.new("RGBA", WRAPPED_SIZE)
+            for img, position in [(fav_post, FAV_POST_POSITION), (user_pfp, AVATAR_POSITION)]:
+                if img is None:
+                    continue
+                try:
+                    wrapped.paste(img, position)
+                except:
+                    pass
+            wrapped.paste(self.template, (0, 0), self.template)
+
+        draw = ImageDraw.Draw(wrapped)
+        favorites = [results["favorite_tags"], results["favorite_species"], results["favorite_artists"], results["favorite_characters"]]
+        for f_idx, favorite in enumerate(favorites):
+            for b_idx, bb in enumerate(BOUNDING_BOXES[f_idx]):
+                self.draw_favorite(draw, favorite[b_idx], user_profile, bb, b_idx == 0)
+
+        fontsize = 36
+        if len(user_name) > 11:
+            fontsize = 24
+        if len(user_name) > 18:
+            fontsize=12
+
+        font = self.font("BoldItalic", fontsize)
+        draw.text(
+            USER_NAME_CENTER,
+            text=user_name,
+            font=font,
+            fill=(255, 255, 255),
+            anchor="mm",
+            align="center"
+        )
+
+        self.draw_post_id(wrapped, fav_post_id if fav_post_id is not None else post_by_scores[0], font)
+        return wrapped
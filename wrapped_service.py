@@ -0,0 +1,274 @@
+from argparse import ArgumentParser, Namespace
+import asyncio
+from collections import OrderedDict
+from io import BytesIO
+import json
+import os
+import re
+import time
+from urllib.parse import parse_qs
+from e621_client import AsyncE621Client, e621Client
+from e621_recommendation_engine import recommend_posts
+import numpy as np
+from profile_store import Profile
+from response_cache import ResponseCache
+from tag_filters import TagFilter, add_exclusion_arguments, tag_filter_from_args
+from tag_implications import load_tag_implications
+import e621_wrapped
+import wrapped_core
+
+
+SERVICE_DIR = "service"
+HOST = "127.0.0.1"
+PORT = 8621
+# How long a user's results are reused before their favorites are checked again. The new favorites are
+# always asked of e621 then, even if the response cache has them for longer
+RESULTS_TTL = 10 * 60
+MAX_CACHED_USERS = 64
+# Each page of recommendations is a request to e621, so one request to the service can only ask for a few
+MAX_RECOMMENDATION_PAGES = 10
+
+ROUTES = [
+    (re.compile(r"^/users/(\d+)/wrapped\.png$"), "wrapped"),
+    (re.compile(r"^/users/(\d+)/detailed\.png$"), "detailed"),
+    (re.compile(r"^/users/(\d+)/recommendations$"), "recommendations"),
+]
+
+
+class Coalescer():
+    """
+        Runs at most one computation per key at a time. Whoever asks for a key that's already being
+        computed waits for that same computation instead of starting another one
+    """
+    def __init__(self):
+        self.running = {}
+
+    async def run(self, key, compute):
+        if not key in self.running:
+            task = asyncio.ensure_future(compute())
+            self.running[key] = task
+            task.add_done_callback(lambda _: self.running.pop(key, None))
+        # A client that disconnects only stops waiting, the others still get the result
+        return await asyncio.shield(self.running[key])
+
+
+class WrappedService():
+    """
+        Everything a request needs that's slow to load (the average user profile, the implication index,
+        fonts, the template and the client with its cache) is loaded once, when the service starts.
+        Results are kept for RESULTS_TTL seconds, so the Wrapped, the detailed report and the
+        recommendations of a user all come from the same favorites. The posts recommendations look at are
+        added to the user's profile, so later requests skip them
+    """
+    def __init__(self, e621, data_dir=SERVICE_DIR, pages=100, interests_file=wrapped_core.INTERESTS_FILE, tag_implications_file=wrapped_core.TAG_IMPLICATIONS_FILE, results_ttl=RESULTS_TTL, tag_filter=None):
+        os.makedirs(data_dir, exist_ok=True)
+        self.e621 = e621
+        self.e621_async = AsyncE621Client(e621)
+        self.data_dir = data_dir
+        self.pages = pages
+        self.results_ttl = results_ttl
+        self.tag_filter = tag_filter if tag_filter is not None else TagFilter()
+        self.global_interests = wrapped_core.load_global_interests(interests_file, self.tag_filter)
+        self.tag_to_parent = load_tag_implications(tag_implications_file)
+        self.renderer = e621_wrapped.get_renderer()
+        # It draws one detailed report at a time
+        self.detailed_renderer = e621_wrapped.get_detailed_renderer()
+        self.users = OrderedDict()
+        self.coalescer = Coalescer()
+        # Profiles are saved one at a time
+        self.profile_lock = asyncio.Lock()
+
+    async def get_user(self, user_id):
+        """
+            The results of a user, computed again once they are older than results_ttl
+        """
+        if user_id in self.users and time.monotonic() - self.users[user_id]["time"] < self.results_ttl:
+            self.users.move_to_end(user_id)
+            return self.users[user_id]
+
+        user = await self.coalescer.run(("user", user_id), lambda: self.build_user(user_id))
+        self.users[user_id] = user
+        self.users.move_to_end(user_id)
+        while len(self.users) > MAX_CACHED_USERS:
+            self.users.popitem(last=False)
+        return user
+
+    async def build_user(self, user_id):
+        user_data = await self.e621_async.get_user(user_id)
+        if user_data is None:
+            raise LookupError(f"There's no user {user_id}")
+        if not isinstance(user_data, dict):
+            raise ConnectionError(f"Couldn't get user {user_id}")
+        user_name = user_data["name"]
+
+        fav_matrix, _ = await e621_wrapped.update_favorites(self.e621, user_id, user_name, self.pages, output_dir=self.data_dir, quiet=True, favorite_count=user_data.get("favorite_count"), refresh=True)
+        if fav_matrix is None:
+            raise ConnectionError(f"Couldn't get the favorites of user {user_id}")
+        results = await asyncio.to_thread(wrapped_core.build_results, fav_matrix, self.global_interests, self.tag_to_parent)
+        async with self.profile_lock:
+            profile = await asyncio.to_thread(wrapped_core.save_profile, results, fav_matrix.post_ids, user_name, output_dir=self.data_dir)
+        return {"time": time.monotonic(), "user_data": user_data, "results": results, "profile": profile, "images": {}}
+
+    async def wrapped(self, user_id):
+        """
+            The Wrapped of a user as PNG bytes
+        """
+        user = await self.get_user(user_id)
+        if not "wrapped" in user["images"]:
+            user["images"]["wrapped"] = await self.coalescer.run(("wrapped", user_id, user["time"]), lambda: self.render_wrapped(user))
+        return user["images"]["wrapped"]
+
+    async def render_wrapped(self, user):
+        fav_post, user_pfp, fav_post_id = await asyncio.to_thread(e621_wrapped.get_thumbnails, self.e621, user["results"], user["user_data"]["avatar_id"], self.renderer.thumbnails)
+
+        def render():
+            body = BytesIO()
+            self.renderer.render(user["results"], user["user_data"]["name"], fav_post, user_pfp, fav_post_id).save(body, format="PNG")
+            return body.getvalue()
+        return await asyncio.to_thread(render)
+
+    async def detailed(self, user_id):
+        """
+            The detailed report of a user as PNG bytes
+        """
+        user = await self.get_user(user_id)
+        if not "detailed" in user["images"]:
+            user["images"]["detailed"] = await self.coalescer.run(("detailed", user_id, user["time"]), lambda: asyncio.to_thread(self.plot_detailed, user))
+        return user["images"]["detailed"]
+
+    def plot_detailed(self, user):
+        path = e621_wrapped.plot_detailed(user["results"], user["user_data"]["name"], self.data_dir, self.detailed_renderer)
+        with open(path, "rb") as f:
+            return f.read()
+
+    async def recommendations(self, user_id, pages=1, score=6, min_upvotes=100, extra_tags=()):
+        """
+            Scores pages of random posts against the user's profile. Returns the ones that pass, best first
+        """
+        if not 1 <= pages <= MAX_RECOMMENDATION_PAGES:
+            raise ValueError(f"pages has to be between 1 and {MAX_RECOMMENDATION_PAGES}")
+        user = await self.get_user(user_id)
+        args = Namespace(pages=pages, score=score, min_upvotes=min_upvotes, extra_tags=extra_tags, add_to_set="n", strategy="adaptive")
+
+        async def recommend():
+            # recommend_posts replaces the seen posts of the profile it's given, so it gets a copy of its own,
+            # and what it looked at is added to the user's profile afterwards
+            profile = user["profile"]
+            looked_at = Profile(profile.user_profile, profile.weights, profile.favorites, profile.fav_ids, seen_posts=profile.seen_posts)
+            found = []
+            await recommend_posts(self.e621_async, looked_at, args, set(), found, quiet=True, tag_filter=self.tag_filter)
+            async with self.profile_lock:
+                # The results may have been computed again in the meantime
+                profile = self.users.get(user_id, user)["profile"]
+                profile.seen_posts = np.union1d(profile.seen_posts, looked_at.seen_posts)
+                await asyncio.to_thread(profile.save, os.path.join(self.data_dir, f"{user['user_data']['name']}_profile.npz"))
+            found.sort(key=lambda recommendation: recommendation[1], reverse=True)
+            return [{"id": post_id, "score": score, "best_tags": best_tags} for post_id, score, best_tags in found]
+        return await self.coalescer.run(("recommendations", user_id, pages, score, min_upvotes, tuple(extra_tags)), recommend)
+
+
+def create_app(service=None, **service_options):
+    """
+        Returns the ASGI app. Without a service, one is started (with service_options) when the server
+        starts, or on the first request for servers that don't send lifespan events
+    """
+    state = {"service": service}
+
+    def get_service():
+        if state["service"] is None:
+            e621 = e621Client(e621_wrapped.CREDENTIALS_FILE, cache=ResponseCache())
+            state["service"] = WrappedService(e621, **service_options)
+        return state["service"]
+
+    async def respond(send, status, body, content_type):
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode("ascii"))]
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def respond_json(send, status, data):
+        await respond(send, status, json.dumps(data).encode("utf-8"), b"application/json")
+
+    async def app(scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await asyncio.to_thread(get_service)
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+
+        if scope["method"] != "GET":
+            await respond_json(send, 405, {"error": "Only GET is supported"})
+            return
+        for pattern, endpoint in ROUTES:
+            match = pattern.match(scope["path"])
+            if match is not None:
+                break
+        else:
+            await respond_json(send, 404, {"error": "Not found"})
+            return
+
+        service = state["service"] if state["service"] is not None else await asyncio.to_thread(get_service)
+        user_id = int(match.group(1))
+        try:
+            if endpoint == "wrapped":
+                await respond(send, 200, await service.wrapped(user_id), b"image/png")
+            elif endpoint == "detailed":
+                await respond(send, 200, await service.detailed(user_id), b"image/png")
+            else:
+                query = parse_qs(scope["query_string"].decode("utf-8"))
+                recommendations = await service.recommendations(
+                    user_id,
+                    pages=int(query.get("pages", ["1"])[0]),
+                    score=float(query.get("score", ["6"])[0]),
+                    min_upvotes=int(query.get("min_upvotes", ["100"])[0]),
+                    extra_tags=query.get("tags", [""])[0].split()
+                )
+                await respond_json(send, 200, recommendations)
+        except LookupError as e:
+            await respond_json(send, 404, {"error": str(e)})
+        except ValueError as e:
+            await respond_json(send, 400, {"error": str(e)})
+        except ConnectionError as e:
+            await respond_json(send, 502, {"error": str(e)})
+        except Exception as e:
+            await respond_json(send, 500, {"error": repr(e)})
+
+    return app
+
+
+# For ASGI servers, e.g. uvicorn wrapped_service:app
+app = create_app()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        prog="E621 Wrapped service",
+        description="Serves Wrappeds, detailed reports and recommendations over HTTP"
+    )
+    parser.add_argument("--host", default=HOST, help="The address to listen on")
+    parser.add_argument("--port", default=PORT, type=int, help="The port to listen on")
+    parser.add_argument("-p", "--pages", default=100, type=int, help="The max amount of pages to look for favorites in, for each user")
+    parser.add_argument("-o", "--output", default=SERVICE_DIR, help="The folder to keep favorites, profiles and detailed reports in")
+    parser.add_argument("--no-cache", action="store_true", help="Don't read or write the local response cache")
+    parser.add_argument("--refresh", action="store_true", help="Revalidate every cached response with e621 instead of trusting it")
+    add_exclusion_arguments(parser)
+    args = parser.parse_args()
+
+    try:
+        import uvicorn
+    except ImportError:
+        print("- The service needs an ASGI server. Install uvicorn (pip install uvicorn) or run wrapped_service:app with any other one :3")
+        exit(0)
+
+    e621 = e621Client(e621_wrapped.CREDENTIALS_FILE, cache=None if args.no_cache else ResponseCache(), refresh=args.refresh)
+    service = WrappedService(e621, data_dir=args.output, pages=args.pages, tag_filter=tag_filter_from_args(args))
+    print(f"- Everything's loaded! Ask me for Wrappeds at http://{args.host}:{args.port}/users/<user_id>/wrapped.png :3")
+    uvicorn.run(create_app(service), host=args.host, port=args.port)